@@ -1,39 +1,87 @@
+import time
+_STARTUP_T0 = time.perf_counter()
+
 import os
 from flask import Flask, request, render_template, send_from_directory, redirect, url_for, jsonify
-import win32print
-import win32api
-import win32ui
-import win32con
 import subprocess
 from datetime import datetime
 import threading
+import multiprocessing
 import sys
-import pystray
-from PIL import Image, ImageDraw, ImageWin
 import socket
-import winreg
-import time
+import importlib
+import importlib.util
 
-from PIL import Image as PILImage
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.lib.utils import ImageReader
 import io
+import abc
+import glob
+import base64
 import tempfile
+from contextlib import contextmanager
+import json
+import uuid
+from collections import deque
+
+# 模块首次使用时的导入耗时及启动各阶段时间点，用于 --profile-startup 报告
+IMPORT_TIMES = {}
+STARTUP_MARKS = {}
+_server_ready = threading.Event()
+
+def mark_startup(name):
+    STARTUP_MARKS.setdefault(name, time.perf_counter() - _STARTUP_T0)
+
+class LazyModule:
+    # 延迟导入：首次访问属性时才真正加载模块，缩短服务启动时间
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            t0 = time.perf_counter()
+            module = importlib.import_module(self._name)
+            IMPORT_TIMES.setdefault(self._name, time.perf_counter() - t0)
+            self._module = module
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
 
-try:
-    import fitz
-    PYMUPDF_AVAILABLE = True
-except ImportError:
-    PYMUPDF_AVAILABLE = False
+def module_available(name):
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+Image = PILImage = LazyModule('PIL.Image')
+ImageDraw = LazyModule('PIL.ImageDraw')
+ImageWin = LazyModule('PIL.ImageWin')
+canvas = LazyModule('reportlab.pdfgen.canvas')
+# 生成的 PDF 中图片数据以二进制写入，不做 ASCII85 编码（会使图片数据增大 25%）；
+# reportlab 在首次导入时读取 RL_ 开头的环境变量，在这里设置即对整个进程（含转换子进程）生效，不必提前导入 reportlab
+os.environ.setdefault('RL_useA85', '0')
+# reportlab.lib.pagesizes.A4，单位为点（1/72 英寸）
+A4 = (210 * 72 / 25.4, 297 * 72 / 25.4)
+
+PYMUPDF_AVAILABLE = module_available('fitz')
+fitz = LazyModule('fitz')
+if not PYMUPDF_AVAILABLE:
     print("警告: PyMuPDF未安装，静默打印功能受限。请运行: pip install PyMuPDF")
 
-try:
-    import comtypes.client
-    import pythoncom
-    OFFICE_AVAILABLE = True
-except ImportError:
-    OFFICE_AVAILABLE = False
+OFFICE_AVAILABLE = module_available('comtypes') and module_available('pythoncom')
+comtypes_client = LazyModule('comtypes.client')
+pythoncom = LazyModule('pythoncom')
+
+WIN32_AVAILABLE = module_available('win32print')
+win32print = LazyModule('win32print')
+win32api = LazyModule('win32api')
+win32ui = LazyModule('win32ui')
+win32con = LazyModule('win32con')
+win32gui = LazyModule('win32gui')
+winreg = LazyModule('winreg')
+
+TRAY_AVAILABLE = module_available('pystray')
+pystray = LazyModule('pystray')
 
 def clean_old_files(folder=None, expire_seconds=3600):
     if folder is None:
@@ -61,6 +109,8 @@ def get_local_ip():
         return '127.0.0.1'
 
 def set_autostart(enable=True):
+    if not WIN32_AVAILABLE:
+        return
     exe_path = sys.executable
     key = r'Software\\Microsoft\\Windows\\CurrentVersion\\Run'
     name = 'PrintServerApp'
@@ -74,6 +124,8 @@ def set_autostart(enable=True):
                 pass
 
 def get_autostart():
+    if not WIN32_AVAILABLE:
+        return False
     key = r'Software\\Microsoft\\Windows\\CurrentVersion\\Run'
     name = 'PrintServerApp'
     try:
@@ -96,71 +148,338 @@ def create_simple_printer_icon():
     
     return image
 
-def silent_print_pdf(pdf_path, printer_name, copies=1, duplex=1):
+def get_printer_devmode(hprinter, printer_name, copies=1, duplex=1):
+    # 优先让驱动处理份数和双面：渲染一次，由打印机/驱动复制，避免每份重复栅格化和传输
+    devmode = win32print.GetPrinter(hprinter, 2)['pDevMode']
+    if devmode is None:
+        return None, False
+
+    driver_copies = False
+    if copies > 1:
+        try:
+            port = win32print.GetPrinter(hprinter, 2)['pPortName']
+            max_copies = win32print.DeviceCapabilities(printer_name, port, win32con.DC_COPIES, devmode)
+            if max_copies >= copies:
+                devmode.Copies = copies
+                devmode.Collate = 1
+                devmode.Fields |= win32con.DM_COPIES | win32con.DM_COLLATE
+                driver_copies = True
+        except Exception:
+            pass
+
+    if duplex in (1, 2, 3):
+        devmode.Duplex = duplex
+        devmode.Fields |= win32con.DM_DUPLEX
+
+    return devmode, driver_copies
+
+def create_printer_dc(printer_name, devmode=None):
+    if devmode is None:
+        hdc = win32ui.CreateDC()
+        hdc.CreatePrinterDC(printer_name)
+        return hdc
+    return win32ui.CreateDCFromHandle(win32gui.CreateDC('WINSPOOL', printer_name, devmode))
+
+def get_device_geometry(hdc):
+    return {
+        'area': (hdc.GetDeviceCaps(win32con.HORZRES), hdc.GetDeviceCaps(win32con.VERTRES)),
+        'margins': (hdc.GetDeviceCaps(win32con.PHYSICALOFFSETX), hdc.GetDeviceCaps(win32con.PHYSICALOFFSETY)),
+        'dpi': (hdc.GetDeviceCaps(win32con.LOGPIXELSX), hdc.GetDeviceCaps(win32con.LOGPIXELSY)),
+    }
+
+def rasterize_page(page, device):
+    area_w, area_h = device['area']
+    dpi_x, dpi_y = device['dpi']
+    margin_x, margin_y = device['margins']
+
+    # 以英寸为单位计算适配可打印区域的缩放，直接按打印机分辨率生成最终尺寸的位图，不再二次缩放
+    page_w_in = page.rect.width / 72.0
+    page_h_in = page.rect.height / 72.0
+    fit = min(area_w / dpi_x / page_w_in, area_h / dpi_y / page_h_in) * 0.9
+
+    scaled_width = int(page_w_in * fit * dpi_x)
+    scaled_height = int(page_h_in * fit * dpi_y)
+    x = (area_w - scaled_width) // 2 + margin_x
+    y = (area_h - scaled_height) // 2 + margin_y
+
+    render_dpi_x = min(dpi_x, RENDER_MAX_DPI) if RENDER_MAX_DPI else dpi_x
+    render_dpi_y = min(dpi_y, RENDER_MAX_DPI) if RENDER_MAX_DPI else dpi_y
+    mat = fitz.Matrix(fit * render_dpi_x / 72.0, fit * render_dpi_y / 72.0)
+    pix = page.get_pixmap(matrix=mat, colorspace=fitz.csRGB, alpha=False)
+
+    return (pix.width, pix.height, pix.stride, pix.samples), (x, y, x + scaled_width, y + scaled_height)
+
+def make_dib(raster):
+    width, height, stride, samples = raster
+    img = PILImage.frombuffer('RGB', (width, height), samples, 'raw', 'RGB', stride, 1)
+    # 渲染分辨率被限制时由 GDI 在绘制时放大到目标矩形
+    return ImageWin.Dib(img)
+
+def open_pdf(pdf_source):
+    # pdf_source 可以是文件路径，也可以是内存中的 PDF 数据
+    if isinstance(pdf_source, (bytes, bytearray)):
+        return fitz.open(stream=pdf_source, filetype='pdf')
+    return fitz.open(pdf_source)
+
+def get_pdf_source_key(pdf_source):
+    if isinstance(pdf_source, (bytes, bytearray)):
+        return uuid.uuid4().hex
+    return (pdf_source, os.path.getmtime(pdf_source))
+
+_render_docs = {}
+
+def _render_page_worker(doc_key, pdf_path, page_num, device, spilled=False):
+    # 在渲染子进程中执行，按 doc_key 缓存最近使用的几个文档（LRU），
+    # 多台打印机的任务交替渲染时也不必每页重新解析
+    doc = _render_docs.pop(doc_key, None)
+    if doc is None:
+        if spilled:
+            # 内存 PDF 的临时文件：读入后立即关闭句柄，主进程打印结束即可删除
+            with open(pdf_path, 'rb') as f:
+                doc = open_pdf(f.read())
+        else:
+            doc = open_pdf(pdf_path)
+    _render_docs[doc_key] = doc
+    while len(_render_docs) > RENDER_DOC_CACHE_SIZE:
+        _render_docs.pop(next(iter(_render_docs))).close()
+    return rasterize_page(doc[page_num], device)
+
+_render_executor = None
+_render_executor_lock = threading.Lock()
+# PyMuPDF 不支持多线程并发调用，进程内渲染时需串行
+_fitz_lock = threading.Lock()
+
+def get_render_executor():
+    global _render_executor
+    with _render_executor_lock:
+        if _render_executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            _render_executor = ProcessPoolExecutor(max_workers=RENDER_PROCESSES)
+        return _render_executor
+
+def get_pdf_page_count(pdf_source):
+    with _fitz_lock:
+        with open_pdf(pdf_source) as doc:
+            return len(doc)
+
+@contextmanager
+def spill_pdf_source(pdf_source):
+    # 内存中的 PDF 每个任务只写一次临时文件，渲染进程按路径读取，
+    # 避免每页都把整个文档序列化传给子进程；进程内渲染时不需要
+    if RENDER_PROCESSES <= 0 or not isinstance(pdf_source, (bytes, bytearray)):
+        yield pdf_source, False
+        return
+    fd, pdf_path = tempfile.mkstemp(suffix='.pdf')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(pdf_source)
+        yield pdf_path, True
+    finally:
+        try:
+            os.remove(pdf_path)
+        except OSError:
+            pass
+
+def iter_rendered_pages(pdf_source, page_nums, device, spilled=False):
+    # 生产者/消费者流水线：渲染进程提前准备后续页面，调用方（GDI 线程）只负责绘制和提交；
+    # 在途页面数量不超过 RENDER_PREFETCH_PAGES，长文档内存占用保持有界
+    if RENDER_PROCESSES <= 0:
+        with _fitz_lock:
+            doc = open_pdf(pdf_source)
+        try:
+            for page_num in page_nums:
+                with _fitz_lock:
+                    raster, rect = rasterize_page(doc[page_num], device)
+                yield page_num, make_dib(raster), rect
+        finally:
+            with _fitz_lock:
+                doc.close()
+        return
+
+    executor = get_render_executor()
+    doc_key = get_pdf_source_key(pdf_source)
+    pending = deque()
+    page_iter = iter(page_nums)
+
+    def submit_next():
+        page_num = next(page_iter, None)
+        if page_num is not None:
+            pending.append((page_num, executor.submit(_render_page_worker, doc_key, pdf_source, page_num, device,
+                                                      spilled)))
+
+    try:
+        for _ in range(max(1, RENDER_PREFETCH_PAGES)):
+            submit_next()
+        while pending:
+            page_num, future = pending.popleft()
+            raster, rect = future.result()
+            submit_next()
+            yield page_num, make_dib(raster), rect
+    finally:
+        for _, future in pending:
+            future.cancel()
+        if spilled:
+            # 已开始的渲染仍可能在读取临时文件，等待其结束后才能删除
+            for _, future in pending:
+                if not future.cancelled():
+                    try:
+                        future.result()
+                    except Exception:
+                        pass
+
+def silent_print_pdf(pdf_source, printer_name, copies=1, duplex=1):
     if not PYMUPDF_AVAILABLE:
         raise Exception("PyMuPDF未安装，无法使用静默打印")
     
-    if not os.path.exists(pdf_path):
-        raise Exception(f"PDF文件不存在: {pdf_path}")
+    if not isinstance(pdf_source, (bytes, bytearray)) and not os.path.exists(pdf_source):
+        raise Exception(f"PDF文件不存在: {pdf_source}")
     
     try:
-        pdf_doc = fitz.open(pdf_path)
+        page_count = get_pdf_page_count(pdf_source)
         hprinter = win32print.OpenPrinter(printer_name)
+        hdc = None
         
-        try:
-            printer_info = win32print.GetPrinter(hprinter, 2)
-            hdc = win32ui.CreateDC()
-            hdc.CreatePrinterDC(printer_name)
+        with spill_pdf_source(pdf_source) as (render_source, spilled):
+            try:
+                try:
+                    devmode, driver_copies = get_printer_devmode(hprinter, printer_name, copies, duplex)
+                except Exception:
+                    devmode, driver_copies = None, False
+                hdc = create_printer_dc(printer_name, devmode)
             
-            printable_area = hdc.GetDeviceCaps(win32con.HORZRES), hdc.GetDeviceCaps(win32con.VERTRES)
-            printer_size = hdc.GetDeviceCaps(win32con.PHYSICALWIDTH), hdc.GetDeviceCaps(win32con.PHYSICALHEIGHT)
-            printer_margins = hdc.GetDeviceCaps(win32con.PHYSICALOFFSETX), hdc.GetDeviceCaps(win32con.PHYSICALOFFSETY)
+                device = get_device_geometry(hdc)
             
-            for copy_num in range(copies):
-                hdc.StartDoc("PDF Silent Print")
+                # 驱动支持多份时只提交一次文档；否则每页只渲染一次，缓存后在各份之间复用
+                passes = 1 if driver_copies else copies
+                page_cache = {}
+                cache_bytes = 0
+                job_id = None
+            
+                for copy_num in range(passes):
+                    job_id = hdc.StartDoc("PDF Silent Print")
                 
-                for page_num in range(len(pdf_doc)):
-                    hdc.StartPage()
-                    
-                    page = pdf_doc[page_num]
-                    mat = fitz.Matrix(2.0, 2.0)
-                    pix = page.get_pixmap(matrix=mat)
-                    
-                    img_data = pix.tobytes("ppm")
-                    img = PILImage.open(io.BytesIO(img_data))
-                    
-                    img_width, img_height = img.size
-                    scale_x = printable_area[0] / img_width
-                    scale_y = printable_area[1] / img_height
-                    scale = min(scale_x, scale_y) * 0.9
-                    
-                    scaled_width = int(img_width * scale)
-                    scaled_height = int(img_height * scale)
-                    x = (printable_area[0] - scaled_width) // 2 + printer_margins[0]
-                    y = (printable_area[1] - scaled_height) // 2 + printer_margins[1]
-                    
-                    if scale != 1.0:
-                        img = img.resize((scaled_width, scaled_height), PILImage.Resampling.LANCZOS)
-                    
-                    dib = ImageWin.Dib(img)
-                    dib.draw(hdc.GetHandleOutput(), (x, y, x + scaled_width, y + scaled_height))
-                    
-                    hdc.EndPage()
+                    missing = [n for n in range(page_count) if n not in page_cache]
+                    rendered = iter_rendered_pages(render_source, missing, device, spilled)
+                    try:
+                        for page_num in range(page_count):
+                            hdc.StartPage()
+                        
+                            if page_num in page_cache:
+                                dib, rect = page_cache[page_num]
+                            else:
+                                _, dib, rect = next(rendered)
+                                page_bytes = (rect[2] - rect[0]) * (rect[3] - rect[1]) * 3
+                                if copy_num + 1 < passes and cache_bytes + page_bytes <= RENDER_CACHE_MAX_BYTES:
+                                    page_cache[page_num] = (dib, rect)
+                                    cache_bytes += page_bytes
+                        
+                            dib.draw(hdc.GetHandleOutput(), rect)
+                        
+                            hdc.EndPage()
+                    finally:
+                        rendered.close()
                 
-                hdc.EndDoc()
+                    hdc.EndDoc()
             
-            return True
+                # 返回最后一份的后台打印任务 ID
+                return job_id
             
+            finally:
+                try:
+                    hdc.DeleteDC()
+                except:
+                    pass
+                win32print.ClosePrinter(hprinter)
+            
+    except Exception as e:
+        raise Exception(f"静默打印失败: {str(e)}")
+
+def fit_image_to_device(frame, device, monochrome='none'):
+    # 图片只重采样一次，直接得到打印机原生分辨率下的最终位图，GDI 绘制时不再缩放。
+    # 图片带 DPI 信息时按实际尺寸打印（超出可打印区域则缩小），否则铺满可打印区域
+    from PIL import ImageOps
+    area_w, area_h = device['area']
+    dpi_x, dpi_y = device['dpi']
+    margin_x, margin_y = device['margins']
+
+    # 目标尺寸按 EXIF 方向校正后的尺寸计算，旋转 90/270 度的照片保持纵向
+    swapped = exif_swaps_axes(frame)
+    frame_w, frame_h = oriented_size(frame)
+    src_dpi = frame.info.get('dpi')
+    if src_dpi and src_dpi[0] > 1 and src_dpi[1] > 1:
+        src_dpi_x, src_dpi_y = (src_dpi[1], src_dpi[0]) if swapped else src_dpi
+        natural = (frame_w / src_dpi_x * dpi_x, frame_h / src_dpi_y * dpi_y)
+        ratio = min(area_w / natural[0], area_h / natural[1], 1.0)
+        width, height = max(1, int(natural[0] * ratio)), max(1, int(natural[1] * ratio))
+    else:
+        ratio = min(area_w / frame_w, area_h / frame_h)
+        width, height = max(1, int(frame_w * ratio)), max(1, int(frame_h * ratio))
+
+    if frame.format == 'JPEG' and (frame_w > width * 2 or frame_h > height * 2):
+        frame.draft('RGB' if frame.mode == 'RGB' else 'L', (height, width) if swapped else (width, height))
+    img = ImageOps.exif_transpose(frame)
+    if monochrome != 'none' and img.mode != '1':
+        img = img.convert('L')
+    elif img.mode not in ('1', 'L', 'RGB'):
+        img = img.convert('L' if img.mode in ('LA', 'I', 'I;16', 'F') else 'RGB')
+
+    if img.size != (width, height):
+        if img.mode == '1':
+            # 黑白图（条码、标签）用最近邻缩放，保持边缘锐利
+            img = img.resize((width, height), PILImage.NEAREST)
+        else:
+            img = img.resize((width, height), PILImage.LANCZOS, reducing_gap=3.0)
+
+    # 热敏打印机只有黑白两色：threshold 适合条码和文字，dither 适合照片和灰度图
+    if monochrome == 'threshold' and img.mode != '1':
+        img = img.point(lambda v: 255 if v >= 128 else 0).convert('1', dither=PILImage.NONE)
+    elif monochrome == 'dither' and img.mode != '1':
+        img = img.convert('1')
+
+    x = (area_w - width) // 2 + margin_x
+    y = (area_h - height) // 2 + margin_y
+    return img, (x, y, x + width, y + height)
+
+def silent_print_image(image_path, printer_name, copies=1, duplex=1, monochrome='none'):
+    # 图片直接绘制到打印机 DC，不经过 PDF 转换和 PyMuPDF 栅格化；多页 TIFF/GIF 每帧一页
+    if not os.path.exists(image_path):
+        raise Exception(f"图片文件不存在: {image_path}")
+
+    try:
+        hprinter = win32print.OpenPrinter(printer_name)
+        hdc = None
+
+        try:
+            try:
+                devmode, driver_copies = get_printer_devmode(hprinter, printer_name, copies, duplex)
+            except Exception:
+                devmode, driver_copies = None, False
+            hdc = create_printer_dc(printer_name, devmode)
+
+            device = get_device_geometry(hdc)
+
+            passes = 1 if driver_copies else copies
+            job_id = None
+            for _ in range(passes):
+                job_id = hdc.StartDoc("Image Silent Print")
+                for frame in iter_image_frames(image_path):
+                    img, rect = fit_image_to_device(frame, device, monochrome)
+                    hdc.StartPage()
+                    ImageWin.Dib(img).draw(hdc.GetHandleOutput(), rect)
+                    hdc.EndPage()
+                hdc.EndDoc()
+
+            return job_id
+
         finally:
             try:
                 hdc.DeleteDC()
             except:
                 pass
             win32print.ClosePrinter(hprinter)
-            pdf_doc.close()
-            
+
     except Exception as e:
-        raise Exception(f"静默打印失败: {str(e)}")
+        raise Exception(f"图片静默打印失败: {str(e)}")
 
 def fallback_print_pdf(pdf_path, printer_name, copies=1):
     try:
@@ -175,291 +494,956 @@ def fallback_print_pdf(pdf_path, printer_name, copies=1):
     except Exception as e:
         raise Exception(f"备用打印方法失败: {str(e)}")
 
-def convert_image_to_pdf(image_path, output_path, page_size=A4):
+def raw_print_file(source, printer_name, copies=1, doc_name="Raw Print", datatype="RAW"):
+    # 绕过 GDI 栅格化，将文件原样写入打印队列，由打印机自行解释（PDF 直打、ZPL 等）
+    # source 可以是文件路径，也可以是内存中的数据
+    # 返回最后一份的后台打印任务 ID
+    hprinter = win32print.OpenPrinter(printer_name)
     try:
-        img = PILImage.open(image_path)
-        
-        if img.mode == 'RGBA':
-            img = img.convert('RGB')
-        
-        c = canvas.Canvas(output_path, pagesize=page_size)
-        page_width, page_height = page_size
-        
-        img_width, img_height = img.size
-        ratio = min(page_width / img_width, page_height / img_height)
-        
-        scaled_width = img_width * ratio * 0.8
-        scaled_height = img_height * ratio * 0.8
-        x = (page_width - scaled_width) / 2
-        y = (page_height - scaled_height) / 2
-        
-        c.drawImage(ImageReader(img), x, y, width=scaled_width, height=scaled_height)
-        c.save()
+        job_id = None
+        for copy_num in range(copies):
+            job_id = win32print.StartDocPrinter(hprinter, 1, (doc_name, None, datatype))
+            try:
+                win32print.StartPagePrinter(hprinter)
+                if isinstance(source, (bytes, bytearray)):
+                    data = memoryview(source)
+                    for offset in range(0, len(data), RAW_CHUNK_SIZE):
+                        win32print.WritePrinter(hprinter, bytes(data[offset:offset + RAW_CHUNK_SIZE]))
+                else:
+                    with open(source, 'rb') as f:
+                        while True:
+                            chunk = f.read(RAW_CHUNK_SIZE)
+                            if not chunk:
+                                break
+                            win32print.WritePrinter(hprinter, chunk)
+                win32print.EndPagePrinter(hprinter)
+            finally:
+                win32print.EndDocPrinter(hprinter)
+        return job_id
+    finally:
+        win32print.ClosePrinter(hprinter)
+
+_printer_capabilities = {}
+
+def get_printer_capabilities(printer_name, refresh=False):
+    if not refresh and printer_name in _printer_capabilities:
+        return _printer_capabilities[printer_name]
+
+    caps = {'driver': '', 'datatype': '', 'personalities': [], 'pdf_direct': False, 'postscript': False}
+    hprinter = win32print.OpenPrinter(printer_name)
+    try:
+        info = win32print.GetPrinter(hprinter, 2)
+        caps['driver'] = info.get('pDriverName') or ''
+        caps['datatype'] = info.get('pDatatype') or ''
+        try:
+            personalities = win32print.DeviceCapabilities(printer_name, info['pPortName'], win32con.DC_PERSONALITY)
+            caps['personalities'] = [str(p) for p in personalities or []]
+        except Exception:
+            pass
+    finally:
+        win32print.ClosePrinter(hprinter)
+
+    personalities = [p.strip().upper() for p in caps['personalities']]
+    caps['pdf_direct'] = 'PDF' in personalities
+    caps['postscript'] = 'POSTSCRIPT' in personalities or 'PS' in caps['driver'].upper().split()
+    _printer_capabilities[printer_name] = caps
+    return caps
+
+def resolve_print_mode(printer_name):
+    mode = get_printer_setting(printer_name, 'mode', DEFAULT_PRINT_MODE)
+    if mode == 'auto':
+        try:
+            mode = 'vector' if get_printer_capabilities(printer_name)['pdf_direct'] else 'raster'
+        except Exception:
+            mode = 'raster'
+    return mode
+
+def print_pdf_file(pdf_source, printer_name, copies=1, duplex=1):
+    # vector: PDF 原样发送给支持 PDF 直打的打印机，作业大小等于 PDF 大小；raster: GDI 栅格化
+    # 返回 (打印方式, 后台打印任务 ID)
+    mode = resolve_print_mode(printer_name)
+    if mode == 'vector':
+        try:
+            job_id = raw_print_file(pdf_source, printer_name, copies, "PDF Direct Print")
+        except Exception as e:
+            raise Exception(f"PDF直通打印失败: {str(e)}")
+    else:
+        job_id = silent_print_pdf(pdf_source, printer_name, copies, duplex)
+    return mode, job_id
+
+class PrinterBackend(abc.ABC):
+    # 打印后端接口：枚举打印机、查询能力、提交任务、查询打印机及任务状态
+    name = 'base'
+
+    @abc.abstractmethod
+    def enumerate(self):
+        pass
+
+    def capabilities(self, printer_name, refresh=False):
+        return {}
+
+    @abc.abstractmethod
+    def submit(self, source, printer_name, copies=1, duplex=1, raw=False):
+        # source 为文件路径或内存数据；raw=True 表示原样发送（ZPL 等打印机语言）
+        # 返回 {'mode': ..., 'backend_job_id': ...}，backend_job_id 可用于 job_status 查询
+        pass
+
+    def submit_image(self, image_path, printer_name, copies=1, duplex=1, monochrome='none'):
+        # 直接打印图片；不支持的后端在内存中转换为 PDF 后按普通文档提交
+        buffer = io.BytesIO()
+        convert_images_to_pdf([image_path], buffer)
+        return self.submit(buffer.getvalue(), printer_name, copies, duplex)
+
+    @abc.abstractmethod
+    def status(self, printer_name):
+        # 返回 {'status': 'online'|'paused'|'error'|'offline'|'unknown', 'queue_length': ...}
+        pass
+
+    @abc.abstractmethod
+    def job_status(self, printer_name, backend_job_id):
+        # 查询已提交任务在系统打印队列中的状态
+        # 返回 {'state': 'queued'|'printing'|'done'|'error'|'unknown'}，任务已不在队列中且无法确认结果时为 unknown
+        pass
+
+    def wait_for_change(self, timeout):
+        # 等待打印机或任务变化；不支持变化通知的后端按 timeout 轮询，返回 False
+        time.sleep(timeout)
+        return False
+
+# winspool.h: PRINTER_CHANGE_PRINTER | PRINTER_CHANGE_JOB
+PRINTER_CHANGE_PRINTER_AND_JOB = 0x000000FF | 0x0000FF00
+
+class GdiPrinterBackend(PrinterBackend):
+    name = 'gdi'
+
+    def __init__(self):
+        self._change_server = None
+        self._change_handle = None
+
+    def wait_for_change(self, timeout):
+        import win32event
+        if self._change_handle is None:
+            try:
+                self._change_server = win32print.OpenPrinter(None)
+                self._change_handle = win32print.FindFirstPrinterChangeNotification(
+                    self._change_server, PRINTER_CHANGE_PRINTER_AND_JOB, 0, None)
+            except Exception as e:
+                print(f"打印机变化通知不可用，改为轮询: {e}")
+                self._change_handle = False
+        if not self._change_handle:
+            return super().wait_for_change(timeout)
+        result = win32event.WaitForSingleObject(self._change_handle, int(timeout * 1000))
+        if result != win32event.WAIT_OBJECT_0:
+            return False
+        try:
+            win32print.FindNextPrinterChangeNotification(self._change_handle, None)
+        except Exception:
+            pass
         return True
+
+    def enumerate(self):
+        return [p[2] for p in win32print.EnumPrinters(2)]
+
+    def capabilities(self, printer_name, refresh=False):
+        caps = dict(get_printer_capabilities(printer_name, refresh))
+        caps['mode'] = get_printer_setting(printer_name, 'mode', DEFAULT_PRINT_MODE)
+        caps['resolved_mode'] = resolve_print_mode(printer_name)
+        return caps
+
+    def submit(self, source, printer_name, copies=1, duplex=1, raw=False):
+        if raw:
+            return {'mode': 'raw', 'backend_job_id': raw_print_file(source, printer_name, copies)}
+        mode, job_id = print_pdf_file(source, printer_name, copies, duplex)
+        return {'mode': mode, 'backend_job_id': job_id}
+
+    def submit_image(self, image_path, printer_name, copies=1, duplex=1, monochrome='none'):
+        return {'mode': 'image',
+                'backend_job_id': silent_print_image(image_path, printer_name, copies, duplex, monochrome)}
+
+    def status(self, printer_name):
+        hprinter = win32print.OpenPrinter(printer_name)
+        try:
+            info = win32print.GetPrinter(hprinter, 2)
+        finally:
+            win32print.ClosePrinter(hprinter)
+        flags = info['Status']
+        if flags & win32print.PRINTER_STATUS_PAUSED:
+            status = 'paused'
+        elif flags & (win32print.PRINTER_STATUS_ERROR | win32print.PRINTER_STATUS_PAPER_JAM |
+                      win32print.PRINTER_STATUS_PAPER_OUT | win32print.PRINTER_STATUS_NOT_AVAILABLE):
+            status = 'error'
+        elif flags & win32print.PRINTER_STATUS_OFFLINE or info['Attributes'] & win32print.PRINTER_ATTRIBUTE_WORK_OFFLINE:
+            status = 'offline'
+        else:
+            status = 'online'
+        return {'status': status, 'queue_length': info['cJobs']}
+
+    def job_status(self, printer_name, backend_job_id):
+        hprinter = win32print.OpenPrinter(printer_name)
+        try:
+            try:
+                info = win32print.GetJob(hprinter, int(backend_job_id), 1)
+            except Exception:
+                # 任务已离开系统队列（打印完成或被删除），驱动未保留已打印任务时无法区分
+                return {'state': 'unknown'}
+        finally:
+            win32print.ClosePrinter(hprinter)
+        flags = info['Status']
+        if flags & (win32print.JOB_STATUS_ERROR | win32print.JOB_STATUS_OFFLINE | win32print.JOB_STATUS_PAPEROUT |
+                    win32print.JOB_STATUS_BLOCKED_DEVQ | win32print.JOB_STATUS_USER_INTERVENTION |
+                    win32print.JOB_STATUS_DELETING | win32print.JOB_STATUS_DELETED):
+            state = 'error'
+        elif flags & (win32print.JOB_STATUS_PRINTED | win32print.JOB_STATUS_COMPLETE):
+            state = 'done'
+        elif flags & (win32print.JOB_STATUS_PRINTING | win32print.JOB_STATUS_SPOOLING):
+            state = 'printing'
+        else:
+            state = 'queued'
+        return {'state': state, 'pages_printed': info.get('PagesPrinted', 0), 'total_pages': info.get('TotalPages', 0)}
+
+class CupsPrinterBackend(PrinterBackend):
+    # Linux/macOS：通过 CUPS 命令行工具提交，PDF 由 CUPS 自行处理，无需栅格化
+    name = 'cups'
+
+    def _run(self, args, data=None, timeout=30):
+        result = subprocess.run(args, input=data, capture_output=True, timeout=timeout)
+        if result.returncode != 0:
+            raise Exception(result.stderr.decode('utf-8', 'replace').strip() or f"{args[0]} 执行失败")
+        return result.stdout.decode('utf-8', 'replace')
+
+    def enumerate(self):
+        return [line.split()[0] for line in self._run(['lpstat', '-e']).splitlines() if line.strip()]
+
+    def capabilities(self, printer_name, refresh=False):
+        options = {}
+        for line in self._run(['lpoptions', '-p', printer_name, '-l']).splitlines():
+            if ':' in line:
+                key, values = line.split(':', 1)
+                options[key.split('/')[0]] = values.split()
+        return {'driver': 'cups', 'pdf_direct': True, 'duplex': 'Duplex' in options or 'sides' in options,
+                'options': options}
+
+    def submit(self, source, printer_name, copies=1, duplex=1, raw=False):
+        args = ['lp', '-d', printer_name, '-n', str(copies)]
+        if raw:
+            args += ['-o', 'raw']
+        else:
+            args += ['-o', {2: 'sides=two-sided-long-edge', 3: 'sides=two-sided-short-edge'}.get(duplex, 'sides=one-sided')]
+        if isinstance(source, (bytes, bytearray)):
+            output = self._run(args + ['-'], data=bytes(source))
+        else:
+            output = self._run(args + [source])
+        # 输出形如 "request id is printer-123 (1 file(s))"
+        job_id = output.split('request id is', 1)[-1].split()[0] if 'request id is' in output else None
+        return {'mode': 'raw' if raw else 'cups', 'backend_job_id': job_id}
+
+    def submit_image(self, image_path, printer_name, copies=1, duplex=1, monochrome='none'):
+        # CUPS 自带图片过滤器，按打印机分辨率直接处理图片
+        args = ['lp', '-d', printer_name, '-n', str(copies), '-o', 'fit-to-page']
+        if monochrome != 'none':
+            args += ['-o', 'print-color-mode=monochrome']
+        output = self._run(args + [image_path])
+        job_id = output.split('request id is', 1)[-1].split()[0] if 'request id is' in output else None
+        return {'mode': 'image', 'backend_job_id': job_id}
+
+    def status(self, printer_name):
+        output = self._run(['lpstat', '-p', printer_name])
+        if 'disabled' in output:
+            status = 'paused'
+        elif 'printing' in output or 'idle' in output:
+            status = 'online'
+        else:
+            status = 'unknown'
+        queue_length = len([l for l in self._run(['lpstat', '-o', printer_name]).splitlines() if l.strip()])
+        return {'status': status, 'queue_length': queue_length}
+
+    def job_status(self, printer_name, backend_job_id):
+        # lpstat -o 只列出未完成的任务，-W completed 列出已完成的任务；每行以任务 ID 开头
+        def listed(output):
+            return any(line.split()[0] == backend_job_id for line in output.splitlines() if line.strip())
+
+        if listed(self._run(['lpstat', '-o', printer_name])):
+            # 正在打印的任务会出现在打印机状态中，形如 "printer xxx now printing xxx-123."
+            printing = f"now printing {backend_job_id}" in self._run(['lpstat', '-p', printer_name])
+            return {'state': 'printing' if printing else 'queued'}
+        if listed(self._run(['lpstat', '-W', 'completed', '-o', printer_name])):
+            return {'state': 'done'}
+        return {'state': 'unknown'}
+
+class VirtualPrinterBackend(PrinterBackend):
+    # 虚拟打印机：将任务写入目录并模拟打印耗时，用于无打印机环境下的压测和 CI
+    name = 'virtual'
+
+    def __init__(self, printers, spool_folder, latency_ms=0, page_latency_ms=0):
+        self.printers = printers
+        self.spool_folder = spool_folder
+        self.latency_ms = latency_ms
+        self.page_latency_ms = page_latency_ms
+        # 进行中的任务：backend_job_id -> 打印机名称
+        self.active = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def _printing(self, printer_name):
+        # 登记进行中的任务，status 的 queue_length 和 job_status 都以此为准
+        if printer_name not in self.printers:
+            raise Exception(f"打印机不存在: {printer_name}")
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.active[job_id] = printer_name
+        try:
+            yield job_id
+        finally:
+            with self.lock:
+                del self.active[job_id]
+
+    def _spool_prefix(self, printer_name, job_id, copies):
+        folder = os.path.join(self.spool_folder, sanitize_filename(printer_name))
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{job_id}_x{copies}")
+
+    def enumerate(self):
+        return list(self.printers)
+
+    def capabilities(self, printer_name, refresh=False):
+        return {'driver': 'virtual', 'pdf_direct': True, 'duplex': True}
+
+    def submit(self, source, printer_name, copies=1, duplex=1, raw=False):
+        with self._printing(printer_name) as job_id:
+            if isinstance(source, (bytes, bytearray)):
+                data = bytes(source)
+            else:
+                with open(source, 'rb') as f:
+                    data = f.read()
+            pages = 1
+            if not raw and PYMUPDF_AVAILABLE and self.page_latency_ms:
+                try:
+                    with fitz.open(stream=data, filetype='pdf') as doc:
+                        pages = len(doc)
+                except Exception:
+                    pass
+            time.sleep((self.latency_ms + self.page_latency_ms * pages) * copies / 1000.0)
+
+            ext = 'raw' if raw else 'pdf'
+            with open(f"{self._spool_prefix(printer_name, job_id, copies)}.{ext}", 'wb') as f:
+                f.write(data)
+            return {'mode': 'virtual', 'backend_job_id': job_id}
+
+    def submit_image(self, image_path, printer_name, copies=1, duplex=1, monochrome='none'):
+        # 按模拟的标签打印机分辨率处理图片，每帧保存为 PNG，便于检查直接打印的输出
+        with self._printing(printer_name) as job_id:
+            time.sleep(self.latency_ms * copies / 1000.0)
+            prefix = self._spool_prefix(printer_name, job_id, copies)
+            for index, frame in enumerate(iter_image_frames(image_path)):
+                img, _rect = fit_image_to_device(frame, VIRTUAL_IMAGE_DEVICE, monochrome)
+                img.save(f"{prefix}_{index}.png")
+            return {'mode': 'image', 'backend_job_id': job_id}
+
+    def status(self, printer_name):
+        if printer_name not in self.printers:
+            return {'status': 'error', 'queue_length': 0}
+        with self.lock:
+            return {'status': 'online', 'queue_length': sum(1 for p in self.active.values() if p == printer_name)}
+
+    def job_status(self, printer_name, backend_job_id):
+        # 进行中的任务在 active 中；已完成的任务以输出目录中的文件为准
+        with self.lock:
+            if self.active.get(backend_job_id) == printer_name:
+                return {'state': 'printing'}
+        folder = os.path.join(self.spool_folder, sanitize_filename(printer_name))
+        if glob.glob(os.path.join(folder, f"*_{glob.escape(backend_job_id)}_x*")):
+            return {'state': 'done'}
+        return {'state': 'unknown'}
+
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        name = PRINTER_BACKEND or ('gdi' if WIN32_AVAILABLE else 'cups')
+        if name == 'virtual':
+            _backend = VirtualPrinterBackend(VIRTUAL_PRINTERS, VIRTUAL_SPOOL_FOLDER,
+                                             VIRTUAL_PRINTER_LATENCY_MS, VIRTUAL_PRINTER_PAGE_MS)
+        elif name == 'cups':
+            _backend = CupsPrinterBackend()
+        elif name == 'gdi':
+            if not WIN32_AVAILABLE:
+                raise Exception("pywin32未安装，无法使用GDI打印后端")
+            _backend = GdiPrinterBackend()
+        else:
+            raise Exception(f"未知的打印后端: {name}")
+    return _backend
+
+def iter_image_frames(image_path):
+    # 逐帧读取多页 TIFF/GIF，同一时间只解码一帧；返回的对象在下一次迭代时会切换到下一帧
+    with PILImage.open(image_path) as img:
+        for index in range(getattr(img, 'n_frames', 1)):
+            img.seek(index)
+            yield img
+
+def image_placement(page_size, img_width, img_height):
+    # 图片居中并缩放到页面的 80%
+    page_width, page_height = page_size
+    ratio = min(page_width / img_width, page_height / img_height)
+    scaled_width = img_width * ratio * 0.8
+    scaled_height = img_height * ratio * 0.8
+    return (page_width - scaled_width) / 2, (page_height - scaled_height) / 2, scaled_width, scaled_height
+
+def exif_swaps_axes(frame):
+    # EXIF 方向 5-8 表示显示时需旋转 90/270 度，宽高互换
+    try:
+        return frame.getexif().get(0x0112, 1) in (5, 6, 7, 8)
+    except Exception:
+        return False
+
+def oriented_size(frame):
+    # 按 EXIF 方向校正后的显示尺寸，用于排版；不必先解码整张图片
+    return (frame.height, frame.width) if exif_swaps_axes(frame) else frame.size
+
+def prepare_image_frame(frame, target_size):
+    # 降采样到目标像素尺寸并转换为 PDF 可直接嵌入的颜色模式；target_size 为校正方向后的尺寸
+    from PIL import ImageOps
+    draft_size = (target_size[1], target_size[0]) if exif_swaps_axes(frame) else target_size
+    if frame.format == 'JPEG' and (frame.width > draft_size[0] * 2 or frame.height > draft_size[1] * 2):
+        # 大 JPEG 直接按 1/2、1/4、1/8 解码，减少内存和解码时间
+        frame.draft('RGB' if frame.mode == 'RGB' else 'L', draft_size)
+    img = ImageOps.exif_transpose(frame)
+    if img.mode not in ('L', 'RGB'):
+        img = img.convert('L' if img.mode in ('1', 'LA', 'I', 'I;16', 'F') else 'RGB')
+    if img.width > target_size[0] or img.height > target_size[1]:
+        img = img.resize(fit_size(img.size, target_size), PILImage.LANCZOS, reducing_gap=3.0)
+    return img
+
+def fit_size(size, bounds):
+    ratio = min(bounds[0] / size[0], bounds[1] / size[1], 1.0)
+    return max(1, round(size[0] * ratio)), max(1, round(size[1] * ratio))
+
+def can_pass_through_jpeg(img, frame_count, target_size):
+    # 分辨率不超过目标太多的单帧 JPEG 原样嵌入 PDF，不重新编码
+    if img.format != 'JPEG' or frame_count != 1 or img.mode not in ('L', 'RGB'):
+        return False
+    if img.getexif().get(0x0112, 1) != 1:
+        return False
+    return img.width <= target_size[0] * IMAGE_PASSTHROUGH_SLACK and img.height <= target_size[1] * IMAGE_PASSTHROUGH_SLACK
+
+def convert_images_to_pdf(image_paths, output_path, page_size=A4):
+    # 多个图片（及多页 TIFF/GIF 的每一帧）各占一页，合并为一个 PDF；
+    # 每帧解码、降采样后即交给 reportlab 并释放，同一时刻只有一帧未压缩的位图。
+    # reportlab 在 save() 之前仍会在内存中保留每页的图片数据（降采样到 IMAGE_DPI 后压缩的数据，
+    # JPEG 直通时为原文件数据），总内存随页数增长
+    from reportlab.lib.utils import ImageReader
+    c = canvas.Canvas(output_path, pagesize=page_size)
+    for image_path in image_paths:
+        frames = iter_image_frames(image_path)
+        for frame in frames:
+            frame_count = getattr(frame, 'n_frames', 1)
+            x, y, width, height = image_placement(page_size, *oriented_size(frame))
+            target_size = (max(1, int(width / 72 * IMAGE_DPI)), max(1, int(height / 72 * IMAGE_DPI)))
+            if can_pass_through_jpeg(frame, frame_count, target_size):
+                c.drawImage(image_path, x, y, width=width, height=height)
+            else:
+                img = prepare_image_frame(frame, target_size)
+                c.drawImage(ImageReader(img), x, y, width=width, height=height)
+                del img
+            c.showPage()
+    c.save()
+    return True
+
+def convert_image_to_pdf(image_path, output_path, page_size=A4):
+    try:
+        return convert_images_to_pdf([image_path], output_path, page_size)
     except Exception as e:
         print(f"图片转PDF失败: {e}")
         return False
 
+# 中文字体候选：(注册名, 字体文件路径)，依次尝试，第一个可用的作为文本转换字体；
+# 可通过 FONT_PATHS 环境变量在前面追加，格式为 "名称=路径" 或 "路径"，多个用 os.pathsep 分隔
+DEFAULT_FONT_CANDIDATES = [
+    ("SimSun", r"C:\Windows\Fonts\simsun.ttc"),
+    ("SimHei", r"C:\Windows\Fonts\simhei.ttf"),
+    ("Microsoft-YaHei", r"C:\Windows\Fonts\msyh.ttc"),
+    ("WenQuanYi-ZenHei", "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc"),
+    ("WenQuanYi-MicroHei", "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc"),
+    ("AR-PL-UMing", "/usr/share/fonts/truetype/arphic/uming.ttc"),
+    ("Droid-Sans-Fallback", "/usr/share/fonts/truetype/droid/DroidSansFallbackFull.ttf"),
+    ("Arial-Unicode", "/Library/Fonts/Arial Unicode.ttf"),
+]
+# 没有可用的字体文件时使用 reportlab 内置的 CID 字体（不嵌入 PDF）
+CID_FALLBACK_FONT = "STSong-Light"
+TEXT_MARGIN = 50
+# 编码探测只读取文件开头的这部分内容
+TEXT_SNIFF_BYTES = 64 * 1024
+
+def parse_font_paths(value):
+    candidates = []
+    for item in value.split(os.pathsep) if value else []:
+        item = item.strip()
+        if not item:
+            continue
+        if '=' in item:
+            name, path = item.split('=', 1)
+        else:
+            name, path = os.path.splitext(os.path.basename(item))[0], item
+        candidates.append((name.strip(), path.strip()))
+    return candidates
+
+class FontRegistry:
+    # 进程内共享的字体服务：字体文件只解析、注册一次（TTC 有数 MB），字符宽度按 (字体, 字号) 缓存。
+    # 文本转换及以后的标签、小票渲染都应通过它取字体和测量宽度
+    def __init__(self, candidates):
+        self.candidates = candidates
+        self.lock = threading.Lock()
+        self.registered = {}
+        self.widths = {}
+        self._cjk_font = False
+
+    def register(self, name, path):
+        # 注册单个字体文件，结果（包括失败）会被记住，不会重复解析
+        with self.lock:
+            if name not in self.registered:
+                ok = False
+                try:
+                    if os.path.exists(path):
+                        from reportlab.pdfbase import pdfmetrics
+                        from reportlab.pdfbase.ttfonts import TTFont
+                        pdfmetrics.registerFont(TTFont(name, path))
+                        ok = True
+                except Exception as e:
+                    print(f"注册字体失败 {path}: {e}")
+                self.registered[name] = ok
+            return self.registered[name]
+
+    def cjk_font(self):
+        # 第一个可用的中文字体名称，都不可用时返回 None
+        if self._cjk_font is False:
+            font = None
+            for name, path in self.candidates:
+                if self.register(name, path):
+                    font = name
+                    break
+            if font is None:
+                try:
+                    from reportlab.pdfbase import pdfmetrics
+                    from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+                    pdfmetrics.registerFont(UnicodeCIDFont(CID_FALLBACK_FONT))
+                    font = CID_FALLBACK_FONT
+                except Exception:
+                    pass
+            self._cjk_font = font
+        return self._cjk_font
+
+    def text_font(self):
+        # 文本转换使用的 (字体名, 字号, 行高)；没有中文字体时使用等宽的 Courier
+        font = self.cjk_font()
+        return (font, 10, 14) if font else ("Courier", 9, 12)
+
+    def char_widths(self, font_name, font_size, chars):
+        # 返回 (字体, 字号) 的宽度表，并确保其中包含 chars 中的全部字符
+        widths = self.widths.setdefault((font_name, font_size), {})
+        missing = set(chars).difference(widths)
+        if missing:
+            from reportlab.pdfbase import pdfmetrics
+            for ch in missing:
+                try:
+                    widths[ch] = pdfmetrics.stringWidth(ch, font_name, font_size)
+                except Exception:
+                    widths[ch] = font_size
+        return widths
+
+    def string_width(self, text, font_name, font_size):
+        widths = self.char_widths(font_name, font_size, text)
+        return sum(map(widths.__getitem__, text))
+
+    def wrap(self, line, max_width, font_name, font_size):
+        # 按实际字符宽度折行；查表和累加在 C 层完成
+        from itertools import accumulate
+        from bisect import bisect_right
+        widths = self.char_widths(font_name, font_size, line)
+        if sum(map(widths.__getitem__, line)) <= max_width:
+            yield line
+            return
+        cumulative = list(accumulate(map(widths.__getitem__, line)))
+        start = 0
+        base = 0.0
+        while start < len(line):
+            end = bisect_right(cumulative, base + max_width, start)
+            if end == start:
+                # 单个字符比可用宽度还宽
+                end = start + 1
+            yield line[start:end]
+            base = cumulative[end - 1]
+            start = end
+
+def detect_text_encoding(text_path):
+    # 只根据文件开头判断编码，文件其余部分按该编码流式解码
+    with open(text_path, 'rb') as f:
+        sample = f.read(TEXT_SNIFF_BYTES)
+    if sample.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
+    for encoding in ('utf-8', 'gbk'):
+        try:
+            sample.decode(encoding)
+            return encoding
+        except UnicodeDecodeError as e:
+            # 样本末尾可能截断了一个多字节字符
+            if len(sample) == TEXT_SNIFF_BYTES and e.start >= len(sample) - 3:
+                return encoding
+    return None
+
 def convert_text_to_pdf(text_path, output_path, page_size=A4):
+    # 流式转换：逐行读取、逐页输出，内存占用不随文件大小增长
     try:
-        encodings = ['utf-8', 'gbk', 'gb2312', 'utf-8-sig']
-        content = None
-        
-        for encoding in encodings:
-            try:
-                with open(text_path, 'r', encoding=encoding) as f:
-                    content = f.read()
-                break
-            except UnicodeDecodeError:
-                continue
-        
-        if content is None:
+        encoding = detect_text_encoding(text_path)
+        if encoding is None:
             print(f"无法读取文本文件: {text_path}")
             return False
-        
-        c = canvas.Canvas(output_path, pagesize=page_size)
+
+        font_name, font_size, line_height = font_registry.text_font()
         page_width, page_height = page_size
-        
-        font_registered = False
-        try:
-            from reportlab.pdfbase import pdfmetrics
-            from reportlab.pdfbase.ttfonts import TTFont
-            
-            chinese_fonts = [
-                ("SimSun", r"C:\Windows\Fonts\simsun.ttc"),
-                ("SimHei", r"C:\Windows\Fonts\simhei.ttf"), 
-                ("Microsoft-YaHei", r"C:\Windows\Fonts\msyh.ttc"),
-                ("NSimSun", r"C:\Windows\Fonts\simsun.ttc")
-            ]
-            
-            for font_name, font_path in chinese_fonts:
-                try:
-                    if os.path.exists(font_path):
-                        pdfmetrics.registerFont(TTFont(font_name, font_path))
-                        c.setFont(font_name, 10)
-                        font_registered = True
-                        break
-                except Exception:
-                    continue
-        except ImportError:
-            pass
-        
-        # 如果没有注册成功中文字体，使用Courier字体（等宽字体，对中文兼容性更好）
-        if not font_registered:
+        max_width = page_width - 2 * TEXT_MARGIN
+        lines_per_page = max(1, int((page_height - 2 * TEXT_MARGIN) // line_height) + 1)
+
+        # 页面内容在 showPage 时压缩，已完成的页面只保留压缩后的数据
+        c = canvas.Canvas(output_path, pagesize=page_size, pageCompression=1)
+        text = None
+        line_count = 0
+
+        def emit(segment):
+            nonlocal text, line_count
+            if text is None:
+                text = c.beginText(TEXT_MARGIN, page_height - TEXT_MARGIN)
+                text.setFont(font_name, font_size, line_height)
             try:
-                c.setFont("Courier", 9)
+                text.textLine(segment)
             except Exception:
-                c.setFont("Helvetica", 10)
-        
-        lines = content.split('\n')
-        y = page_height - 50
-        line_height = 14 if font_registered else 12
-        max_chars_per_line = 80 if not font_registered else 60
-        
-        for line in lines:
-            if y < 50:
+                text.textLine("[无法显示的字符]")
+            line_count += 1
+            if line_count >= lines_per_page:
+                c.drawText(text)
                 c.showPage()
-                if font_registered:
-                    for font_name, font_path in chinese_fonts:
-                        try:
-                            if os.path.exists(font_path):
-                                c.setFont(font_name, 10)
-                                break
-                        except:
-                            continue
-                else:
-                    try:
-                        c.setFont("Courier", 9)
-                    except:
-                        c.setFont("Helvetica", 10)
-                y = page_height - 50
-            
-            if len(line) > max_chars_per_line:
-                while len(line) > max_chars_per_line:
-                    split_line = line[:max_chars_per_line]
-                    try:
-                        c.drawString(50, y, split_line)
-                    except Exception:
-                        c.drawString(50, y, "[无法显示的字符]")
-                    y -= line_height
-                    line = line[max_chars_per_line:]
-                    if y < 50:
-                        c.showPage()
-                        if font_registered:
-                            for font_name, font_path in chinese_fonts:
-                                try:
-                                    if os.path.exists(font_path):
-                                        c.setFont(font_name, 10)
-                                        break
-                                except:
-                                    continue
-                        else:
-                            try:
-                                c.setFont("Courier", 9)
-                            except:
-                                c.setFont("Helvetica", 10)
-                        y = page_height - 50
-                
-                if line:
-                    try:
-                        c.drawString(50, y, line)
-                    except Exception:
-                        c.drawString(50, y, "[无法显示的字符]")
-                    y -= line_height
-            else:
-                try:
-                    c.drawString(50, y, line)
-                except Exception:
-                    c.drawString(50, y, "[无法显示的字符]")
-                y -= line_height
-        
+                text = None
+                line_count = 0
+
+        with open(text_path, 'r', encoding=encoding, errors='replace') as f:
+            for line in f:
+                line = line.rstrip('\r\n').expandtabs(4)
+                for segment in font_registry.wrap(line, max_width, font_name, font_size):
+                    emit(segment)
+
+        if text is not None:
+            c.drawText(text)
+            c.showPage()
+        elif c.getPageNumber() == 1:
+            # 空文件也输出一个空白页
+            c.showPage()
         c.save()
         return True
     except Exception as e:
         print(f"文本转PDF失败: {e}")
         return False
-        
-def convert_office_to_pdf_com_silent(office_path, output_path):
+
+def _export_word_to_pdf(word, abs_office_path, abs_output_path):
+    doc = word.Documents.Open(abs_office_path, ReadOnly=True, Visible=False)
     try:
-        pythoncom.CoInitialize()
-        
-        ext = office_path.lower().split('.')[-1]
-        abs_office_path = os.path.abspath(office_path)
-        abs_output_path = os.path.abspath(output_path)
-        
-        output_dir = os.path.dirname(abs_output_path)
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-        
-        if not os.path.exists(abs_office_path):
-            raise Exception(f"输入文件不存在: {abs_office_path}")
-        
-        if ext in ['doc', 'docx']:
-            word = comtypes.client.CreateObject('Word.Application')
-            word.Visible = False
-            word.DisplayAlerts = False
-            word.EnableEvents = False
-            
+        try:
+            doc.ExportAsFixedFormat(abs_output_path, 17)
+        except Exception:
             try:
-                doc = word.Documents.Open(abs_office_path, ReadOnly=True, Visible=False)
-                
-                success = False
+                doc.SaveAs2(abs_output_path, FileFormat=17)
+            except Exception:
                 try:
-                    doc.ExportAsFixedFormat(abs_output_path, 17)
-                    success = True
+                    doc.SaveAs(abs_output_path, 17)
                 except Exception:
-                    try:
-                        doc.SaveAs2(abs_output_path, FileFormat=17)
-                        success = True
-                    except Exception:
-                        try:
-                            doc.SaveAs(abs_output_path, 17)
-                            success = True
-                        except Exception:
-                            pass
-                
-                doc.Close(SaveChanges=False)
-                    
-            finally:
-                word.Quit()
-                
-        elif ext in ['xls', 'xlsx']:
-            excel = comtypes.client.CreateObject('Excel.Application')
-            excel.Visible = False
-            excel.DisplayAlerts = False
-            excel.EnableEvents = False
-            excel.ScreenUpdating = False
-            
+                    pass
+    finally:
+        doc.Close(SaveChanges=False)
+
+def _export_excel_to_pdf(excel, abs_office_path, abs_output_path):
+    wb = excel.Workbooks.Open(abs_office_path, ReadOnly=True)
+    try:
+        try:
+            wb.ExportAsFixedFormat(0, abs_output_path)
+        except Exception:
             try:
-                wb = excel.Workbooks.Open(abs_office_path, ReadOnly=True)
-                
-                success = False
+                ws = wb.ActiveSheet
+                ws.ExportAsFixedFormat(0, abs_output_path)
+            except Exception:
                 try:
-                    wb.ExportAsFixedFormat(0, abs_output_path)
-                    success = True
+                    wb.SaveAs(abs_output_path, 57)
                 except Exception:
-                    try:
-                        ws = wb.ActiveSheet
-                        ws.ExportAsFixedFormat(0, abs_output_path)
-                        success = True
-                    except Exception:
-                        try:
-                            wb.SaveAs(abs_output_path, 57)
-                            success = True
-                        except Exception:
-                            pass
-                
-                wb.Close(SaveChanges=False)
-                    
-            finally:
-                excel.Quit()
-                
-        elif ext in ['ppt', 'pptx']:
+                    pass
+    finally:
+        wb.Close(SaveChanges=False)
+
+def _export_powerpoint_to_pdf(ppt, abs_office_path, abs_output_path):
+    presentation = ppt.Presentations.Open(abs_office_path)
+    try:
+        try:
+            presentation.ExportAsFixedFormat(abs_output_path, 2)
+        except Exception:
             try:
-                ppt = comtypes.client.CreateObject('PowerPoint.Application')
-                
+                presentation.SaveAs(abs_output_path, 32)
+            except Exception:
                 try:
-                    ppt.Visible = 0
+                    presentation.Export(abs_output_path, "PDF")
                 except Exception:
-                    pass
-                
-                try:
-                    presentation = ppt.Presentations.Open(abs_office_path)
-                    
-                    success = False
-                    try:
-                        presentation.ExportAsFixedFormat(abs_output_path, 2)
-                        success = True
-                    except Exception:
-                        try:
-                            presentation.SaveAs(abs_output_path, 32)
-                            success = True
-                        except Exception:
-                            try:
-                                presentation.Export(abs_output_path, "PDF")
-                                success = True
-                            except Exception:
-                                try:
-                                    presentation.SaveAs(abs_output_path)
-                                    success = True
-                                except Exception:
-                                    pass
-                    
                     try:
-                        presentation.Close()
+                        presentation.SaveAs(abs_output_path)
                     except Exception:
                         pass
-                        
-                except Exception as file_error:
-                    print(f"PowerPoint文件处理失败: {file_error}")
-                    return False
-                    
-            except Exception as ppt_error:
-                print(f"PowerPoint COM对象创建失败: {ppt_error}")
-                return False
-            finally:
-                try:
-                    if 'ppt' in locals():
-                        ppt.Quit()
-                except Exception:
-                    pass
-                
+    finally:
+        try:
+            presentation.Close()
+        except Exception:
+            pass
+
+OFFICE_PROCESS_NAMES = {'word': 'winword.exe', 'excel': 'excel.exe', 'powerpoint': 'powerpnt.exe'}
+# 启动 Office 实例时串行执行，前后对比进程列表才能确定新进程属于哪个实例
+_office_launch_lock = threading.Lock()
+
+def _office_process_ids(kind):
+    import win32process
+    pids = set()
+    for pid in win32process.EnumProcesses():
+        try:
+            handle = win32api.OpenProcess(win32con.PROCESS_QUERY_INFORMATION | win32con.PROCESS_VM_READ, False, pid)
+        except Exception:
+            continue
+        try:
+            if os.path.basename(win32process.GetModuleFileNameEx(handle, 0)).lower() == OFFICE_PROCESS_NAMES[kind]:
+                pids.add(pid)
+        except Exception:
+            pass
+        finally:
+            win32api.CloseHandle(handle)
+    return pids
+
+def _launch_office_app(kind):
+    with _office_launch_lock:
+        try:
+            before = _office_process_ids(kind)
+        except Exception:
+            before = None
+        if kind == 'word':
+            app = comtypes_client.CreateObject('Word.Application')
+            app.Visible = False
+            app.DisplayAlerts = False
+            app.EnableEvents = False
+        elif kind == 'excel':
+            app = comtypes_client.CreateObject('Excel.Application')
+            app.Visible = False
+            app.DisplayAlerts = False
+            app.EnableEvents = False
+            app.ScreenUpdating = False
         else:
-            return False
-            
-        if os.path.exists(abs_output_path) and os.path.getsize(abs_output_path) > 0:
-            return True
+            app = comtypes_client.CreateObject('PowerPoint.Application')
+            try:
+                app.Visible = 0
+            except Exception:
+                pass
+
+        # 超时后要结束卡死的实例，必须拿到进程 ID：优先对比启动前后的进程列表，
+        # 找不到唯一的新进程时（如 PowerPoint 复用已有进程）再按窗口句柄查找
+        pid = None
+        try:
+            if before is not None:
+                started = _office_process_ids(kind) - before
+                if len(started) == 1:
+                    pid = started.pop()
+        except Exception:
+            pass
+        if pid is None:
+            pid = _office_window_pid(kind, app)
+        if pid is None:
+            print(f"无法确定 {kind} 进程 ID，转换超时时将无法结束该实例")
+    return app, pid
+
+def _office_window_pid(kind, app):
+    try:
+        import win32process
+        if kind == 'word':
+            # Word 没有 Hwnd 属性，设置唯一标题后按窗口类名查找
+            app.Caption = f"PrinterService-{uuid.uuid4().hex}"
+            hwnd = win32gui.FindWindow('OpusApp', app.Caption)
+        elif kind == 'excel':
+            hwnd = app.Hwnd
         else:
+            hwnd = app.HWND
+        if hwnd:
+            return win32process.GetWindowThreadProcessId(hwnd)[1]
+    except Exception:
+        pass
+    return None
+
+OFFICE_EXPORTERS = {
+    'word': _export_word_to_pdf,
+    'excel': _export_excel_to_pdf,
+    'powerpoint': _export_powerpoint_to_pdf,
+}
+
+OFFICE_EXTENSIONS = {
+    'doc': 'word', 'docx': 'word',
+    'xls': 'excel', 'xlsx': 'excel',
+    'ppt': 'powerpoint', 'pptx': 'powerpoint',
+}
+
+class OfficeAppPool:
+    # 常驻的 Office 实例池：每个实例运行在独立的 STA 线程中，避免每次转换都启动/退出 Word、Excel
+    def __init__(self, sizes, recycle_after=50, convert_timeout=120, queue_timeout=300):
+        self.sizes = sizes
+        self.recycle_after = recycle_after
+        self.convert_timeout = convert_timeout
+        self.queue_timeout = queue_timeout
+        self.queues = {}
+        self.workers = {}
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def _ensure_started(self, kind):
+        import queue
+        with self.lock:
+            if kind not in self.queues:
+                self.queues[kind] = queue.Queue()
+                self.workers[kind] = []
+            alive = [w for w in self.workers[kind] if not w['retired']]
+            for _ in range(max(1, self.sizes.get(kind, 1)) - len(alive)):
+                alive.append(self._spawn(kind))
+            self.workers[kind] = alive
+
+    def _spawn(self, kind):
+        state = {'kind': kind, 'retired': False, 'pid': None, 'documents': 0}
+        t = threading.Thread(target=self._worker_loop, args=(kind, state), name=f'office-{kind}', daemon=True)
+        state['thread'] = t
+        t.start()
+        return state
+
+    def _worker_loop(self, kind, state):
+        pythoncom.CoInitialize()
+        app = None
+        try:
+            while not state['retired']:
+                task = self.queues[kind].get()
+                if task is None:
+                    # shutdown() 发出的退出信号，在本线程中退出 Office 实例
+                    break
+                # 与 convert() 的排队超时在同一把锁下判断，已超时取消的任务不会再被执行
+                with self.lock:
+                    if task['cancelled']:
+                        continue
+                    task['worker'] = state
+                    task['started'].set()
+                try:
+                    if app is not None and not self._healthy(app):
+                        self._quit(app)
+                        app = None
+                    if app is None:
+                        app, state['pid'] = _launch_office_app(kind)
+                        state['documents'] = 0
+                    OFFICE_EXPORTERS[kind](app, task['src'], task['dst'])
+                    state['documents'] += 1
+                    task['result'] = os.path.exists(task['dst']) and os.path.getsize(task['dst']) > 0
+                except Exception as e:
+                    print(f"COM组件转换失败: {e}")
+                    self._quit(app)
+                    app = None
+                finally:
+                    task['done'].set()
+                if app is not None and state['documents'] >= self.recycle_after:
+                    self._quit(app)
+                    app = None
+        finally:
+            self._quit(app)
+            try:
+                pythoncom.CoUninitialize()
+            except Exception:
+                pass
+
+    def _healthy(self, app):
+        try:
+            app.Name
+            return True
+        except Exception:
             return False
+
+    def _quit(self, app):
+        if app is None:
+            return
+        try:
+            app.Quit()
+        except Exception:
+            pass
+
+    def _kill(self, state):
+        # COM 调用卡死时无法从其他线程中断，只能结束对应的 Office 进程并补充新实例
+        state['retired'] = True
+        if state['pid']:
+            try:
+                import signal
+                os.kill(state['pid'], signal.SIGTERM)
+            except Exception:
+                pass
+
+    def shutdown(self, timeout=10):
+        # 每个实例在自己的 STA 线程中调用 Quit 后退出；超时仍未退出（COM 调用卡死）的实例直接结束进程
+        with self.lock:
+            self.closed = True
+            workers = [w for kind_workers in self.workers.values() for w in kind_workers]
+            for kind, kind_workers in self.workers.items():
+                for worker in kind_workers:
+                    worker['retired'] = True
+                    self.queues[kind].put(None)
+        deadline = time.time() + timeout
+        for worker in workers:
+            worker['thread'].join(max(0.0, deadline - time.time()))
+            if worker['thread'].is_alive():
+                self._kill(worker)
+
+    def convert(self, office_path, output_path):
+        kind = OFFICE_EXTENSIONS.get(office_path.lower().rsplit('.', 1)[-1])
+        if kind is None or self.closed:
+            return False
+        self._ensure_started(kind)
+        task = {
+            'src': office_path,
+            'dst': output_path,
+            'result': False,
+            'cancelled': False,
+            'worker': None,
+            'started': threading.Event(),
+            'done': threading.Event(),
+        }
+        self.queues[kind].put(task)
+        if not task['started'].wait(self.queue_timeout):
+            with self.lock:
+                if not task['started'].is_set():
+                    task['cancelled'] = True
+            if task['cancelled']:
+                print(f"Office转换排队超时: {office_path}")
+                return False
+        if not task['done'].wait(self.convert_timeout):
+            print(f"Office转换超时，回收实例: {office_path}")
+            self._kill(task['worker'])
+            self._ensure_started(kind)
+            return False
+        return task['result']
+
+def convert_office_to_pdf_com_silent(office_path, output_path):
+    try:
+        abs_office_path = os.path.abspath(office_path)
+        abs_output_path = os.path.abspath(output_path)
+        
+        output_dir = os.path.dirname(abs_output_path)
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        
+        if not os.path.exists(abs_office_path):
+            raise Exception(f"输入文件不存在: {abs_office_path}")
+        
+        return office_pool.convert(abs_office_path, abs_output_path)
             
     except Exception as e:
         print(f"COM组件转换失败: {e}")
         return False
-    finally:
-        try:
-            pythoncom.CoUninitialize()
-        except:
-            pass
 
 def sanitize_filename(filename):
     import re
@@ -467,7 +1451,117 @@ def sanitize_filename(filename):
     filename = filename.strip('. ')
     return filename
 
-def convert_to_pdf(file_path, output_dir):
+def hash_file(file_path):
+    import hashlib
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def save_upload(file, folder=None):
+    # 按内容哈希存储上传文件：同名不同内容不会互相覆盖，相同内容重复上传复用同一文件
+    import hashlib
+    if folder is None:
+        folder = UPLOAD_FOLDER
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.uploading')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in iter(lambda: file.stream.read(1024 * 1024), b''):
+                digest.update(chunk)
+                f.write(chunk)
+        digest = digest.hexdigest()
+        stored_path = os.path.join(folder, f"{digest[:16]}_{sanitize_filename(file.filename)}")
+        os.replace(tmp_path, stored_path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return stored_path, digest
+
+def link_or_copy(src, dst):
+    # 优先使用硬链接，避免整文件复制
+    import shutil
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+class ConversionCache:
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+
+    def path_for(self, digest, page_size):
+        size_key = f"{int(page_size[0])}x{int(page_size[1])}"
+        return os.path.join(self.folder, f"{digest}_v{CONVERTER_VERSION}_{size_key}.pdf")
+
+    def get(self, digest, page_size):
+        path = self.path_for(digest, page_size)
+        if not os.path.exists(path):
+            return None
+        try:
+            # 以修改时间记录最近使用，用于 LRU 淘汰
+            os.utime(path, None)
+        except OSError:
+            pass
+        return path
+
+    def put(self, digest, page_size, convert):
+        path = self.path_for(digest, page_size)
+        tmp_path = os.path.join(self.folder, f"{uuid.uuid4().hex}.tmp.pdf")
+        try:
+            if not convert(tmp_path):
+                return None
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+        self.evict()
+        return path
+
+    def evict(self):
+        with self.lock:
+            entries = []
+            total = 0
+            # 转换子进程超时被终止时来不及删除临时文件；超过两倍转换时限的临时文件不可能仍在写入，一并清理
+            stale_before = time.time() - CONVERT_TIMEOUT * 2
+            for fname in os.listdir(self.folder):
+                fpath = os.path.join(self.folder, fname)
+                if not os.path.isfile(fpath):
+                    continue
+                try:
+                    stat = os.stat(fpath)
+                except OSError:
+                    continue
+                if fname.endswith('.tmp.pdf'):
+                    if stat.st_mtime < stale_before:
+                        try:
+                            os.remove(fpath)
+                        except OSError:
+                            pass
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, fpath))
+                total += stat.st_size
+            entries.sort()
+            while total > self.max_bytes and entries:
+                _, size, fpath = entries.pop(0)
+                try:
+                    os.remove(fpath)
+                    total -= size
+                except OSError:
+                    pass
+
+def convert_to_pdf(file_path, output_dir, page_size=A4, digest=None):
     filename = os.path.basename(file_path)
     name, ext = os.path.splitext(filename)
     ext = ext.lower()
@@ -477,32 +1571,40 @@ def convert_to_pdf(file_path, output_dir):
     pdf_path = os.path.join(output_dir, pdf_filename)
     
     if ext == '.pdf':
-        import shutil
         try:
-            shutil.copy2(file_path, pdf_path)
+            link_or_copy(file_path, pdf_path)
             return pdf_path
         except Exception as e:
             print(f"复制PDF文件失败: {e}")
             return file_path
     
     if ext in ['.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff']:
-        if convert_image_to_pdf(file_path, pdf_path):
-            return pdf_path
+        convert = lambda out: convert_image_to_pdf(file_path, out, page_size)
     
     elif ext in ['.txt', '.log', '.md']:
-        if convert_text_to_pdf(file_path, pdf_path):
-            return pdf_path
+        convert = lambda out: convert_text_to_pdf(file_path, out, page_size)
     
     elif ext in ['.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx']:
-        if OFFICE_AVAILABLE:
-            if convert_office_to_pdf_com_silent(file_path, pdf_path):
-                return pdf_path
-            else:
-                print(f"Office文件转换失败: {filename}")
-        else:
+        if not OFFICE_AVAILABLE:
             print("Office COM组件不可用")
+            return None
+        convert = lambda out: convert_office_to_pdf_com_silent(file_path, out)
     
-    return None
+    else:
+        return None
+    
+    # 按 (内容哈希, 转换器版本, 纸张) 缓存转换结果，重复上传直接复用，不再调用 Word/Excel
+    if digest is None:
+        digest = hash_file(file_path)
+    cached_path = conversion_cache.get(digest, page_size)
+    if cached_path is None:
+        cached_path = conversion_cache.put(digest, page_size, convert)
+    if cached_path is None:
+        print(f"文件转换失败: {filename}")
+        return None
+    
+    link_or_copy(cached_path, pdf_path)
+    return pdf_path
     
 def get_resource_path(relative_path):
     try:
@@ -516,25 +1618,207 @@ STATIC_FOLDER = get_resource_path('static')
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'uploads')
 PDF_FOLDER = os.path.join(BASE_DIR, 'pdfs')
 LOG_FILE = os.path.join(BASE_DIR, 'print_log.txt')
+JOB_FOLDER = os.path.join(BASE_DIR, 'jobs')
+CONVERT_CACHE_FOLDER = os.path.join(BASE_DIR, 'cache')
+
+# 打印队列工作线程数量：同一台打印机的任务串行执行，不同打印机之间并行
+PRINT_WORKERS = int(os.environ.get('PRINT_WORKERS', '4'))
+JOB_EXPIRE_SECONDS = int(os.environ.get('JOB_EXPIRE_SECONDS', '86400'))
+# 多份打印时单个任务缓存已渲染页面的内存上限，超出部分每份重新渲染
+RENDER_CACHE_MAX_BYTES = int(os.environ.get('RENDER_CACHE_MAX_MB', '512')) * 1024 * 1024
+# 栅格化分辨率上限（0 表示按打印机原生分辨率渲染）
+RENDER_MAX_DPI = int(os.environ.get('RENDER_MAX_DPI', '0'))
+# 页面渲染进程数（0 表示在打印线程内渲染）及每个任务最多预渲染的页数
+RENDER_PROCESSES = int(os.environ.get('RENDER_PROCESSES', str(min(4, os.cpu_count() or 1))))
+RENDER_PREFETCH_PAGES = int(os.environ.get('RENDER_PREFETCH_PAGES', '4'))
+# 每个渲染进程保持打开的文档数
+RENDER_DOC_CACHE_SIZE = int(os.environ.get('RENDER_DOC_CACHE_SIZE', '4'))
+# 默认打印模式：raster（GDI 栅格化）、vector（PDF 直通）或 auto（按打印机能力自动选择），可按打印机单独设置
+DEFAULT_PRINT_MODE = os.environ.get('PRINT_MODE', 'raster')
+PRINT_MODES = ('raster', 'vector', 'auto')
+PRINTER_SETTINGS_FILE = os.path.join(BASE_DIR, 'printer_settings.json')
+RAW_CHUNK_SIZE = 1024 * 1024
+# 单个任务允许的最大份数
+MAX_COPIES = int(os.environ.get('MAX_COPIES', '999'))
+# /api/print 是否默认将内存中的 PDF 另存一份用于审计
+PRINT_AUDIT = os.environ.get('PRINT_AUDIT', '0') == '1'
+# 转换器版本：修改转换逻辑后递增，使旧缓存失效
+CONVERTER_VERSION = 4
+# 图片转 PDF：按图片在页面上的实际尺寸降采样到该分辨率；不超过目标分辨率该倍数的单帧 JPEG 原样嵌入
+IMAGE_DPI = int(os.environ.get('IMAGE_DPI', '300'))
+IMAGE_PASSTHROUGH_SLACK = 1.5
+# 额外的字体文件，优先于内置候选列表，格式见 DEFAULT_FONT_CANDIDATES
+FONT_PATHS = parse_font_paths(os.environ.get('FONT_PATHS', ''))
+CONVERT_CACHE_MAX_BYTES = int(os.environ.get('CONVERT_CACHE_MAX_MB', '1024')) * 1024 * 1024
+# Office 实例池：每种应用的常驻实例数、实例处理多少个文档后重启、单次转换超时（秒）
+OFFICE_POOL_SIZES = {
+    'word': int(os.environ.get('OFFICE_POOL_WORD', '1')),
+    'excel': int(os.environ.get('OFFICE_POOL_EXCEL', '1')),
+    'powerpoint': int(os.environ.get('OFFICE_POOL_POWERPOINT', '1')),
+}
+OFFICE_RECYCLE_AFTER = int(os.environ.get('OFFICE_RECYCLE_AFTER', '50'))
+OFFICE_CONVERT_TIMEOUT = int(os.environ.get('OFFICE_CONVERT_TIMEOUT', '120'))
+# 各类文件的转换并发上限（图片/文本为子进程数，Office 为同时排队到实例池的任务数）及单次转换超时（秒）
+CONVERT_CONCURRENCY = {
+    'image': int(os.environ.get('CONVERT_CONCURRENCY_IMAGE', '2')),
+    'text': int(os.environ.get('CONVERT_CONCURRENCY_TEXT', '1')),
+    'office': int(os.environ.get('CONVERT_CONCURRENCY_OFFICE', str(sum(OFFICE_POOL_SIZES.values())))),
+}
+CONVERT_TIMEOUT = int(os.environ.get('CONVERT_TIMEOUT', '300'))
+# HTTP 服务：默认使用 waitress 生产服务器，可通过 SERVER_MODE=dev 或 --server dev 切换回开发服务器
+SERVER_MODE = os.environ.get('SERVER_MODE', 'waitress')
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', '5000'))
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '16'))
+SERVER_CONNECTION_LIMIT = int(os.environ.get('SERVER_CONNECTION_LIMIT', '500'))
+SERVER_BACKLOG = int(os.environ.get('SERVER_BACKLOG', '1024'))
+SERVER_CHANNEL_TIMEOUT = int(os.environ.get('SERVER_CHANNEL_TIMEOUT', '120'))
+MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH_MB', '200')) * 1024 * 1024
+SHUTDOWN_TIMEOUT = int(os.environ.get('SHUTDOWN_TIMEOUT', '30'))
+# 打印后端：gdi（Windows）、cups（Linux/macOS）、virtual（写入目录的虚拟打印机）；默认按平台选择
+PRINTER_BACKEND = os.environ.get('PRINTER_BACKEND', '')
+VIRTUAL_PRINTERS = [p.strip() for p in os.environ.get('VIRTUAL_PRINTERS', 'Virtual-1,Virtual-2').split(',') if p.strip()]
+VIRTUAL_SPOOL_FOLDER = os.environ.get('VIRTUAL_SPOOL_FOLDER', os.path.join(BASE_DIR, 'virtual_spool'))
+VIRTUAL_PRINTER_LATENCY_MS = int(os.environ.get('VIRTUAL_PRINTER_LATENCY_MS', '200'))
+VIRTUAL_PRINTER_PAGE_MS = int(os.environ.get('VIRTUAL_PRINTER_PAGE_MS', '50'))
+# 打印机清单最长刷新间隔（秒），Windows 上收到变化通知时会提前刷新
+PRINTER_REFRESH_INTERVAL = int(os.environ.get('PRINTER_REFRESH_INTERVAL', '60'))
+# 虚拟打印机处理图片时模拟的设备：4x6 英寸、203 DPI 的热敏标签打印机
+VIRTUAL_IMAGE_DEVICE = {'area': (812, 1218), 'margins': (0, 0), 'dpi': (203, 203)}
+# 图片直接打印：跳过 PDF 转换，按打印机原生分辨率绘制；可按请求或按打印机设置开启
+DIRECT_IMAGE_PRINT = os.environ.get('DIRECT_IMAGE_PRINT', '0') in ('1', 'true', 'True')
+IMAGE_EXTENSIONS = ('jpg', 'jpeg', 'png', 'bmp', 'gif', 'tiff')
+MONOCHROME_MODES = ('none', 'threshold', 'dither')
+# 主动上报：配置 ODOO_URL 和 ODOO_PUSH_TOKEN（在 Odoo 打印服务器记录中生成）后，
+# 定期向 Odoo 推送心跳、打印机清单和队列深度，Odoo 无需访问本机
+ODOO_URL = os.environ.get('ODOO_URL', '').rstrip('/')
+ODOO_PUSH_TOKEN = os.environ.get('ODOO_PUSH_TOKEN', '')
+ODOO_PUSH_INTERVAL = int(os.environ.get('ODOO_PUSH_INTERVAL', '30'))
+# 拉取模式：ODOO_PULL_JOBS=1 时定期从 Odoo 领取打印任务，适用于 Odoo 无法访问本机的场景；
+# Odoo 立即返回，空闲时请求间隔从 ODOO_PULL_INTERVAL 逐步加倍到 ODOO_PULL_MAX_INTERVAL（秒）
+ODOO_PULL_JOBS = os.environ.get('ODOO_PULL_JOBS', '0') in ('1', 'true', 'True')
+ODOO_PULL_BATCH = int(os.environ.get('ODOO_PULL_BATCH', '20'))
+ODOO_PULL_INTERVAL = float(os.environ.get('ODOO_PULL_INTERVAL', '2'))
+ODOO_PULL_MAX_INTERVAL = float(os.environ.get('ODOO_PULL_MAX_INTERVAL', '30'))
 
 app = Flask(__name__, template_folder=STATIC_FOLDER, static_folder=STATIC_FOLDER)
+app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(PDF_FOLDER, exist_ok=True)
+os.makedirs(JOB_FOLDER, exist_ok=True)
+os.makedirs(CONVERT_CACHE_FOLDER, exist_ok=True)
 if not os.path.exists(STATIC_FOLDER):
     os.makedirs(STATIC_FOLDER, exist_ok=True)
 
-PRINTERS = [p[2] for p in win32print.EnumPrinters(2)]
+conversion_cache = ConversionCache(CONVERT_CACHE_FOLDER, CONVERT_CACHE_MAX_BYTES)
+font_registry = FontRegistry(FONT_PATHS + DEFAULT_FONT_CANDIDATES)
+office_pool = OfficeAppPool(OFFICE_POOL_SIZES, OFFICE_RECYCLE_AFTER, OFFICE_CONVERT_TIMEOUT)
+
+class PrinterRegistry:
+    # 打印机清单缓存：后台线程刷新（Windows 上由打印机变化通知驱动，其他后端轮询），
+    # 请求直接读取内存中的快照，网络打印机不可达时也不会阻塞请求
+    def __init__(self, interval=60, min_interval=1.0):
+        self.interval = interval
+        self.min_interval = min_interval
+        self.printers = []
+        self.etag = None
+        self.updated_at = None
+        self.lock = threading.Lock()
+        self.refresh_requested = threading.Event()
+        self.ready = threading.Event()
+        # 清单内容变化时置位，供主动上报线程立即推送
+        self.changed = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._loop, name='printer-registry', daemon=True).start()
+
+    def names(self):
+        with self.lock:
+            return [p['name'] for p in self.printers]
+
+    def snapshot(self):
+        with self.lock:
+            return {'printers': [dict(p) for p in self.printers], 'etag': self.etag, 'updated_at': self.updated_at}
+
+    def get(self, printer_name):
+        with self.lock:
+            for p in self.printers:
+                if p['name'] == printer_name:
+                    return dict(p)
+        return None
+
+    def request_refresh(self):
+        self.refresh_requested.set()
+
+    def refresh(self):
+        import hashlib
+        backend = get_backend()
+        try:
+            names = backend.enumerate()
+        except Exception as e:
+            print(f"获取打印机列表失败: {e}")
+            return
+        printers = []
+        for name in names:
+            try:
+                status = backend.status(name)
+            except Exception:
+                status = {'status': 'unknown', 'queue_length': 0}
+            printers.append({'name': name, 'status': status.get('status', 'unknown'),
+                             'queue_length': status.get('queue_length', 0)})
+        etag = hashlib.sha1(json.dumps(printers, sort_keys=True).encode('utf-8')).hexdigest()
+        with self.lock:
+            if etag != self.etag:
+                self.printers = printers
+                self.etag = etag
+                self.updated_at = datetime.now().isoformat()
+                self.changed.set()
+        mark_startup('printers_enumerated')
+        self.ready.set()
+
+    def _loop(self):
+        backend = get_backend()
+        while True:
+            self.refresh()
+            self.refresh_requested.clear()
+            # 变化通知可能成批到达（每页、每个任务），刷新之间至少间隔 min_interval
+            time.sleep(self.min_interval)
+            deadline = time.time() + self.interval
+            while time.time() < deadline and not self.refresh_requested.is_set():
+                if backend.wait_for_change(min(1.0, max(0.0, deadline - time.time()))):
+                    break
+
+printer_registry = PrinterRegistry(PRINTER_REFRESH_INTERVAL)
 
 ALLOWED_EXT = {
     'pdf', 'jpg', 'jpeg', 'png', 'bmp', 'gif', 'tiff',
     'txt', 'log', 'md',
-    'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx'
+    'doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx',
+    'zpl', 'epl', 'escpos'
 }
 
+# 打印机语言文件（标签打印机 ZPL/EPL、小票打印机 ESC/POS）：不转换、不栅格化，原样写入打印队列
+RAW_EXTENSIONS = ('zpl', 'epl', 'escpos')
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXT
 
+def parse_print_options(copies=1, duplex=1):
+    # 校验份数和双面参数（1 单面，2 长边翻转，3 短边翻转），无效时抛出 ValueError，消息可直接返回给调用方
+    try:
+        copies, duplex = int(copies), int(duplex)
+    except (TypeError, ValueError):
+        raise ValueError(f'份数或双面参数无效: {copies}, {duplex}')
+    if not 1 <= copies <= MAX_COPIES:
+        raise ValueError(f'份数超出范围（1-{MAX_COPIES}）: {copies}')
+    if duplex not in (1, 2, 3):
+        raise ValueError(f'双面参数无效: {duplex}')
+    return copies, duplex
+
+def is_raw_document(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in RAW_EXTENSIONS
+
 def log_print(filename, printer, copies, duplex, papersize, quality, status="成功"):
     with open(LOG_FILE, 'a', encoding='utf-8') as f:
         f.write(f"{datetime.now()} 打印: {filename} 打印机: {printer} 份数: {copies} 双面: {duplex} 纸张: {papersize} 质量: {quality} 状态: {status}\n")
@@ -545,6 +1829,732 @@ def get_logs():
     with open(LOG_FILE, 'r', encoding='utf-8') as f:
         return f.readlines()[-10:][::-1]
 
+_printer_settings_lock = threading.Lock()
+
+def load_printer_settings():
+    if not os.path.exists(PRINTER_SETTINGS_FILE):
+        return {}
+    try:
+        with open(PRINTER_SETTINGS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+def get_printer_setting(printer_name, key, default=None):
+    with _printer_settings_lock:
+        return load_printer_settings().get(printer_name, {}).get(key, default)
+
+def update_printer_settings(printer_name, values):
+    with _printer_settings_lock:
+        settings = load_printer_settings()
+        settings.setdefault(printer_name, {}).update(values)
+        tmp_path = PRINTER_SETTINGS_FILE + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(settings, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, PRINTER_SETTINGS_FILE)
+        return settings[printer_name]
+
+class PrintJobQueue:
+    FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+    def __init__(self, job_folder, workers=4):
+        self.job_folder = job_folder
+        self.workers = max(1, workers)
+        self.jobs = {}
+        self.lanes = {}
+        self.busy_printers = set()
+        self.cond = threading.Condition()
+        self.threads = []
+        self.stopping = False
+        # 内存中的打印数据（/api/print 直接提交的 PDF），不写入任务 JSON
+        self.payloads = {}
+
+    def start(self):
+        # 不在导入时加载：渲染子进程会重新导入本模块，不能改动任务状态
+        self._load()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f'print-worker-{i}', daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    def submit(self, filename, pdf_path, printer, copies=1, duplex=1, paper_size='A4', quality='normal',
+               pdf_data=None, persist=False, kind='pdf', monochrome='none', idempotency_key=None):
+        # kind='image' 时 pdf_path 为原始图片路径，由后端直接打印
+        now = datetime.now().isoformat()
+        job = {
+            'id': uuid.uuid4().hex,
+            'filename': filename,
+            'pdf_path': pdf_path,
+            'printer': printer,
+            'copies': copies,
+            'duplex': duplex,
+            'paper_size': paper_size,
+            'quality': quality,
+            'state': 'queued',
+            'message': '',
+            'created_at': now,
+            'started_at': None,
+            'finished_at': None,
+            'in_memory': pdf_data is not None,
+            'persist': persist,
+            'kind': kind,
+            'monochrome': monochrome,
+            'idempotency_key': idempotency_key,
+        }
+        with self.cond:
+            self._prune()
+            if pdf_data is not None:
+                self.payloads[job['id']] = pdf_data
+            self.jobs[job['id']] = job
+            self._save(job)
+            self.lanes.setdefault(printer, deque()).append(job['id'])
+            self.cond.notify_all()
+        return dict(job)
+
+    def get(self, job_id):
+        with self.cond:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def find_by_key(self, idempotency_key):
+        # 按调用方提供的幂等键查找未失败的任务；失败或取消的任务允许重新提交
+        with self.cond:
+            for job in self.jobs.values():
+                if job.get('idempotency_key') == idempotency_key and job['state'] not in ('failed', 'cancelled'):
+                    return dict(job)
+        return None
+
+    def list(self, state=None, printer=None):
+        with self.cond:
+            jobs = [dict(j) for j in self.jobs.values()
+                    if (state is None or j['state'] == state) and (printer is None or j['printer'] == printer)]
+        return sorted(jobs, key=lambda j: j['created_at'], reverse=True)
+
+    def cancel(self, job_id):
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if not job or job['state'] != 'queued':
+                return False
+            lane = self.lanes.get(job['printer'])
+            if lane and job_id in lane:
+                lane.remove(job_id)
+            self.payloads.pop(job_id, None)
+            self._finish(job, 'cancelled', '已取消')
+            return True
+
+    def wait(self, job_ids, timeout):
+        # 等待指定任务全部结束，超时返回 False
+        deadline = time.time() + timeout
+        with self.cond:
+            while any(self.jobs[j]['state'] not in self.FINISHED_STATES for j in job_ids if j in self.jobs):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def stop(self):
+        # 停止分配新任务，排队中的任务保留在磁盘上
+        with self.cond:
+            self.stopping = True
+            self.cond.notify_all()
+
+    def wait_idle(self, timeout):
+        deadline = time.time() + timeout
+        with self.cond:
+            while self.busy_printers:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def queue_length(self, printer, include_running=False):
+        with self.cond:
+            running = 1 if include_running and printer in self.busy_printers else 0
+            return len(self.lanes.get(printer, ())) + running
+
+    def _next(self):
+        with self.cond:
+            while True:
+                for printer, lane in self.lanes.items():
+                    if self.stopping:
+                        break
+                    if lane and printer not in self.busy_printers:
+                        job = self.jobs[lane.popleft()]
+                        self.busy_printers.add(printer)
+                        job['state'] = 'printing'
+                        job['started_at'] = datetime.now().isoformat()
+                        self._save(job)
+                        return job
+                self.cond.wait()
+
+    def _worker(self):
+        while True:
+            job = self._next()
+            try:
+                self._run(job)
+            except Exception as e:
+                # 兜底：任何异常都不能让工作线程退出，否则该打印机之后的任务都会一直等待
+                print(f"打印任务处理异常: {e}")
+                with self.cond:
+                    if job['state'] == 'printing':
+                        self._finish(job, 'failed', f"打印任务处理失败: {e}")
+            finally:
+                with self.cond:
+                    self.busy_printers.discard(job['printer'])
+                    self.cond.notify_all()
+
+    def _run(self, job):
+        with self.cond:
+            pdf_data = self.payloads.pop(job['id'], None)
+        try:
+            state, message = self._submit_to_backend(job, pdf_data)
+        except Exception as e:
+            state, message = 'failed', f"打印任务处理失败: {e}"
+        try:
+            if pdf_data is not None and job.get('persist'):
+                job['pdf_path'] = self._persist(job, pdf_data)
+            log_print(job['filename'], job['printer'], job['copies'], job['duplex'], job['paper_size'],
+                      job['quality'], message)
+        except Exception as e:
+            # 留档和日志失败不影响任务结果
+            print(f"记录打印任务失败: {e}")
+        with self.cond:
+            self._finish(job, state, message)
+
+    def _submit_to_backend(self, job, pdf_data):
+        try:
+            if job.get('in_memory') and pdf_data is None:
+                raise Exception("打印数据已丢失")
+            source = pdf_data if pdf_data is not None else job['pdf_path']
+            if job.get('kind') == 'image':
+                job.update(get_backend().submit_image(source, job['printer'], job['copies'], job['duplex'],
+                                                      job.get('monochrome', 'none')))
+            elif job.get('kind') == 'raw':
+                job.update(get_backend().submit(source, job['printer'], job['copies'], job['duplex'], raw=True))
+            else:
+                job.update(get_backend().submit(source, job['printer'], job['copies'], job['duplex']))
+            state, message = 'done', '静默打印成功'
+        except Exception as e:
+            if PYMUPDF_AVAILABLE or get_backend().name != 'gdi':
+                message = f"静默打印失败: {str(e)}"
+            else:
+                message = "PyMuPDF未安装，无法静默打印"
+            state = 'failed'
+        return state, message
+
+    def _persist(self, job, pdf_data):
+        # 仅用于审计留档，打印本身不依赖磁盘文件；打印机语言文件保留原扩展名
+        name, ext = os.path.splitext(job['filename'])
+        ext = ext if job.get('kind') == 'raw' else '.pdf'
+        path = os.path.join(PDF_FOLDER, f"{job['id']}_{sanitize_filename(name)}{ext}")
+        try:
+            with open(path, 'wb') as f:
+                f.write(pdf_data)
+            return path
+        except Exception as e:
+            print(f"保存审计文件失败: {e}")
+            return None
+
+    def _finish(self, job, state, message):
+        job['state'] = state
+        job['message'] = message
+        job['finished_at'] = datetime.now().isoformat()
+        self._save(job)
+
+    def _save(self, job):
+        path = os.path.join(self.job_folder, f"{job['id']}.json")
+        tmp_path = path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(job, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"保存打印任务失败: {e}")
+
+    def _load(self):
+        # 重启后恢复未完成的任务：排队中的重新入队，打印中的无法确认结果，标记为失败
+        for fname in os.listdir(self.job_folder):
+            if not fname.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.job_folder, fname), 'r', encoding='utf-8') as f:
+                    job = json.load(f)
+            except Exception:
+                continue
+            self.jobs[job['id']] = job
+            if job['state'] == 'printing':
+                self._finish(job, 'failed', '服务重启，打印中断')
+            elif job['state'] == 'queued' and job.get('in_memory'):
+                self._finish(job, 'failed', '服务重启，内存中的打印数据已丢失')
+        for job in sorted(self.jobs.values(), key=lambda j: j['created_at']):
+            if job['state'] == 'queued':
+                self.lanes.setdefault(job['printer'], deque()).append(job['id'])
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job['state'] not in self.FINISHED_STATES or not job['finished_at']:
+                continue
+            if now - datetime.fromisoformat(job['finished_at']).timestamp() > JOB_EXPIRE_SECONDS:
+                del self.jobs[job_id]
+                try:
+                    os.remove(os.path.join(self.job_folder, f"{job_id}.json"))
+                except OSError:
+                    pass
+
+print_queue = PrintJobQueue(JOB_FOLDER, PRINT_WORKERS)
+
+class ConversionService:
+    # 转换任务：图片/文本在常驻子进程中执行（崩溃隔离、超时和取消时直接结束进程），
+    # Office 由进程内的 COM 实例池执行（Office 本身运行在独立进程中）；每类文件有独立的并发上限
+    CATEGORIES = {
+        'image': ('jpg', 'jpeg', 'png', 'bmp', 'gif', 'tiff'),
+        'text': ('txt', 'log', 'md'),
+        'office': ('doc', 'docx', 'xls', 'xlsx', 'ppt', 'pptx'),
+    }
+    FINISHED_STATES = ('done', 'failed', 'cancelled', 'timeout')
+
+    def __init__(self, limits, timeout=300):
+        import queue
+        self.limits = limits
+        self.timeout = timeout
+        self.jobs = {}
+        self.callbacks = {}
+        self.queues = {category: queue.Queue() for category in self.CATEGORIES}
+        self.lock = threading.Lock()
+        self.threads = []
+        self.procs = []
+        self.stopping = False
+
+    def start(self):
+        for category in self.CATEGORIES:
+            for i in range(max(1, self.limits.get(category, 1))):
+                t = threading.Thread(target=self._dispatch, args=(category,), name=f'convert-{category}-{i}', daemon=True)
+                t.start()
+                self.threads.append(t)
+
+    def category_for(self, filename):
+        ext = filename.rsplit('.', 1)[-1].lower()
+        for category, exts in self.CATEGORIES.items():
+            if ext in exts:
+                return category
+        return None
+
+    def submit(self, file_path, digest=None, page_size=A4, on_done=None, idempotency_key=None):
+        job = {
+            'id': uuid.uuid4().hex,
+            'filename': os.path.basename(file_path),
+            'file_path': file_path,
+            'digest': digest,
+            'page_size': list(page_size),
+            'category': self.category_for(file_path),
+            'state': 'queued',
+            'message': '',
+            'pdf_path': None,
+            'pdf_name': None,
+            'print_job_id': None,
+            'cancel_requested': False,
+            'idempotency_key': idempotency_key,
+            'created_at': datetime.now().isoformat(),
+            'started_at': None,
+            'finished_at': None,
+        }
+        with self.lock:
+            self._prune()
+            self.jobs[job['id']] = job
+            self.callbacks[job['id']] = [on_done] if on_done else []
+        self.queues[job['category']].put(job)
+        return dict(job)
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def list(self, state=None):
+        with self.lock:
+            jobs = [dict(j) for j in self.jobs.values() if state is None or j['state'] == state]
+        return sorted(jobs, key=lambda j: j['created_at'], reverse=True)
+
+    def find_by_key(self, idempotency_key):
+        with self.lock:
+            for job in self.jobs.values():
+                if job['idempotency_key'] == idempotency_key and job['state'] not in ('failed', 'cancelled', 'timeout'):
+                    return dict(job)
+        return None
+
+    def pending_for(self, filename):
+        with self.lock:
+            for job in self.jobs.values():
+                if job['filename'] == filename and job['state'] not in self.FINISHED_STATES:
+                    return dict(job)
+        return None
+
+    def add_callback(self, job_id, callback):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return False
+            if job['state'] not in self.FINISHED_STATES:
+                self.callbacks.setdefault(job_id, []).append(callback)
+                return True
+        self._run_callback(job, callback)
+        return True
+
+    def cancel(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if not job or job['state'] in self.FINISHED_STATES:
+                return False
+            if job['state'] == 'converting' and job['category'] == 'office':
+                # COM 调用无法中途取消，只能等待超时回收
+                return False
+            job['cancel_requested'] = True
+            if job['state'] != 'queued':
+                return True
+        self._finish(job, 'cancelled', '已取消')
+        return True
+
+    def stop(self, timeout=5):
+        # 停止分发线程并结束转换子进程；正在转换的任务标记为取消，排队中的任务不再执行
+        with self.lock:
+            self.stopping = True
+            for job in self.jobs.values():
+                if job['state'] == 'converting':
+                    job['cancel_requested'] = True
+        for category in self.CATEGORIES:
+            for _ in range(max(1, self.limits.get(category, 1))):
+                self.queues[category].put(None)
+        deadline = time.time() + timeout
+        for t in self.threads:
+            t.join(max(0.0, deadline - time.time()))
+        with self.lock:
+            procs = list(self.procs)
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+                proc.join(1)
+
+    def _dispatch(self, category):
+        proc = conn = None
+        while True:
+            job = self.queues[category].get()
+            if job is None or self.stopping:
+                break
+            with self.lock:
+                if job['state'] != 'queued':
+                    continue
+                job['state'] = 'converting'
+                job['started_at'] = datetime.now().isoformat()
+
+            if category == 'office':
+                try:
+                    pdf_path = convert_to_pdf(job['file_path'], PDF_FOLDER, job['page_size'], job['digest'])
+                    state = 'done' if pdf_path else 'failed'
+                    message = '' if pdf_path else '转换失败'
+                except Exception as e:
+                    pdf_path, state, message = None, 'failed', str(e)
+                self._finish(job, state, message, pdf_path)
+                continue
+
+            if proc is None or not proc.is_alive():
+                proc, conn = self._spawn()
+            pdf_path, state, message = None, 'failed', ''
+            try:
+                conn.send((job['file_path'], PDF_FOLDER, job['page_size'], job['digest']))
+                deadline = time.time() + self.timeout
+                while True:
+                    if conn.poll(0.2):
+                        status, value = conn.recv()
+                        if status == 'ok' and value:
+                            pdf_path, state = value, 'done'
+                        else:
+                            message = value or '转换失败'
+                        break
+                    if job['cancel_requested'] or time.time() > deadline or not proc.is_alive():
+                        if job['cancel_requested']:
+                            state, message = 'cancelled', '已取消'
+                        elif time.time() > deadline:
+                            state, message = 'timeout', f'转换超时（{self.timeout}秒）'
+                        else:
+                            message = '转换进程异常退出'
+                        proc.terminate()
+                        proc.join(5)
+                        proc = None
+                        break
+            except (EOFError, OSError) as e:
+                message = f'转换进程异常退出: {e}'
+                proc = None
+            self._finish(job, state, message, pdf_path)
+
+        if proc is not None and proc.is_alive():
+            # 通知子进程正常退出
+            try:
+                conn.send(None)
+            except (EOFError, OSError):
+                pass
+            proc.join(2)
+
+    def _spawn(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        proc = multiprocessing.Process(target=_conversion_process_main, args=(child_conn,), daemon=True)
+        proc.start()
+        child_conn.close()
+        with self.lock:
+            self.procs = [p for p in self.procs if p.is_alive()] + [proc]
+        return proc, parent_conn
+
+    def _finish(self, job, state, message, pdf_path=None):
+        with self.lock:
+            job['state'] = state
+            job['message'] = message
+            job['pdf_path'] = pdf_path
+            job['pdf_name'] = os.path.basename(pdf_path) if pdf_path else None
+            job['finished_at'] = datetime.now().isoformat()
+            callbacks = self.callbacks.pop(job['id'], [])
+        for callback in callbacks:
+            self._run_callback(job, callback)
+
+    def _run_callback(self, job, callback):
+        try:
+            print_job = callback(dict(job))
+            if print_job:
+                with self.lock:
+                    job['print_job_id'] = print_job['id']
+        except Exception as e:
+            print(f"转换完成回调失败: {e}")
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job['state'] in self.FINISHED_STATES and job['finished_at'] and \
+                    now - datetime.fromisoformat(job['finished_at']).timestamp() > JOB_EXPIRE_SECONDS:
+                del self.jobs[job_id]
+
+def _conversion_process_main(conn):
+    # 转换子进程入口：循环接收任务，单个任务崩溃或超时只影响本进程
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        file_path, output_dir, page_size, digest = task
+        try:
+            conn.send(('ok', convert_to_pdf(file_path, output_dir, tuple(page_size), digest)))
+        except Exception as e:
+            conn.send(('error', str(e)))
+
+def print_after_conversion(conversion_id, filename, printer, copies=1, duplex=1, paper_size='A4', quality='normal',
+                           idempotency_key=None):
+    def on_done(job):
+        if job['state'] != 'done':
+            log_print(filename, printer, copies, duplex, paper_size, quality, f"转换失败，未打印: {job['message']}")
+            return None
+        return print_queue.submit(filename, job['pdf_path'], printer, copies, duplex, paper_size, quality,
+                                  idempotency_key=idempotency_key)
+    return conversion_service.add_callback(conversion_id, on_done)
+
+conversion_service = ConversionService(CONVERT_CONCURRENCY, CONVERT_TIMEOUT)
+
+class OdooConnection:
+    # 到 Odoo 的长连接（HTTP keep-alive），每个线程使用各自的实例
+    def __init__(self, url, token):
+        from urllib.parse import urlsplit
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.token = token
+        self.conn = None
+
+    def post(self, path, payload, timeout=10):
+        import http.client
+        body = json.dumps(payload).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'Authorization': f'Bearer {self.token}'}
+        for attempt in range(2):
+            if self.conn is None:
+                conn_class = http.client.HTTPSConnection if self.scheme == 'https' else http.client.HTTPConnection
+                self.conn = conn_class(self.netloc, timeout=timeout)
+            self.conn.timeout = timeout
+            if self.conn.sock is not None:
+                self.conn.sock.settimeout(timeout)
+            try:
+                self.conn.request('POST', self.prefix + path, body=body, headers=headers)
+                resp = self.conn.getresponse()
+                data = resp.read()
+            except (http.client.HTTPException, ConnectionError):
+                # 服务端关闭了空闲连接，重新连接后重试一次
+                self.close()
+                if attempt:
+                    raise
+                continue
+            except Exception:
+                self.close()
+                raise
+            result = json.loads(data.decode('utf-8'))
+            if not result.get('success'):
+                raise Exception(result.get('message') or f'HTTP {resp.status}')
+            return result
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+class PresenceReporter:
+    # 向 Odoo 推送心跳；打印机清单只在 Odoo 持有的 ETag 与本地不一致时附带
+    def __init__(self, url, token, interval=30):
+        self.connection = OdooConnection(url, token)
+        self.lock = threading.Lock()
+        self.interval = interval
+        self.odoo_etag = None
+        self.stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._loop, name='presence-reporter', daemon=True).start()
+
+    def stop(self):
+        # 退出前通知 Odoo 立即将本机标记为离线
+        self.stopped.set()
+        try:
+            self.push('stopping')
+        except Exception:
+            pass
+
+    def push(self, status='ok'):
+        snapshot = printer_registry.snapshot()
+        etag = f'"{snapshot["etag"]}"' if snapshot['etag'] else None
+        payload = {
+            'status': status,
+            'hostname': socket.gethostname(),
+            'port': SERVER_PORT,
+            'queue_length': sum(print_queue.queue_length(p['name']) for p in snapshot['printers']),
+            'etag': etag,
+        }
+        if etag and etag != self.odoo_etag:
+            payload['printers'] = snapshot['printers']
+        with self.lock:
+            result = self.connection.post('/printer_service/presence', payload)
+        self.odoo_etag = result.get('etag')
+
+    def _loop(self):
+        printer_registry.ready.wait(10)
+        while not self.stopped.is_set():
+            try:
+                self.push()
+            except Exception as e:
+                print(f"向 Odoo 上报状态失败: {e}")
+                # 下次上报附带完整清单
+                self.odoo_etag = None
+            # 打印机清单变化时立即上报，否则按固定间隔发送心跳
+            if printer_registry.changed.wait(self.interval):
+                printer_registry.changed.clear()
+
+class JobPuller:
+    # 从 Odoo 领取打印任务：一次请求领取一批任务，附带上一批的完成回执和仍在打印的任务（续租）；
+    # Odoo 不挂起请求，空闲时由本端按指数退避拉长请求间隔
+    def __init__(self, url, token, batch=20, interval=2, max_interval=30):
+        self.connection = OdooConnection(url, token)
+        self.batch = batch
+        self.interval = interval
+        self.max_interval = max(interval, max_interval)
+        # Odoo 任务 ID -> 本地打印/转换任务列表
+        self.in_flight = {}
+        self.stopped = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._loop, name='job-puller', daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _loop(self):
+        from werkzeug.datastructures import FileStorage
+        interval = self.interval
+        while not self.stopped.is_set():
+            acks = self._collect_acks()
+            try:
+                result = self.connection.post('/printer_service/jobs', {
+                    'acks': [{'id': a['id'], 'success': a['success'], 'message': a['message']} for a in acks],
+                    'in_flight': list(self.in_flight),
+                    'limit': self.batch,
+                }, timeout=30)
+            except Exception as e:
+                print(f"从 Odoo 领取打印任务失败: {e}")
+                # 回执未送达，恢复后重新发送
+                for ack in acks:
+                    self.in_flight[ack['id']] = ack['refs']
+                self.stopped.wait(5)
+                continue
+
+            for job in result.get('jobs', []):
+                refs = []
+                for doc in job['documents']:
+                    try:
+                        # 与上传接口相同的文件类型和参数校验，不合格的文档回执为失败
+                        if not allowed_file(doc['filename']):
+                            raise Exception('文件类型不支持')
+                        copies, _duplex = parse_print_options(doc.get('copies', 1))
+                        file = FileStorage(stream=io.BytesIO(base64.b64decode(doc['content'])), filename=doc['filename'])
+                        refs.append(submit_document(file, doc['printer'], copies,
+                                                    idempotency_key=doc.get('idempotency_key')))
+                    except Exception as e:
+                        refs.append({'success': False, 'message': f'打印失败: {str(e)}'})
+                self.in_flight[job['id']] = refs
+
+            # 领到任务或有待回执的任务时尽快再次请求；空闲时逐步拉长间隔
+            if result.get('jobs') or self.in_flight:
+                interval = self.interval
+            else:
+                interval = min(interval * 2, self.max_interval)
+            self.stopped.wait(interval)
+
+    def _collect_acks(self):
+        acks = []
+        for job_id, refs in list(self.in_flight.items()):
+            states = [self._local_state(ref) for ref in refs]
+            if 'pending' in states:
+                continue
+            failed = [ref.get('message', '') for ref, state in zip(refs, states) if state != 'done']
+            acks.append({
+                'id': job_id,
+                'success': not failed,
+                'message': failed[0] if failed else '静默打印成功',
+                'refs': refs,
+            })
+            del self.in_flight[job_id]
+        return acks
+
+    def _local_state(self, ref):
+        if not ref.get('success'):
+            return 'failed'
+        if not ref.get('job_id'):
+            conversion = conversion_service.get(ref['conversion_job_id'])
+            if conversion is None:
+                return 'failed'
+            if conversion['print_job_id']:
+                ref['job_id'] = conversion['print_job_id']
+            elif conversion['state'] in ConversionService.FINISHED_STATES:
+                ref['message'] = conversion['message']
+                return 'failed'
+            else:
+                return 'pending'
+        job = print_queue.get(ref['job_id'])
+        if job is None:
+            return 'failed'
+        if job['state'] not in PrintJobQueue.FINISHED_STATES:
+            return 'pending'
+        ref['message'] = job['message']
+        return 'done' if job['state'] == 'done' else 'failed'
+
+presence_reporter = PresenceReporter(ODOO_URL, ODOO_PUSH_TOKEN, ODOO_PUSH_INTERVAL) if ODOO_URL and ODOO_PUSH_TOKEN else None
+job_puller = JobPuller(ODOO_URL, ODOO_PUSH_TOKEN, ODOO_PULL_BATCH, ODOO_PULL_INTERVAL,
+                       ODOO_PULL_MAX_INTERVAL) if ODOO_URL and ODOO_PUSH_TOKEN and ODOO_PULL_JOBS else None
+
 def get_file_info():
     files = []
     upload_files = os.listdir(UPLOAD_FOLDER) if os.path.exists(UPLOAD_FOLDER) else []
@@ -570,6 +2580,9 @@ def get_file_info():
         else:
             file_info['pdf_path'] = None
             file_info['pdf_name'] = None
+            if conversion_service.pending_for(f):
+                file_info['status'] = '转换中'
+                file_info['status_color'] = 'warning'
             
         files.append(file_info)
     
@@ -581,7 +2594,7 @@ def index():
     logs = get_logs()
     
     return render_template('index.html', 
-                         printers=PRINTERS, 
+                         printers=printer_registry.names(), 
                          files=files, 
                          logs=logs,
                          office_available=OFFICE_AVAILABLE,
@@ -600,14 +2613,34 @@ def upload_file():
         return jsonify({'success': False, 'message': '文件类型不支持'})
     
     try:
-        original_filepath = os.path.join(UPLOAD_FOLDER, file.filename)
-        file.save(original_filepath)
+        original_filepath, digest = save_upload(file)
+
+        if is_raw_document(original_filepath):
+            # 打印机语言文件无需转换，打印时原样发送
+            return jsonify({
+                'success': True,
+                'filename': os.path.basename(original_filepath),
+                'converted': False,
+                'raw': True,
+                'message': '上传成功'
+            })
         
-        pdf_path = convert_to_pdf(original_filepath, PDF_FOLDER)
+        # PDF 和已缓存的转换结果当场完成，其余文件交给转换服务，立即返回转换任务 ID
+        if conversion_service.category_for(original_filepath) is None or conversion_cache.get(digest, A4):
+            pdf_path = convert_to_pdf(original_filepath, PDF_FOLDER, digest=digest)
+        else:
+            job = conversion_service.submit(original_filepath, digest)
+            return jsonify({
+                'success': True,
+                'filename': os.path.basename(original_filepath),
+                'converted': False,
+                'conversion_job_id': job['id'],
+                'message': '上传成功，正在转换'
+            })
         
         result = {
             'success': True,
-            'filename': file.filename,
+            'filename': os.path.basename(original_filepath),
             'converted': pdf_path is not None,
             'message': '上传成功'
         }
@@ -623,7 +2656,13 @@ def upload_file():
 
 @app.route('/print_single', methods=['POST'])
 def print_single():
-    data = request.get_json()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'message': '请求体必须是 JSON 对象'})
+    try:
+        data['copies'], data['duplex'] = parse_print_options(data.get('copies', 1), data.get('duplex', 1))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
     filename = data.get('filename')
     printer = data.get('printer')
     copies = data.get('copies', 1)
@@ -635,60 +2674,318 @@ def print_single():
         name, ext = os.path.splitext(filename)
         pdf_name = f"{name}.pdf"
         pdf_path = os.path.join(PDF_FOLDER, pdf_name)
+
+        # 打印机语言文件原样发送
+        upload_path = os.path.join(UPLOAD_FOLDER, os.path.basename(filename))
+        if is_raw_document(filename):
+            if not os.path.exists(upload_path):
+                return jsonify({'success': False, 'message': '文件不存在'})
+            job = print_queue.submit(filename, upload_path, printer, copies, duplex, paper_size, quality, kind='raw')
+            return jsonify({'success': True, 'message': '已加入打印队列', 'job_id': job['id'], 'state': job['state']})
+
+        # 图片可跳过 PDF 转换，直接按打印机分辨率打印
+        image_path = upload_path
+        if use_direct_image(filename, printer, data.get('direct_image')) and os.path.exists(image_path):
+            monochrome = resolve_monochrome(printer, data.get('monochrome'))
+            job = print_queue.submit(filename, image_path, printer, copies, duplex, paper_size, quality,
+                                     kind='image', monochrome=monochrome)
+            return jsonify({'success': True, 'message': '已加入打印队列', 'job_id': job['id'], 'state': job['state']})
         
         if not os.path.exists(pdf_path):
+            pending = conversion_service.pending_for(filename)
+            if pending:
+                print_after_conversion(pending['id'], filename, printer, copies, duplex, paper_size, quality)
+                return jsonify({'success': True, 'message': '文件转换中，转换完成后自动打印',
+                                'conversion_job_id': pending['id'], 'state': 'converting'})
             return jsonify({'success': False, 'message': '文件未转换为PDF，无法静默打印'})
-        
-        try:
-            silent_print_pdf(pdf_path, printer, copies, duplex)
-            log_print(filename, printer, copies, duplex, paper_size, quality, "静默打印成功")
-            return jsonify({'success': True, 'message': '静默打印成功'})
-        except Exception as e:
-            if PYMUPDF_AVAILABLE:
-                error_msg = f"静默打印失败: {str(e)}"
-            else:
-                error_msg = "PyMuPDF未安装，无法静默打印"
-            
-            log_print(filename, printer, copies, duplex, paper_size, quality, error_msg)
-            return jsonify({'success': False, 'message': error_msg})
-            
+
+        job = print_queue.submit(filename, pdf_path, printer, copies, duplex, paper_size, quality)
+        return jsonify({'success': True, 'message': '已加入打印队列', 'job_id': job['id'], 'state': job['state']})
+
     except Exception as e:
         error_msg = f"打印失败: {str(e)}"
         log_print(filename, printer, copies, duplex, paper_size, quality, error_msg)
         return jsonify({'success': False, 'message': error_msg})
 
+def pick_printer(candidates):
+    # 从一组等效打印机中选择可用且排队最少的一台（本地队列加系统打印队列）
+    best = None
+    for name in candidates:
+        info = printer_registry.get(name)
+        if info is None or info['status'] in ('paused', 'error', 'offline'):
+            continue
+        load = print_queue.queue_length(name, include_running=True) + (info.get('queue_length') or 0)
+        if best is None or load < best[0]:
+            best = (load, name)
+    return best[1] if best else None
+
+def use_direct_image(filename, printer, requested=None):
+    # 请求参数优先，其次是打印机设置，最后是全局默认
+    if '.' not in filename or filename.rsplit('.', 1)[1].lower() not in IMAGE_EXTENSIONS:
+        return False
+    if requested is None:
+        requested = get_printer_setting(printer, 'image_direct', DIRECT_IMAGE_PRINT)
+    return requested in (True, 1, '1', 'true', 'True')
+
+def resolve_monochrome(printer, requested=None):
+    monochrome = requested or get_printer_setting(printer, 'monochrome', 'none')
+    return monochrome if monochrome in MONOCHROME_MODES else 'none'
+
+_idempotency_locks = {}
+_idempotency_guard = threading.Lock()
+
+@contextmanager
+def idempotency_lock(idempotency_key):
+    # 同一幂等键的并发提交（如调用方超时重试时首个请求仍在处理）串行执行
+    with _idempotency_guard:
+        entry = _idempotency_locks.setdefault(idempotency_key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _idempotency_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                _idempotency_locks.pop(idempotency_key, None)
+
+def find_submitted_document(idempotency_key):
+    # 打印任务持久化在磁盘上，服务重启后仍能识别重复提交；转换任务只在内存中，转换完成后由打印任务继承幂等键
+    job = print_queue.find_by_key(idempotency_key)
+    if job:
+        return {'success': True, 'message': '重复提交，已返回原任务', 'job_id': job['id'], 'state': job['state'],
+                'duplicate': True}
+    conversion = conversion_service.find_by_key(idempotency_key)
+    if conversion:
+        return {'success': True, 'message': '重复提交，已返回原任务', 'conversion_job_id': conversion['id'],
+                'job_id': conversion['print_job_id'], 'state': 'converting', 'duplicate': True}
+    return None
+
+def submit_document(file, printer, copies=1, duplex=1, paper_size='A4', quality='normal', persist=False,
+                    direct_image=None, monochrome=None, idempotency_key=None):
+    # 提交单个文档；调用方提供幂等键时，重复提交（如读超时后重试）返回已有任务，不会重复打印
+    if not idempotency_key:
+        return enqueue_document(file, printer, copies, duplex, paper_size, quality, persist, direct_image, monochrome)
+    with idempotency_lock(idempotency_key):
+        existing = find_submitted_document(idempotency_key)
+        if existing:
+            return existing
+        return enqueue_document(file, printer, copies, duplex, paper_size, quality, persist, direct_image,
+                                monochrome, idempotency_key)
+
+def enqueue_document(file, printer, copies=1, duplex=1, paper_size='A4', quality='normal', persist=False,
+                     direct_image=None, monochrome=None, idempotency_key=None):
+    # PDF 和打印机语言文件直接从内存入打印队列；其他格式落盘后交给转换服务，转换完成后自动入队
+    if file.filename.rsplit('.', 1)[1].lower() == 'pdf' or is_raw_document(file.filename):
+        job = print_queue.submit(file.filename, None, printer, copies, duplex, paper_size, quality,
+                                 pdf_data=file.read(), persist=persist,
+                                 kind='raw' if is_raw_document(file.filename) else 'pdf',
+                                 idempotency_key=idempotency_key)
+        return {'success': True, 'message': '已加入打印队列', 'job_id': job['id'], 'state': job['state']}
+
+    # 其他格式的转换器基于文件路径工作，仍需落盘
+    original_filepath, digest = save_upload(file)
+    if use_direct_image(file.filename, printer, direct_image):
+        job = print_queue.submit(file.filename, original_filepath, printer, copies, duplex, paper_size, quality,
+                                 kind='image', monochrome=resolve_monochrome(printer, monochrome),
+                                 idempotency_key=idempotency_key)
+        return {'success': True, 'message': '已加入打印队列', 'job_id': job['id'], 'state': job['state']}
+    conversion = conversion_service.submit(original_filepath, digest, idempotency_key=idempotency_key)
+    print_after_conversion(conversion['id'], file.filename, printer, copies, duplex, paper_size, quality,
+                           idempotency_key)
+    return {'success': True, 'message': '文件转换中，转换完成后自动打印',
+            'conversion_job_id': conversion['id'], 'state': 'converting'}
+
+@app.route('/api/print', methods=['POST'])
+def api_print():
+    # 上传并打印合并为一次请求：PDF 直接从内存交给打印队列，不写入 UPLOAD_FOLDER/PDF_FOLDER
+    if 'file' not in request.files:
+        return jsonify({'success': False, 'message': '没有文件'})
+
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'success': False, 'message': '文件名为空'})
+
+    if not allowed_file(file.filename):
+        return jsonify({'success': False, 'message': '文件类型不支持'})
+
+    printer = request.form.get('printer')
+    if not printer:
+        return jsonify({'success': False, 'message': '未指定打印机'})
+
+    paper_size = request.form.get('paper_size', 'A4')
+    quality = request.form.get('quality', 'normal')
+    persist = request.form.get('persist', '1' if PRINT_AUDIT else '0') in ('1', 'true', 'True')
+    copies, duplex = request.form.get('copies', 1), request.form.get('duplex', 1)
+
+    try:
+        try:
+            copies, duplex = parse_print_options(copies, duplex)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)})
+        return jsonify(submit_document(file, printer, copies, duplex, paper_size, quality, persist,
+                                       request.form.get('direct_image'), request.form.get('monochrome'),
+                                       request.form.get('idempotency_key')))
+
+    except Exception as e:
+        error_msg = f"打印失败: {str(e)}"
+        log_print(file.filename, printer, copies, duplex, paper_size, quality, error_msg)
+        return jsonify({'success': False, 'message': error_msg})
+
+@app.route('/api/print_raw', methods=['POST'])
+def api_print_raw():
+    # 打印机语言（ZPL/EPL/ESC-POS）原样发送：数据可以是上传文件、data 表单字段（文本）或请求体本身
+    printer = request.values.get('printer')
+    if not printer:
+        return jsonify({'success': False, 'message': '未指定打印机'})
+
+    language = request.values.get('language', 'zpl').lower()
+    if language not in RAW_EXTENSIONS:
+        return jsonify({'success': False, 'message': f'不支持的打印机语言: {language}'})
+    copies = request.values.get('copies', 1)
+    filename = f"raw.{language}"
+
+    try:
+        try:
+            copies, _duplex = parse_print_options(copies)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)})
+        if 'file' in request.files:
+            filename = request.files['file'].filename or filename
+            data = request.files['file'].read()
+        elif 'data' in request.form:
+            # 文本形式的指令按指定编码发送，小票打印机的中文通常需要 gbk
+            data = request.form['data'].encode(request.form.get('encoding', 'utf-8'))
+        else:
+            data = request.get_data()
+        if not data:
+            return jsonify({'success': False, 'message': '没有打印数据'})
+
+        job = print_queue.submit(filename, None, printer, copies, 1, None, 'normal', pdf_data=data, kind='raw')
+        return jsonify({'success': True, 'message': '已加入打印队列', 'job_id': job['id'], 'state': job['state']})
+
+    except Exception as e:
+        error_msg = f"打印失败: {str(e)}"
+        log_print(filename, printer, copies, 1, None, 'normal', error_msg)
+        return jsonify({'success': False, 'message': error_msg})
+
+@app.route('/api/print_batch', methods=['POST'])
+def api_print_batch():
+    # 一次请求提交多个文档，每个文档可指定不同打印机；不同打印机之间由打印队列并行执行。
+    # 请求格式二选一：
+    #   1. multipart：manifest 字段为 JSON 列表，每项的 file 指向同一请求中的文件字段名
+    #   2. multipart：archive 字段为 zip 包，包内 manifest.json 的 file 指向包内文件名
+    # manifest 每项: {"id": 调用方标识, "file": ..., "filename": 可选, "printer": ..., "copies": 1, "duplex": 1,
+    #                "idempotency_key": 可选，重试时相同的键不会重复打印}
+    # 也可以用 "printers": [...] 代替 "printer"，由服务器在这组打印机中选择可用且排队最少的一台
+    from werkzeug.datastructures import FileStorage
+    archive = None
+    try:
+        if 'archive' in request.files:
+            import zipfile
+            archive = zipfile.ZipFile(request.files['archive'].stream)
+            manifest = json.loads(request.form.get('manifest') or archive.read('manifest.json').decode('utf-8'))
+        else:
+            manifest = json.loads(request.form.get('manifest') or '[]')
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'清单格式错误: {str(e)}'})
+
+    if not isinstance(manifest, list) or not manifest:
+        return jsonify({'success': False, 'message': '清单为空'})
+
+    persist = request.form.get('persist', '1' if PRINT_AUDIT else '0') in ('1', 'true', 'True')
+    # 在提交任何文档之前校验，避免部分文档已入队后整个请求失败
+    try:
+        wait = float(request.form.get('wait', 0))
+    except ValueError:
+        return jsonify({'success': False, 'message': f'等待时间无效: {request.form.get("wait")}'})
+
+    results = []
+    for index, entry in enumerate(manifest):
+        if not isinstance(entry, dict):
+            results.append({'success': False, 'message': '打印失败: 清单条目格式错误', 'id': index, 'printer': None})
+            continue
+        doc_id = entry.get('id', index)
+        printer = None
+        filename = entry.get('filename') or entry.get('file') or ''
+        copies, duplex = entry.get('copies', 1), entry.get('duplex', 1)
+        paper_size = entry.get('paper_size', 'A4')
+        quality = entry.get('quality', 'normal')
+        try:
+            # 单个条目参数错误只影响该条目
+            copies, duplex = parse_print_options(copies, duplex)
+            printer = entry.get('printer') or pick_printer(entry.get('printers') or [])
+            if not printer:
+                raise Exception('没有可用的打印机' if entry.get('printers') else '未指定打印机')
+            if not allowed_file(filename):
+                raise Exception('文件类型不支持')
+            if archive is not None:
+                file = FileStorage(stream=io.BytesIO(archive.read(entry['file'])), filename=filename)
+            else:
+                file = request.files.get(entry.get('file'))
+                if file is None:
+                    raise Exception('文件不存在')
+                # 多个条目可以引用同一个文件字段
+                file.stream.seek(0)
+                file.filename = filename
+            result = submit_document(file, printer, copies, duplex, paper_size, quality, persist,
+                                     entry.get('direct_image'), entry.get('monochrome'),
+                                     entry.get('idempotency_key'))
+        except Exception as e:
+            result = {'success': False, 'message': f'打印失败: {str(e)}'}
+            log_print(filename, printer, copies, duplex, paper_size, quality, result['message'])
+        result['id'] = doc_id
+        result['printer'] = printer
+        results.append(result)
+
+    # wait > 0 时等待本批任务打印结束（最多 wait 秒），返回最终状态
+    job_ids = [r['job_id'] for r in results if r.get('job_id')]
+    if wait > 0 and job_ids:
+        print_queue.wait(job_ids, wait)
+        for r in results:
+            if r.get('job_id'):
+                job = print_queue.get(r['job_id'])
+                r['state'] = job['state']
+                r['message'] = job['message'] or r['message']
+                r['success'] = job['state'] not in ('failed', 'cancelled')
+
+    succeeded = len([r for r in results if r['success']])
+    return jsonify({
+        'success': succeeded > 0,
+        'message': f'共 {len(results)} 个文档，成功提交 {succeeded} 个',
+        'results': results,
+    })
+
 @app.route('/print_all', methods=['POST'])
 def print_all():
-    data = request.get_json()
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'message': '请求体必须是 JSON 对象'})
+    try:
+        data['copies'], data['duplex'] = parse_print_options(data.get('copies', 1), data.get('duplex', 1))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)})
     printer = data.get('printer')
     copies = data.get('copies', 1)
     duplex = data.get('duplex', 1)
     paper_size = data.get('paper_size', 'A4')
     quality = data.get('quality', 'normal')
     
-    if not PYMUPDF_AVAILABLE:
+    if get_backend().name == 'gdi' and not PYMUPDF_AVAILABLE:
         return jsonify({'success': False, 'message': 'PyMuPDF未安装，无法静默打印'})
     
     try:
         files = get_file_info()
-        printed_count = 0
-        failed_count = 0
+        queued_count = 0
         
         for file_info in files:
             if file_info['pdf_path'] and os.path.exists(file_info['pdf_path']):
-                try:
-                    silent_print_pdf(file_info['pdf_path'], printer, copies, duplex)
-                    log_print(file_info['name'], printer, copies, duplex, paper_size, quality, "静默批量打印成功")
-                    printed_count += 1
-                except Exception as e:
-                    log_print(file_info['name'], printer, copies, duplex, paper_size, quality, f"静默批量打印失败: {str(e)}")
-                    failed_count += 1
+                print_queue.submit(file_info['name'], file_info['pdf_path'], printer, copies, duplex, paper_size, quality)
+                queued_count += 1
         
-        if printed_count > 0:
-            message = f'静默批量打印完成，成功打印 {printed_count} 个文件'
-            if failed_count > 0:
-                message += f'，{failed_count} 个文件打印失败'
-            return jsonify({'success': True, 'message': message, 'printed_count': printed_count})
+        if queued_count > 0:
+            message = f'已将 {queued_count} 个文件加入打印队列'
+            return jsonify({'success': True, 'message': message, 'printed_count': queued_count})
         else:
             return jsonify({'success': False, 'message': '没有可打印的PDF文件'})
         
@@ -699,14 +2996,107 @@ def print_all():
 def get_files_api():
     return jsonify(get_file_info())
 
+@app.route('/api/conversions')
+def list_conversions_api():
+    return jsonify({'success': True, 'jobs': conversion_service.list(state=request.args.get('state'))})
+
+@app.route('/api/conversions/<job_id>')
+def get_conversion_api(job_id):
+    job = conversion_service.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/conversions/<job_id>/cancel', methods=['POST'])
+def cancel_conversion_api(job_id):
+    if conversion_service.cancel(job_id):
+        return jsonify({'success': True, 'message': '已取消'})
+    return jsonify({'success': False, 'message': '任务不存在、已结束或无法取消'})
+
+@app.route('/api/jobs')
+def list_jobs_api():
+    jobs = print_queue.list(state=request.args.get('state'), printer=request.args.get('printer'))
+    return jsonify({'success': True, 'jobs': jobs})
+
+@app.route('/api/jobs/<job_id>')
+def get_job_api(job_id):
+    job = print_queue.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    # backend=1 时附带系统打印队列中的状态（已提交给打印机之后的进度）
+    if request.args.get('backend') == '1' and job.get('backend_job_id'):
+        try:
+            job['backend_status'] = get_backend().job_status(job['printer'], job['backend_job_id'])
+        except Exception as e:
+            job['backend_status'] = {'state': 'unknown', 'message': str(e)}
+    return jsonify({'success': True, 'job': job})
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job_api(job_id):
+    if print_queue.cancel(job_id):
+        return jsonify({'success': True, 'message': '已取消'})
+    return jsonify({'success': False, 'message': '任务不存在或已开始打印'})
+
 @app.route('/api/printers')
 def get_printers_api():
-    # Refresh printers list
+    # 从内存快照返回，支持 ETag/If-None-Match；refresh=1 时触发后台刷新并等待片刻
+    if request.args.get('refresh') == '1':
+        printer_registry.ready.clear()
+        printer_registry.request_refresh()
+        printer_registry.ready.wait(5)
+    snapshot = printer_registry.snapshot()
+    resp = jsonify({
+        'success': True,
+        'printers': [p['name'] for p in snapshot['printers']],
+        'details': snapshot['printers'],
+        'updated_at': snapshot['updated_at'],
+    })
+    if snapshot['etag']:
+        resp.set_etag(snapshot['etag'])
+    return resp.make_conditional(request)
+
+@app.route('/api/printers/<path:printer_name>/capabilities')
+def get_printer_capabilities_api(printer_name):
     try:
-        printers = [p[2] for p in win32print.EnumPrinters(2)]
-    except Exception:
-        printers = PRINTERS
-    return jsonify({'success': True, 'printers': printers})
+        caps = get_backend().capabilities(printer_name, refresh=request.args.get('refresh') == '1')
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'获取打印机能力失败: {str(e)}'})
+    return jsonify({'success': True, 'backend': get_backend().name, 'capabilities': caps})
+
+@app.route('/api/printers/<path:printer_name>/status')
+def get_printer_status_api(printer_name):
+    status = None if request.args.get('refresh') == '1' else printer_registry.get(printer_name)
+    if status is None:
+        try:
+            status = get_backend().status(printer_name)
+        except Exception as e:
+            return jsonify({'success': False, 'message': f'获取打印机状态失败: {str(e)}'})
+    status.pop('name', None)
+    status['service_queue_length'] = print_queue.queue_length(printer_name)
+    return jsonify({'success': True, 'printer': printer_name, **status})
+
+@app.route('/api/printers/<path:printer_name>/settings', methods=['POST'])
+def update_printer_settings_api(printer_name):
+    data = request.get_json() or {}
+    values = {}
+    if 'mode' in data:
+        if data['mode'] not in PRINT_MODES:
+            return jsonify({'success': False, 'message': f'不支持的打印模式: {data["mode"]}'})
+        values['mode'] = data['mode']
+    if 'image_direct' in data:
+        values['image_direct'] = bool(data['image_direct'])
+    if 'monochrome' in data:
+        if data['monochrome'] not in MONOCHROME_MODES:
+            return jsonify({'success': False, 'message': f'不支持的黑白模式: {data["monochrome"]}'})
+        values['monochrome'] = data['monochrome']
+    if not values:
+        return jsonify({'success': False, 'message': '没有要修改的设置'})
+    settings = update_printer_settings(printer_name, values)
+    return jsonify({'success': True, 'settings': settings})
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({'success': False, 'message': f'文件过大，最大允许 {MAX_CONTENT_LENGTH // (1024 * 1024)}MB'}), 413
 
 @app.route('/heartbeat')
 def heartbeat():
@@ -780,11 +3170,85 @@ def delete_file():
     except Exception as e:
         return jsonify({'success': False, 'message': f'删除失败: {str(e)}'})
         
-def run_flask():
-    app.run(host='0.0.0.0', port=5000, debug=False)
+_server = None
+
+def run_flask(mode=None):
+    global _server
+    mode = mode or SERVER_MODE
+    if mode == 'waitress':
+        try:
+            from waitress import create_server
+        except ImportError:
+            print("警告: waitress未安装，退回Flask开发服务器。请运行: pip install waitress")
+            mode = 'dev'
+    
+    if mode == 'waitress':
+        _server = create_server(
+            app,
+            host=SERVER_HOST,
+            port=SERVER_PORT,
+            threads=SERVER_THREADS,
+            connection_limit=SERVER_CONNECTION_LIMIT,
+            backlog=SERVER_BACKLOG,
+            channel_timeout=SERVER_CHANNEL_TIMEOUT,
+            max_request_body_size=MAX_CONTENT_LENGTH,
+            ident='PrinterService',
+        )
+        print(f"waitress 已启动: {SERVER_THREADS} 个线程, 最大连接数 {SERVER_CONNECTION_LIMIT}")
+        mark_startup('server_ready')
+        _server_ready.set()
+        _server.run()
+    else:
+        mark_startup('server_ready')
+        _server_ready.set()
+        app.run(host=SERVER_HOST, port=SERVER_PORT, debug=False, threaded=True)
+
+PROFILED_MODULES = ('PIL.Image', 'PIL.ImageWin', 'reportlab.pdfgen.canvas', 'fitz', 'comtypes.client', 'pythoncom',
+                    'win32print', 'win32ui', 'win32con', 'win32gui', 'pystray', 'waitress')
+
+def report_startup_profile():
+    # 等服务就绪后输出启动各阶段耗时，再逐个加载延迟导入的模块并统计其导入耗时
+    _server_ready.wait()
+    time.sleep(0.5)
+    print("\n启动耗时分析:")
+    for name, elapsed in sorted(STARTUP_MARKS.items(), key=lambda item: item[1]):
+        print(f"  {name:<24} {elapsed * 1000:8.1f} ms")
+    for name in PROFILED_MODULES:
+        if name in IMPORT_TIMES or name in sys.modules:
+            continue
+        t0 = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            IMPORT_TIMES[name] = time.perf_counter() - t0
+        except Exception:
+            IMPORT_TIMES[name] = None
+    print("模块导入耗时（首次使用时加载）:")
+    for name, elapsed in sorted(IMPORT_TIMES.items(), key=lambda item: -(item[1] or 0)):
+        print(f"  {name:<24} {'不可用' if elapsed is None else f'{elapsed * 1000:8.1f} ms'}")
+
+def shutdown(timeout=None):
+    # 优雅退出：先停止接收新请求，再等待正在打印的任务结束；排队中的任务已持久化，重启后继续
+    if timeout is None:
+        timeout = SHUTDOWN_TIMEOUT
+    if _server is not None:
+        try:
+            _server.close()
+        except Exception:
+            pass
+    if presence_reporter is not None:
+        presence_reporter.stop()
+    if job_puller is not None:
+        job_puller.stop()
+    print_queue.stop()
+    if not print_queue.wait_idle(timeout):
+        print("等待打印任务结束超时，强制退出")
+    # 结束转换子进程和常驻的 Office 实例，否则 os._exit 后会成为孤儿进程
+    conversion_service.stop()
+    office_pool.shutdown()
 
 def on_quit(icon, item):
     icon.stop()
+    shutdown()
     os._exit(0)
 
 def on_toggle_autostart(icon, item):
@@ -795,7 +3259,7 @@ def on_toggle_autostart(icon, item):
 def build_menu(icon):
     autostart = get_autostart()
     ip = get_local_ip()
-    port = 5000
+    port = SERVER_PORT
     return pystray.Menu(
         pystray.MenuItem(f'服务地址: {ip}:{port}', None, enabled=False),
         pystray.MenuItem('开机自启：' + ('已开启' if autostart else '未开启'), on_toggle_autostart),
@@ -808,10 +3272,24 @@ def setup_tray():
     icon.menu = build_menu(icon)
     icon.run()
 
+mark_startup('module_loaded')
+
 if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    import argparse
+    parser = argparse.ArgumentParser(description='内网打印服务')
+    parser.add_argument('--server', choices=('waitress', 'dev'), default=SERVER_MODE,
+                        help='HTTP 服务器：waitress（生产）或 dev（Flask 开发服务器）')
+    parser.add_argument('--headless', action='store_true',
+                        help='不显示托盘图标，在前台运行（Linux 打印主机、CI 压测）')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='输出启动各阶段及各模块导入耗时')
+    args = parser.parse_args()
+    
     print("正在启动内网打印服务...")
     print(f"本机IP: {get_local_ip()}")
-    print(f"服务端口: 5000")
+    print(f"服务端口: {SERVER_PORT}")
+    print(f"打印后端: {get_backend().name}")
     print(f"转换库状态:")
     print(f"  PyMuPDF: {'可用' if PYMUPDF_AVAILABLE else '未安装 - 静默打印功能不可用'}")
     print(f"  Office COM: {'可用' if OFFICE_AVAILABLE else '未安装Office'}")
@@ -829,7 +3307,32 @@ if __name__ == '__main__':
     
     pdf_cleaner_thread = threading.Thread(target=lambda: clean_old_files(PDF_FOLDER), daemon=True)
     pdf_cleaner_thread.start()
-    
-    flask_thread = threading.Thread(target=run_flask, daemon=True)
-    flask_thread.start()
-    setup_tray()
+
+    # 清理上次运行遗留的转换临时文件
+    threading.Thread(target=conversion_cache.evict, daemon=True).start()
+
+    print_queue.start()
+    conversion_service.start()
+    printer_registry.start()
+    if presence_reporter is not None:
+        presence_reporter.start()
+    if job_puller is not None:
+        job_puller.start()
+    if args.profile_startup:
+        threading.Thread(target=report_startup_profile, daemon=True).start()
+
+    if args.headless or not TRAY_AVAILABLE:
+        import signal
+        signal.signal(signal.SIGTERM, lambda signum, frame: (shutdown(), os._exit(0)))
+        try:
+            run_flask(args.server)
+        except KeyboardInterrupt:
+            shutdown()
+    else:
+        flask_thread = threading.Thread(target=run_flask, args=(args.server,), daemon=True)
+        flask_thread.start()
+        try:
+            setup_tray()
+        except Exception as e:
+            print(f"托盘图标启动失败，转为前台运行: {e}")
+            flask_thread.join()
@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# 测试使用虚拟打印机和进程内渲染，不需要真实打印机和 Windows 环境；必须在导入 print_server 之前设置
+os.environ.setdefault('PRINTER_BACKEND', 'virtual')
+os.environ.setdefault('RENDER_PROCESSES', '0')
+os.environ.setdefault('VIRTUAL_PRINTER_LATENCY_MS', '0')
+os.environ.setdefault('VIRTUAL_PRINTER_PAGE_MS', '0')
+os.environ.setdefault('VIRTUAL_SPOOL_FOLDER', tempfile.mkdtemp(prefix='virtual_spool_'))
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import print_server  # noqa: E402
+
+
+@pytest.fixture
+def ps():
+    return print_server
+
+
+@pytest.fixture
+def queue(ps, tmp_path, monkeypatch):
+    # 每个测试使用独立的打印队列和目录，不读写服务目录下的任务和日志
+    monkeypatch.setattr(ps, 'LOG_FILE', str(tmp_path / 'print_log.txt'))
+    monkeypatch.setattr(ps, 'PDF_FOLDER', str(tmp_path))
+    monkeypatch.setattr(ps, 'UPLOAD_FOLDER', str(tmp_path))
+    job_queue = ps.PrintJobQueue(str(tmp_path / 'jobs'), workers=2)
+    os.makedirs(job_queue.job_folder)
+    job_queue.start()
+    monkeypatch.setattr(ps, 'print_queue', job_queue)
+    yield job_queue
+    job_queue.stop()
+    job_queue.wait_idle(5)
+
+
+@pytest.fixture
+def make_pdf(ps):
+    def make(pages=1, text=None):
+        doc = ps.fitz.open()
+        for index in range(pages):
+            page = doc.new_page()
+            page.insert_text((72, 72), text or f'page {index + 1}')
+        data = doc.tobytes()
+        doc.close()
+        return data
+    return make
+
+
+@pytest.fixture
+def client(ps, queue):
+    return ps.app.test_client()
+
+
+@pytest.fixture
+def slow_printer(ps, monkeypatch):
+    # 虚拟打印机每份耗时 300 毫秒，便于观察排队中和打印中的状态
+    monkeypatch.setattr(ps.get_backend(), 'latency_ms', 300)
+
+
+@pytest.fixture
+def conversions(ps, queue, tmp_path, monkeypatch):
+    cache = ps.ConversionCache(str(tmp_path / 'cache'), ps.CONVERT_CACHE_MAX_BYTES)
+    os.makedirs(cache.folder)
+    monkeypatch.setattr(ps, 'conversion_cache', cache)
+    service = ps.ConversionService({'image': 1, 'text': 1, 'office': 1}, timeout=2)
+    service.start()
+    monkeypatch.setattr(ps, 'conversion_service', service)
+    yield service
+    service.stop()
@@ -0,0 +1,83 @@
+import io
+import multiprocessing
+import os
+import time
+
+import pytest
+
+# 转换子进程继承测试中替换的 convert_to_pdf，依赖 fork 启动方式
+needs_fork = pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason='需要 fork 启动子进程')
+
+
+def wait_finished(ps, service, job_id, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = service.get(job_id)
+        if job['state'] in ps.ConversionService.FINISHED_STATES:
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"转换任务未结束: {service.get(job_id)}")
+
+
+def write_text(tmp_path, name='notes.txt', text='第一行\nsecond line\n'):
+    path = tmp_path / name
+    path.write_text(text, encoding='utf-8')
+    return str(path)
+
+
+def slow_convert(*args):
+    time.sleep(30)
+
+
+def test_text_converts_in_child_process(ps, conversions, tmp_path):
+    job = conversions.submit(write_text(tmp_path))
+    job = wait_finished(ps, conversions, job['id'])
+    assert job['state'] == 'done'
+    assert os.path.exists(job['pdf_path'])
+    with ps.fitz.open(job['pdf_path']) as doc:
+        assert 'second line' in doc[0].get_text()
+
+
+def test_upload_converts_then_prints(ps, client, conversions, queue):
+    result = client.post('/api/print', data={
+        'file': (io.BytesIO('hello\n'.encode('utf-8')), 'hello.txt'), 'printer': 'Virtual-1'}).get_json()
+    assert result['success'] and result['conversion_job_id']
+
+    wait_finished(ps, conversions, result['conversion_job_id'])
+    print_job_id = conversions.get(result['conversion_job_id'])['print_job_id']
+    assert print_job_id and queue.wait([print_job_id], 5)
+    assert queue.get(print_job_id)['state'] == 'done'
+
+
+@needs_fork
+def test_timeout_kills_child_and_next_job_runs(ps, conversions, tmp_path, monkeypatch):
+    convert_to_pdf = ps.convert_to_pdf
+    monkeypatch.setattr(ps, 'convert_to_pdf', slow_convert)
+    slow = conversions.submit(write_text(tmp_path, 'slow.txt'))
+    while conversions.get(slow['id'])['state'] == 'queued':
+        time.sleep(0.05)
+    # 之后启动的子进程恢复正常转换
+    monkeypatch.setattr(ps, 'convert_to_pdf', convert_to_pdf)
+    fast = conversions.submit(write_text(tmp_path, 'fast.txt'))
+
+    assert wait_finished(ps, conversions, slow['id'])['state'] == 'timeout'
+    assert wait_finished(ps, conversions, fast['id'])['state'] == 'done'
+    assert sum(1 for proc in conversions.procs if proc.is_alive()) <= 1
+
+
+@needs_fork
+def test_cancel_converting_job(ps, conversions, tmp_path, monkeypatch):
+    monkeypatch.setattr(ps, 'convert_to_pdf', slow_convert)
+    job = conversions.submit(write_text(tmp_path))
+    while conversions.get(job['id'])['state'] == 'queued':
+        time.sleep(0.05)
+    assert conversions.cancel(job['id'])
+    assert wait_finished(ps, conversions, job['id'], timeout=3)['state'] == 'cancelled'
+
+
+def test_queued_job_cancels_immediately(ps, conversions, tmp_path):
+    # 分发线程已停止时任务保持排队状态，取消立即生效，不经过子进程
+    conversions.stopping = True
+    job = conversions.submit(write_text(tmp_path))
+    assert conversions.cancel(job['id'])
+    assert conversions.get(job['id'])['state'] == 'cancelled'
@@ -0,0 +1,69 @@
+import pytest
+
+
+@pytest.fixture
+def fonts(ps):
+    # 不注册任何字体文件：西文使用 reportlab 内置字体，中文使用内置 CID 字体
+    return ps.FontRegistry([])
+
+
+def test_short_line_is_not_split(fonts):
+    assert list(fonts.wrap('hello', 100, 'Courier', 10)) == ['hello']
+    assert list(fonts.wrap('', 100, 'Courier', 10)) == ['']
+    # Courier 每个字符宽 0.6 倍字号，正好放满时不折行
+    assert list(fonts.wrap('x' * 10, 60, 'Courier', 10)) == ['x' * 10]
+
+
+def test_long_line_splits_at_width(fonts):
+    assert list(fonts.wrap('abcdefghijklmnopqrstuvw', 60, 'Courier', 10)) == ['abcdefghij', 'klmnopqrst', 'uvw']
+
+
+def test_proportional_font_fills_each_line(fonts):
+    line = 'The quick brown fox jumps over the lazy dog. ' * 5
+    segments = list(fonts.wrap(line, 150, 'Helvetica', 10))
+
+    assert ''.join(segments) == line
+    for segment, following in zip(segments, segments[1:]):
+        assert fonts.string_width(segment, 'Helvetica', 10) <= 150
+        assert fonts.string_width(segment + following[0], 'Helvetica', 10) > 150
+
+
+def test_character_wider_than_line(fonts):
+    assert list(fonts.wrap('WWW', 5, 'Helvetica', 10)) == ['W', 'W', 'W']
+
+
+def test_cjk_text_wraps_by_full_width_characters(fonts):
+    font = fonts.cjk_font()
+    assert font == 'STSong-Light'
+    line = '打印服务' * 6
+    segments = list(fonts.wrap(line, 95, font, 10))
+    assert segments[0] == line[:9]
+    assert ''.join(segments) == line
+    assert [len(s) for s in segments] == [9, 9, 6]
+
+
+def test_widths_are_cached_per_font_and_size(fonts):
+    list(fonts.wrap('abc' * 50, 50, 'Courier', 10))
+    table = fonts.widths[('Courier', 10)]
+    assert set(table) == set('abc')
+    assert fonts.char_widths('Courier', 10, 'ab') is table
+    assert ('Courier', 12) not in fonts.widths
+
+
+def test_failed_registration_is_remembered(fonts):
+    assert not fonts.register('Missing', '/nonexistent/font.ttf')
+    assert fonts.registered == {'Missing': False}
+    assert not fonts.register('Missing', '/nonexistent/font.ttf')
+
+
+def test_text_conversion_wraps_long_lines(ps, tmp_path, monkeypatch):
+    monkeypatch.setattr(ps, 'font_registry', ps.FontRegistry([]))
+    source = tmp_path / 'long.txt'
+    source.write_text('word ' * 200 + '\n短行\n', encoding='utf-8')
+    output = tmp_path / 'long.pdf'
+
+    assert ps.convert_text_to_pdf(str(source), str(output))
+    with ps.fitz.open(str(output)) as doc:
+        text = doc[0].get_text()
+    assert text.count('\n') > 5
+    assert '短行' in text
@@ -0,0 +1,86 @@
+import glob
+import io
+import os
+
+import pytest
+from PIL import Image
+
+# 与虚拟打印机相同的设备参数：203 dpi 标签打印机，可打印区域 812x1218 像素
+DEVICE = {'area': (812, 1218), 'margins': (10, 20), 'dpi': (203, 203)}
+
+
+def assert_size(img, size):
+    # 缩放比例按浮点计算后取整，允许 1 像素误差
+    assert abs(img.width - size[0]) <= 1 and abs(img.height - size[1]) <= 1, img.size
+
+
+def open_image(img, fmt='PNG', **save_args):
+    buffer = io.BytesIO()
+    img.save(buffer, fmt, **save_args)
+    buffer.seek(0)
+    return Image.open(buffer)
+
+
+def test_image_without_dpi_fills_printable_area(ps):
+    img, rect = ps.fit_image_to_device(open_image(Image.new('RGB', (400, 200), 'red')), DEVICE)
+    assert_size(img, (812, 406))
+    # 居中并加上物理边距
+    assert rect == (10, (1218 - img.height) // 2 + 20, 10 + img.width, (1218 - img.height) // 2 + 20 + img.height)
+
+
+def test_image_with_dpi_prints_at_actual_size(ps):
+    # 2 x 1 英寸
+    img, rect = ps.fit_image_to_device(open_image(Image.new('RGB', (200, 100)), dpi=(100, 100)), DEVICE)
+    assert img.size == (406, 203)
+    assert rect[2] - rect[0] == 406
+
+
+def test_oversized_image_with_dpi_is_reduced(ps):
+    # 10 x 5 英寸，超出 4 x 6 英寸的可打印区域
+    img, _rect = ps.fit_image_to_device(open_image(Image.new('RGB', (1000, 500)), dpi=(100, 100)), DEVICE)
+    assert_size(img, (812, 406))
+
+
+def test_exif_rotation_keeps_portrait(ps):
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    frame = open_image(Image.new('RGB', (300, 200)), 'JPEG', exif=exif)
+    img, _rect = ps.fit_image_to_device(frame, DEVICE)
+    # JPEG 默认记录 72 dpi，按实际尺寸打印：旋转后为 200x300 像素
+    assert_size(img, (200 / 72 * 203, 300 / 72 * 203))
+
+
+@pytest.mark.parametrize('mode, expected', [('none', 'RGB'), ('threshold', '1'), ('dither', '1')])
+def test_monochrome_modes(ps, mode, expected):
+    gradient = Image.linear_gradient('L').convert('RGB')
+    img, _rect = ps.fit_image_to_device(open_image(gradient), DEVICE, mode)
+    assert img.mode == expected
+    if mode == 'threshold':
+        histogram = img.convert('L').histogram()
+        assert {value for value, count in enumerate(histogram) if count} == {0, 255}
+
+
+def test_bilevel_image_stays_bilevel(ps):
+    img, _rect = ps.fit_image_to_device(open_image(Image.new('1', (100, 150), 1)), DEVICE)
+    assert img.mode == '1'
+    assert_size(img, (812, 1218))
+
+
+def test_direct_image_print_outputs_one_page_per_frame(ps, client, queue):
+    frames = [Image.new('RGB', (120, 80), color) for color in ('red', 'green', 'blue')]
+    buffer = io.BytesIO()
+    frames[0].save(buffer, 'TIFF', save_all=True, append_images=frames[1:])
+    result = client.post('/api/print', data={
+        'file': (io.BytesIO(buffer.getvalue()), 'label.tiff'), 'printer': 'Virtual-2',
+        'direct_image': '1', 'monochrome': 'threshold', 'copies': '2'}).get_json()
+    assert result['success']
+
+    assert queue.wait([result['job_id']], 5)
+    job = queue.get(result['job_id'])
+    assert job['state'] == 'done' and job['kind'] == 'image' and job['monochrome'] == 'threshold'
+    folder = os.path.join(ps.VIRTUAL_SPOOL_FOLDER, 'Virtual-2')
+    pages = sorted(glob.glob(os.path.join(folder, f"*_{job['backend_job_id']}_x2_*.png")))
+    assert len(pages) == 3
+    with Image.open(pages[0]) as page:
+        assert page.mode == '1'
+        assert_size(page, (812, 541))
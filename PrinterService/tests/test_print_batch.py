@@ -0,0 +1,81 @@
+import io
+import json
+import zipfile
+
+
+def post_batch(client, manifest, files=None, **form):
+    data = dict(form, manifest=json.dumps(manifest))
+    for field, (content, filename) in (files or {}).items():
+        data[field] = (io.BytesIO(content), filename)
+    return client.post('/api/print_batch', data=data).get_json()
+
+
+def test_entry_errors_do_not_affect_other_entries(client, queue, make_pdf):
+    pdf = make_pdf()
+    result = post_batch(client, [
+        {'id': 'ok', 'file': 'f1', 'filename': 'a.pdf', 'printer': 'Virtual-1'},
+        {'id': 'copies', 'file': 'f1', 'filename': 'b.pdf', 'printer': 'Virtual-1', 'copies': 0},
+        {'id': 'type', 'file': 'f1', 'filename': 'c.exe', 'printer': 'Virtual-1'},
+        {'id': 'missing', 'file': 'nope', 'filename': 'd.pdf', 'printer': 'Virtual-1'},
+        {'id': 'printer', 'file': 'f1', 'filename': 'e.pdf'},
+        'not an entry',
+        {'id': 'offline', 'file': 'f1', 'filename': 'f.pdf', 'printer': 'No-Such-Printer'},
+    ], files={'f1': (pdf, 'a.pdf')}, wait='5')
+
+    assert result['success']
+    by_id = {r['id']: r for r in result['results']}
+    assert by_id['ok']['success'] and by_id['ok']['state'] == 'done'
+    assert '份数超出范围' in by_id['copies']['message']
+    assert '文件类型不支持' in by_id['type']['message']
+    assert '文件不存在' in by_id['missing']['message']
+    assert '未指定打印机' in by_id['printer']['message']
+    assert '清单条目格式错误' in by_id[5]['message']
+    # 提交成功但打印失败的条目在等待后返回最终状态
+    assert not by_id['offline']['success'] and by_id['offline']['state'] == 'failed'
+    assert [r['success'] for r in result['results']] == [True, False, False, False, False, False, False]
+    assert len(queue.list()) == 2
+
+
+def test_invalid_manifest(client, queue):
+    assert not client.post('/api/print_batch', data={'manifest': '{'}).get_json()['success']
+    assert client.post('/api/print_batch', data={'manifest': '[]'}).get_json()['message'] == '清单为空'
+    assert not post_batch(client, [{'file': 'f', 'printer': 'Virtual-1'}], wait='soon')['success']
+    assert queue.list() == []
+
+
+def test_archive_manifest(client, queue, make_pdf):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('one.pdf', make_pdf(1))
+        archive.writestr('two.pdf', make_pdf(2))
+        archive.writestr('manifest.json', json.dumps([
+            {'id': 1, 'file': 'one.pdf', 'printer': 'Virtual-1'},
+            {'id': 2, 'file': 'two.pdf', 'printer': 'Virtual-2', 'copies': 2},
+        ]))
+    result = client.post('/api/print_batch', data={
+        'archive': (io.BytesIO(buffer.getvalue()), 'batch.zip'), 'wait': '5'}).get_json()
+
+    assert [(r['id'], r['printer'], r['state']) for r in result['results']] == [
+        (1, 'Virtual-1', 'done'), (2, 'Virtual-2', 'done')]
+
+
+def test_printer_group_skips_unavailable_printers(ps, client, queue, make_pdf, monkeypatch):
+    status = {'Virtual-1': 'paused', 'Virtual-2': 'online'}
+    monkeypatch.setattr(ps.printer_registry, 'get',
+                        lambda name: {'name': name, 'status': status[name], 'queue_length': 0})
+    manifest = [{'id': 1, 'file': 'f', 'filename': 'a.pdf', 'printers': ['Virtual-1', 'Virtual-2']}]
+
+    result = post_batch(client, manifest, files={'f': (make_pdf(), 'a.pdf')})
+    assert result['results'][0]['printer'] == 'Virtual-2'
+
+    status['Virtual-2'] = 'offline'
+    result = post_batch(client, manifest, files={'f': (make_pdf(), 'a.pdf')})
+    assert result['results'][0]['message'] == '打印失败: 没有可用的打印机'
+
+
+def test_idempotency_keys_in_batch(client, queue, make_pdf):
+    manifest = [{'id': 1, 'file': 'f', 'filename': 'a.pdf', 'printer': 'Virtual-1', 'idempotency_key': 'job7-doc0'}]
+    first = post_batch(client, manifest, files={'f': (make_pdf(), 'a.pdf')})['results'][0]
+    second = post_batch(client, manifest, files={'f': (make_pdf(), 'a.pdf')})['results'][0]
+    assert second['duplicate'] and second['job_id'] == first['job_id']
+    assert len(queue.list()) == 1
@@ -0,0 +1,92 @@
+import io
+import os
+import time
+
+
+def post_pdf(client, pdf, printer='Virtual-1', **form):
+    return client.post('/api/print', data=dict(form, file=(io.BytesIO(pdf), 'doc.pdf'), printer=printer)).get_json()
+
+
+def wait_state(queue, job_id, states, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job['state'] in states:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"任务 {job_id} 未进入 {states}: {queue.get(job_id)}")
+
+
+def test_job_runs_to_done(ps, client, queue, make_pdf):
+    result = post_pdf(client, make_pdf(), copies='2')
+    assert result['success'] and result['state'] == 'queued'
+
+    assert queue.wait([result['job_id']], 5)
+    job = queue.get(result['job_id'])
+    assert job['state'] == 'done' and job['mode'] == 'virtual'
+    assert job['started_at'] and job['finished_at']
+    assert ps.get_backend().job_status('Virtual-1', job['backend_job_id']) == {'state': 'done'}
+    # 内存中的打印数据用完即释放
+    assert result['job_id'] not in queue.payloads
+
+
+def test_unknown_printer_fails(client, queue, make_pdf):
+    result = post_pdf(client, make_pdf(), printer='No-Such-Printer')
+    assert queue.wait([result['job_id']], 5)
+    job = queue.get(result['job_id'])
+    assert job['state'] == 'failed'
+    assert '打印机不存在' in job['message']
+
+
+def test_jobs_on_one_printer_run_in_order_and_can_be_cancelled(client, queue, make_pdf, slow_printer):
+    first = post_pdf(client, make_pdf())['job_id']
+    second = post_pdf(client, make_pdf())['job_id']
+    third = post_pdf(client, make_pdf())['job_id']
+
+    wait_state(queue, first, ('printing',))
+    assert queue.get(second)['state'] == 'queued'
+    assert client.post(f'/api/jobs/{second}/cancel').get_json()['success']
+    # 正在打印的任务不能取消
+    assert not client.post(f'/api/jobs/{first}/cancel').get_json()['success']
+
+    assert queue.wait([first, second, third], 5)
+    assert [queue.get(j)['state'] for j in (first, second, third)] == ['done', 'cancelled', 'done']
+    assert queue.get(first)['finished_at'] <= queue.get(third)['started_at']
+
+
+def test_printers_run_in_parallel(client, queue, make_pdf, slow_printer):
+    first = post_pdf(client, make_pdf(), printer='Virtual-1')['job_id']
+    second = post_pdf(client, make_pdf(), printer='Virtual-2')['job_id']
+    wait_state(queue, first, ('printing',))
+    wait_state(queue, second, ('printing',))
+    assert queue.wait([first, second], 5)
+
+
+def test_worker_survives_logging_errors(ps, client, queue, make_pdf, monkeypatch):
+    def broken_log(*args):
+        raise OSError('disk full')
+    monkeypatch.setattr(ps, 'log_print', broken_log)
+
+    job_ids = [post_pdf(client, make_pdf())['job_id'] for _ in range(3)]
+    assert queue.wait(job_ids, 5)
+    assert [queue.get(j)['state'] for j in job_ids] == ['done'] * 3
+
+
+def test_finished_jobs_are_persisted(queue, client, make_pdf):
+    job_id = post_pdf(client, make_pdf())['job_id']
+    assert queue.wait([job_id], 5)
+    assert os.path.exists(os.path.join(queue.job_folder, f'{job_id}.json'))
+
+
+def test_idempotency_key_returns_existing_job(client, queue, make_pdf):
+    first = post_pdf(client, make_pdf(), idempotency_key='order-1')
+    second = post_pdf(client, make_pdf(), idempotency_key='order-1')
+    assert second['duplicate'] and second['job_id'] == first['job_id']
+    assert len(queue.list()) == 1
+
+
+def test_invalid_options_are_rejected(client, queue, make_pdf):
+    assert not post_pdf(client, make_pdf(), copies='0')['success']
+    assert not post_pdf(client, make_pdf(), duplex='9')['success']
+    assert not post_pdf(client, make_pdf(), copies='x')['success']
+    assert queue.list() == []
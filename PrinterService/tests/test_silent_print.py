@@ -0,0 +1,87 @@
+import pytest
+
+
+class FakeWin32Print:
+    # 只提供 silent_print_pdf 用到的接口：没有 DEVMODE，份数由程序逐份提交
+    def OpenPrinter(self, name):
+        return name
+
+    def ClosePrinter(self, handle):
+        pass
+
+    def GetPrinter(self, handle, level):
+        return {'pDevMode': None}
+
+
+class FakeDC:
+    def __init__(self):
+        self.docs = 0
+        self.pages = 0
+        self.draws = []
+
+    def StartDoc(self, name):
+        self.docs += 1
+        return self.docs
+
+    def EndDoc(self):
+        pass
+
+    def StartPage(self):
+        self.pages += 1
+
+    def EndPage(self):
+        pass
+
+    def GetHandleOutput(self):
+        return None
+
+    def DeleteDC(self):
+        pass
+
+
+class FakeDib:
+    def __init__(self, dc, raster):
+        self.dc = dc
+        self.raster = raster
+
+    def draw(self, handle, rect):
+        self.dc.draws.append(id(self))
+
+
+@pytest.fixture
+def gdi(ps, monkeypatch):
+    dc = FakeDC()
+    rendered = []
+    rasterize_page = ps.rasterize_page
+
+    def counting_rasterize(page, device):
+        rendered.append(page.number)
+        return rasterize_page(page, device)
+
+    monkeypatch.setattr(ps, 'win32print', FakeWin32Print())
+    monkeypatch.setattr(ps, 'create_printer_dc', lambda name, devmode=None: dc)
+    monkeypatch.setattr(ps, 'get_device_geometry',
+                        lambda hdc: {'area': (1000, 1400), 'margins': (0, 0), 'dpi': (120, 120)})
+    monkeypatch.setattr(ps, 'rasterize_page', counting_rasterize)
+    monkeypatch.setattr(ps, 'make_dib', lambda raster: FakeDib(dc, raster))
+    return dc, rendered
+
+
+def test_copies_rasterize_each_page_once(ps, gdi, make_pdf):
+    dc, rendered = gdi
+    job_id = ps.silent_print_pdf(make_pdf(pages=3), 'Printer', copies=4)
+
+    assert sorted(rendered) == [0, 1, 2]
+    assert dc.docs == 4 and job_id == 4
+    assert dc.pages == 12
+    # 每份绘制的是同一批位图
+    assert dc.draws[:3] * 4 == dc.draws
+
+
+def test_copies_rerender_when_cache_is_full(ps, gdi, make_pdf, monkeypatch):
+    dc, rendered = gdi
+    monkeypatch.setattr(ps, 'RENDER_CACHE_MAX_BYTES', 0)
+    ps.silent_print_pdf(make_pdf(pages=2), 'Printer', copies=3)
+
+    assert sorted(rendered) == [0, 0, 0, 1, 1, 1]
+    assert dc.pages == 6
@@ -19,6 +19,9 @@
         'security/ir.model.access.csv',
         'data/ir_cron.xml',
         'views/print_server_views.xml',
+        'views/print_job_views.xml',
+        'views/printer_pool_views.xml',
+        'views/ir_actions_report_views.xml',
         'wizard/print_to_server_wizard_views.xml',
     ],
     'installable': True,
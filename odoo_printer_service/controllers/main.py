@@ -0,0 +1,73 @@
+from odoo import http
+from odoo.http import request
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# 拉取任务时单次请求的最大批量
+PULL_MAX_BATCH = 50
+
+class PrinterServiceController(http.Controller):
+    """
+    打印服务主动上报接口
+    PrinterService 使用打印服务器记录中生成的令牌推送心跳、打印机清单和队列深度。
+    """
+
+    def _authenticate(self):
+        """
+        根据 Authorization 请求头中的令牌查找打印服务器
+        :return: (打印服务器记录, 错误响应)
+        """
+        auth = request.httprequest.headers.get('Authorization', '')
+        token = auth[7:].strip() if auth.startswith('Bearer ') else ''
+        if not token:
+            return None, request.make_json_response({'success': False, 'message': 'Missing token'}, status=401)
+
+        server = request.env['printer.server'].sudo().search([('push_token', '=', token)], limit=1)
+        if not server:
+            return None, request.make_json_response({'success': False, 'message': 'Invalid token'}, status=403)
+        return server, None
+
+    @http.route('/printer_service/presence', type='http', auth='none', methods=['POST'], csrf=False)
+    def presence(self, **kwargs):
+        """
+        接收打印服务的心跳上报
+        请求头: Authorization: Bearer <令牌>
+        请求体: {'status': 'ok'|'stopping', 'hostname': ..., 'queue_length': ..., 'etag': ..., 'printers': 可选}
+        """
+        server, error = self._authenticate()
+        if error:
+            return error
+
+        try:
+            payload = json.loads(request.httprequest.get_data() or b'{}')
+            result = server._receive_presence(payload)
+        except Exception as e:
+            _logger.error(f"Failed to process presence from {server.name}: {e}")
+            return request.make_json_response({'success': False, 'message': str(e)}, status=400)
+        return request.make_json_response(result)
+
+    @http.route('/printer_service/jobs', type='http', auth='none', methods=['POST'], csrf=False)
+    def jobs(self, **kwargs):
+        """
+        打印服务定期领取打印任务
+        请求体: {'acks': [{'id': 任务 ID, 'success': bool, 'message': ...}], 'in_flight': [仍在打印的任务 ID], 'limit': 批量}
+        先处理上一批任务的完成回执并为仍在打印的任务续租，再领取新任务。
+        没有任务时立即返回，不占用 HTTP worker 等待，由打印服务退避后再次请求。
+        """
+        server, error = self._authenticate()
+        if error:
+            return error
+
+        try:
+            payload = json.loads(request.httprequest.get_data() or b'{}')
+            server._ack_pull_jobs(payload.get('acks') or [])
+            server._renew_pull_leases(payload.get('in_flight') or [])
+
+            limit = max(1, min(int(payload.get('limit', 20)), PULL_MAX_BATCH))
+            jobs = server._claim_pull_jobs(limit)
+        except Exception as e:
+            _logger.error(f"Failed to deliver jobs to {server.name}: {e}")
+            return request.make_json_response({'success': False, 'message': str(e)}, status=400)
+        return request.make_json_response({'success': True, 'jobs': jobs})
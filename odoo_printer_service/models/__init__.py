@@ -1,2 +1,4 @@
 from . import print_server
 from . import ir_actions_report
+from . import print_job
+from . import printer_pool
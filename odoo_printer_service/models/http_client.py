@@ -0,0 +1,76 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 按服务器地址复用的 HTTP 会话，同一 Odoo 进程内的所有请求共享连接池（keep-alive）
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# 只对幂等请求重试读超时和网关错误；连接失败时请求尚未发出，任何方法都可以安全重试
+RETRY_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+RETRY_STATUS = (502, 503, 504)
+
+
+def get_session(base_url, max_connections=4, max_retries=2, backoff=0.3):
+    """
+    获取指定服务器的共享会话
+    :param base_url: 服务器地址，作为连接池的键
+    :param max_connections: 到该服务器的最大并发连接数，超出时等待空闲连接
+    :param max_retries: 重试次数
+    :param backoff: 重试退避系数（秒），第 n 次重试前等待 backoff * 2^(n-1)
+    """
+    key = base_url.rstrip('/')
+    config = (max_connections, max_retries, backoff)
+    with _sessions_lock:
+        entry = _sessions.get(key)
+        if entry and entry[0] == config:
+            return entry[1]
+
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            status=max_retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=RETRY_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections, pool_block=True, max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if entry:
+            # 配置已修改，关闭旧连接池
+            entry[1].close()
+        _sessions[key] = (config, session)
+        return session
+
+
+def request(params, method, path, read_timeout=None, **kwargs):
+    """
+    通过共享会话发送请求，不依赖 ORM，可在线程池中调用
+    :param params: 连接参数，见 printer.server._connection_params
+    :param read_timeout: 读超时，默认使用 params 中的配置
+    """
+    session = get_session(params['url'], params['max_connections'], params['max_retries'])
+    timeout = (params['connect_timeout'], read_timeout or params['read_timeout'])
+    return session.request(method, f"{params['url'].rstrip('/')}{path}", timeout=timeout, **kwargs)
+
+
+def check_heartbeat(params, read_timeout=2):
+    """
+    检测打印服务器心跳
+    只发送一次短超时请求，不经过带重试的共享会话，离线主机不会长时间占用巡检线程
+    :return: (是否在线, 耗时毫秒)
+    """
+    start = time.monotonic()
+    try:
+        response = requests.get(f"{params['url'].rstrip('/')}/heartbeat",
+                                timeout=(min(params['connect_timeout'], read_timeout), read_timeout))
+        online = response.status_code == 200 and response.json().get('status') == 'ok'
+    except Exception:
+        online = False
+    return online, (time.monotonic() - start) * 1000
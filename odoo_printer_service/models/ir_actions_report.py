@@ -1,5 +1,10 @@
-from odoo import models, api, _
+from odoo import models, fields, api, _
 from odoo.exceptions import UserError
+import codecs
+import re
+
+# ESC/POS 指令含控制字符，XML 模板中无法直接书写，模板中用 \xNN 表示，发送前还原为字节
+ESCAPED_BYTE = re.compile(rb'\\x([0-9a-fA-F]{2})')
 
 class IrActionsReport(models.Model):
     """
@@ -8,14 +13,29 @@ class IrActionsReport(models.Model):
     """
     _inherit = 'ir.actions.report'
 
-    def action_print_to_server(self, res_ids, printer_id, copies=1):
+    # 发送到打印服务器的格式：PDF，或由 QWeb 模板直接生成的打印机语言（原样发送，不经过 PDF 和栅格化）
+    server_print_format = fields.Selection([
+        ('pdf', 'PDF'),
+        ('zpl', 'ZPL (Zebra)'),
+        ('epl', 'EPL (Eltron)'),
+        ('escpos', 'ESC/POS')
+    ], string='Print Server Format', default='pdf', required=True,
+        help="Raw formats render the QWeb template as printer commands instead of a PDF. "
+             "In ESC/POS templates, write control bytes as \\xNN.")
+    # 打印机语言的文本编码，小票打印机的中文通常需要 gbk
+    server_print_encoding = fields.Char(string='Print Server Encoding', default='utf-8')
+
+    def action_print_to_server(self, res_ids, printer_id, copies=1, pool_id=None):
         """
         生成 PDF 并发送到打印服务器
         :param res_ids: 要打印的记录 ID 列表
         :param printer_id: 目标打印机 ID (printer.server.printer)
         :param copies: 份数
+        :param pool_id: 可选，未指定打印机时从该打印机池中按路由策略选择
         """
         self.ensure_one()
+        if not printer_id and pool_id:
+            printer_id = self.env['printer.server.pool'].browse(pool_id)._select_printer().id
         if not printer_id:
             raise UserError(_("No printer selected."))
             
@@ -24,12 +44,11 @@ class IrActionsReport(models.Model):
              raise UserError(_("Selected printer not found."))
 
         try:
-            # 1. 生成 PDF 内容
-            # _render_qweb_pdf 返回 (pdf_content, content_type)
-            content, _content_type = self._render_qweb_pdf(res_ids)
+            # 1. 生成 PDF 或打印机语言内容
+            content = self._render_server_content(res_ids)
             
-            # 2. 生成文件名
-            filename = f"{self.name}_{len(res_ids)}_records.pdf"
+            # 2. 生成文件名，打印服务器按扩展名决定是否原样发送
+            filename = f"{self.name}_{len(res_ids)}_records.{self.server_print_format}"
             
             # 3. 调用打印机模型的打印方法
             printer.action_print_file(content, filename, copies=copies)
@@ -47,3 +66,89 @@ class IrActionsReport(models.Model):
             }
         except Exception as e:
             raise UserError(_("Failed to print: %s") % str(e))
+
+    def action_print_to_server_batch(self, res_ids, printer_id, copies=1, printer_map=None, pool_id=None):
+        """
+        每条记录单独生成 PDF，通过批量接口一次发送到打印服务器
+        :param res_ids: 要打印的记录 ID 列表
+        :param printer_id: 默认目标打印机 ID (printer.server.printer)
+        :param copies: 份数
+        :param printer_map: 可选，{记录 ID: 打印机 ID}，为单条记录指定不同打印机
+        :param pool_id: 可选，未指定打印机的记录分散到该打印机池中的打印机
+        """
+        self.ensure_one()
+        documents = self._render_server_documents(res_ids, printer_id, copies, True, printer_map, pool_id)
+        results = self.env['printer.server.printer'].action_print_batch(documents)
+        failed = [r for r in results if not r or not r.get('success')]
+        if len(failed) == len(results):
+            raise UserError(_("Failed to print: %s") % (failed[0] or {}).get('message', ''))
+
+        message = _('%s documents sent to printer') % (len(results) - len(failed))
+        if failed:
+            message += _(', %s failed') % len(failed)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Success'),
+                'message': message,
+                'type': 'warning' if failed else 'success',
+                'sticky': bool(failed),
+            }
+        }
+
+    def _render_server_documents(self, res_ids, printer_id, copies=1, split_records=False, printer_map=None, pool_id=None):
+        """
+        生成发送到打印服务器的文档列表，格式与 printer.server.printer.action_print_batch 一致
+        :param split_records: 为 True 时每条记录生成一个文档，否则所有记录合并为一个文档
+        :param printer_map: 可选，{记录 ID: 打印机 ID}，仅在 split_records 时生效
+        :param pool_id: 可选，仅在 split_records 时生效，未指定打印机的文档由 action_print_batch 从打印机池中分配
+        """
+        self.ensure_one()
+        if not split_records:
+            if not printer_id:
+                raise UserError(_("No printer selected."))
+            return [{
+                'printer_id': printer_id,
+                'content': self._render_server_content(res_ids),
+                'filename': f"{self.name}_{len(res_ids)}_records.{self.server_print_format}",
+                'copies': copies,
+            }]
+
+        printer_map = printer_map or {}
+        documents = []
+        for res_id in res_ids:
+            target = printer_map.get(res_id, printer_id)
+            if not target and not pool_id:
+                raise UserError(_("No printer selected."))
+            documents.append({
+                'printer_id': target,
+                'pool_id': pool_id,
+                'content': self._render_server_content([res_id]),
+                'filename': f"{self.name}_{res_id}.{self.server_print_format}",
+                'copies': copies,
+            })
+        return documents
+
+    def _render_server_content(self, res_ids):
+        """
+        生成发送到打印服务器的文档内容
+        PDF 格式调用 PDF 渲染；打印机语言格式将 QWeb 模板渲染为文本，按报表设置的编码转换为字节
+        :param res_ids: 要打印的记录 ID 列表
+        :return: bytes
+        """
+        self.ensure_one()
+        if self.server_print_format == 'pdf':
+            content, _content_type = self._render_qweb_pdf(self.report_name, res_ids)
+            return content
+
+        # _render_qweb_text 返回 UTF-8 字节，其他编码（如小票打印机的 gbk）需要重新编码
+        content, _content_type = self._render_qweb_text(self.report_name, res_ids)
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        encoding = self.server_print_encoding or 'utf-8'
+        if codecs.lookup(encoding).name != 'utf-8':
+            content = content.decode('utf-8').encode(encoding)
+        if self.server_print_format == 'escpos':
+            content = ESCAPED_BYTE.sub(lambda m: bytes([int(m.group(1), 16)]), content)
+        return content
@@ -0,0 +1,300 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError, ValidationError
+from datetime import timedelta
+import json
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# 拉取模式下任务的租约时长（分钟）：领取时开始计算，打印服务每次请求时为进行中的任务续租，
+# 租约到期（打印服务失联）的任务重新排队
+PULL_LEASE_MINUTES = 10
+
+class PrinterServerJob(models.Model):
+    """
+    打印任务模型
+    记录用户的打印请求，由定时任务在后台生成 PDF 并发送到打印服务器，
+    用户操作不必等待报表渲染和网络传输。
+    """
+    _name = 'printer.server.job'
+    _description = 'Printer Server Job'
+    _order = 'id desc'
+
+    name = fields.Char(string='Name', required=True)
+
+    # 报表及要打印的记录
+    report_id = fields.Many2one('ir.actions.report', string='Report', required=True, ondelete='cascade')
+    res_model = fields.Char(string='Model')
+    res_ids = fields.Char(string='Record IDs', required=True, help="JSON list of IDs")
+
+    # 目标打印机及打印参数
+    printer_id = fields.Many2one('printer.server.printer', string='Printer', ondelete='cascade')
+    # 指定打印机池时，每次发送前按路由策略选择打印机（重试时会重新选择，实现故障转移）
+    pool_id = fields.Many2one('printer.server.pool', string='Printer Pool', ondelete='set null')
+    copies = fields.Integer(string='Copies', default=1)
+    split_records = fields.Boolean(string='One Document per Record', default=False)
+
+    # 提交任务的用户，报表以该用户身份渲染
+    user_id = fields.Many2one('res.users', string='User', default=lambda self: self.env.user, readonly=True)
+
+    # 任务状态：queued 等待发送，ready 等待打印服务拉取，sent 已提交到打印服务器，printed 打印完成，failed 失败
+    state = fields.Selection([
+        ('queued', 'Queued'),
+        ('ready', 'Waiting for Server'),
+        ('sent', 'Sent'),
+        ('printed', 'Printed'),
+        ('failed', 'Failed')
+    ], string='State', default='queued', required=True, index=True, readonly=True)
+    message = fields.Text(string='Message', readonly=True)
+
+    # 重试控制：发送失败后按指数退避重新排队
+    attempts = fields.Integer(string='Attempts', readonly=True)
+    max_attempts = fields.Integer(string='Max Attempts', default=3)
+    next_attempt = fields.Datetime(string='Next Attempt', default=fields.Datetime.now, readonly=True)
+    sent_at = fields.Datetime(string='Sent At', readonly=True)
+
+    # 打印服务器返回的任务标识，JSON 列表: [{'server_id': ..., 'job_id': ..., 'conversion_job_id': ...}]
+    remote_jobs = fields.Text(string='Remote Jobs', readonly=True)
+    # 已成功提交的文档序号，JSON 列表；部分文档失败后自动重试时只重新发送其余文档
+    submitted_documents = fields.Char(string='Submitted Documents', readonly=True)
+
+    # 拉取模式下已生成的文档，JSON 列表: [{'attachment_id': ..., 'filename': ..., 'printer': ..., 'copies': ...}]
+    pull_manifest = fields.Text(string='Pull Manifest', readonly=True)
+    # 拉取模式下任务租约的到期时间
+    lease_expires = fields.Datetime(string='Lease Expires', readonly=True)
+
+    @api.constrains('printer_id', 'pool_id')
+    def _check_target(self):
+        for job in self:
+            if not job.printer_id and not job.pool_id:
+                raise ValidationError(_("Select a printer or a printer pool."))
+
+    @api.model
+    def _cron_process_jobs(self, limit=50):
+        """
+        定时任务：发送到期的排队任务，并同步已发送任务的打印结果
+        :param limit: 每次运行最多处理的任务数
+        """
+        jobs = self.search([('state', '=', 'queued'), ('next_attempt', '<=', fields.Datetime.now())],
+                           limit=limit, order='id')
+        for job in jobs:
+            job._dispatch()
+            # 每个任务单独提交，一个任务失败不会回滚已发送的任务
+            self.env.cr.commit()
+
+        recent = fields.Datetime.now() - timedelta(days=1)
+        self.search([('state', '=', 'sent'), ('sent_at', '>=', recent)], limit=limit)._sync_remote_state()
+
+        # 租约到期（打印服务既未回执也未续租）的拉取任务重新排队
+        expired = self.search([('state', '=', 'sent'), ('pull_manifest', '!=', False),
+                               ('lease_expires', '<', fields.Datetime.now())])
+        if expired:
+            expired.write({'state': 'ready', 'lease_expires': False,
+                           'message': _('No acknowledgement from the print server, requeued')})
+
+    def _dispatch(self):
+        """
+        生成 PDF 并通过批量接口发送到打印服务器
+        """
+        self.ensure_one()
+        try:
+            if self.pool_id:
+                self.printer_id = self.pool_id._select_printer()
+            if not self.printer_id:
+                raise UserError(_("No printer selected."))
+            report = self.report_id.with_user(self.user_id)
+            documents = report._render_server_documents(json.loads(self.res_ids), self.printer_id.id,
+                                                         self.copies, self.split_records)
+            # 每个文档带固定的幂等键：请求超时后重试时，打印服务器返回已有任务，不会重复打印
+            for index, doc in enumerate(documents):
+                doc['idempotency_key'] = self._idempotency_key(index)
+            if self.printer_id.server_id.job_delivery == 'pull':
+                # 拉取模式：保存文档，等待打印服务领取
+                self._store_pull_documents(documents)
+                return
+            submitted = set(json.loads(self.submitted_documents or '[]'))
+            pending = [(index, doc) for index, doc in enumerate(documents) if index not in submitted]
+            results = self.env['printer.server.printer'].action_print_batch([doc for _index, doc in pending])
+        except Exception as e:
+            _logger.error(f"Print job {self.id} failed: {e}")
+            self._schedule_retry(str(e))
+            return
+
+        failed = [r for r in results if not r or not r.get('success')]
+        if failed and len(failed) == len(results):
+            self._schedule_retry((failed[0] or {}).get('message') or _('Print failed'))
+            return
+
+        printers = self.env['printer.server.printer'].browse([doc['printer_id'] for doc in documents])
+        untracked = 0
+        remote_jobs = json.loads(self.remote_jobs or '[]')
+        for (index, doc), result in zip(pending, results):
+            if result and result.get('success'):
+                submitted.add(index)
+            if result and (result.get('job_id') or result.get('conversion_job_id')):
+                remote_jobs.append({
+                    'server_id': printers.filtered(lambda p: p.id == doc['printer_id']).server_id.id,
+                    'job_id': result.get('job_id'),
+                    'conversion_job_id': result.get('conversion_job_id'),
+                })
+            elif result and result.get('success'):
+                # 旧版打印服务不返回任务 ID，无法查询打印结果
+                untracked += 1
+
+        values = {
+            'sent_at': fields.Datetime.now(),
+            'remote_jobs': json.dumps(remote_jobs),
+            'submitted_documents': json.dumps(sorted(submitted)),
+        }
+        if failed:
+            # 已提交的文档记录在 submitted_documents 中，重试时只重新发送失败的文档；
+            # 重新发送的文档带相同的幂等键，即使上次实际已提交也不会重复打印
+            self.write(values)
+            self._schedule_retry(_('%s of %s documents failed: %s') % (
+                len(failed), len(documents), (failed[0] or {}).get('message', '')))
+            return
+        values['attempts'] = self.attempts + 1
+        if not remote_jobs:
+            # 所有文档都没有可查询的任务 ID，提交成功即视为完成，不再等待同步
+            values.update(state='printed', message=_('Sent to printer %s (print result not tracked)') %
+                          self.printer_id.name)
+        else:
+            values.update(state='sent', message=_('Sent to printer %s') % self.printer_id.name)
+            if untracked:
+                values['message'] += _(', %s documents not tracked') % untracked
+        self.write(values)
+
+    def _idempotency_key(self, index):
+        """
+        生成文档的幂等键：同一任务的同一文档在每次重试中保持不变
+        :param index: 文档在任务中的序号
+        """
+        self.ensure_one()
+        db_uuid = self.env['ir.config_parameter'].sudo().get_param('database.uuid')
+        return f"odoo-{db_uuid}-job{self.id}-doc{index}"
+
+    def _store_pull_documents(self, documents):
+        """
+        将生成的文档保存为附件，任务进入等待拉取状态
+        """
+        self.ensure_one()
+        printers = self.env['printer.server.printer'].browse([doc['printer_id'] for doc in documents])
+        manifest = []
+        for doc in documents:
+            attachment = self.env['ir.attachment'].create({
+                'name': doc['filename'],
+                'raw': doc['content'],
+                'res_model': self._name,
+                'res_id': self.id,
+            })
+            manifest.append({
+                'attachment_id': attachment.id,
+                'filename': doc['filename'],
+                'printer': printers.filtered(lambda p: p.id == doc['printer_id']).name,
+                'copies': doc['copies'],
+                'idempotency_key': doc.get('idempotency_key'),
+            })
+        self.write({
+            'state': 'ready',
+            'attempts': self.attempts + 1,
+            'pull_manifest': json.dumps(manifest),
+            'message': _('Waiting for the print server to fetch the job'),
+        })
+
+    def _pull_payload(self):
+        """
+        生成下发给打印服务的任务内容
+        """
+        self.ensure_one()
+        documents = []
+        for item in json.loads(self.pull_manifest or '[]'):
+            attachment = self.env['ir.attachment'].browse(item['attachment_id'])
+            documents.append(dict(item, content=attachment.datas.decode('ascii')))
+        return {'id': self.id, 'documents': documents}
+
+    def _finish_pull(self, success, message):
+        """
+        根据打印服务的回执结束拉取任务，并删除已下发的附件
+        """
+        self.ensure_one()
+        self.write({
+            'state': 'printed' if success else 'failed',
+            'message': message or (_('Printed') if success else _('Print failed')),
+        })
+        self.env['ir.attachment'].search([('res_model', '=', self._name), ('res_id', '=', self.id)]).unlink()
+
+    def _schedule_retry(self, message):
+        """
+        记录失败并安排重试，超过最大次数后标记为失败
+        """
+        attempts = self.attempts + 1
+        if attempts >= self.max_attempts:
+            self.write({'state': 'failed', 'attempts': attempts, 'message': message})
+            return
+        self.write({
+            'attempts': attempts,
+            'message': message,
+            'next_attempt': fields.Datetime.now() + timedelta(minutes=2 ** attempts),
+        })
+
+    def _sync_remote_state(self):
+        """
+        向打印服务器查询已发送任务的状态，全部完成时标记为已打印
+        """
+        for job in self:
+            refs = json.loads(job.remote_jobs or '[]')
+            if not refs:
+                continue
+            states = []
+            for ref in refs:
+                server = self.env['printer.server'].browse(ref['server_id'])
+                try:
+                    if not ref.get('job_id'):
+                        # 非 PDF 文档先在服务器端转换，转换完成后才有打印任务
+                        response = server._request('GET', f"/api/conversions/{ref['conversion_job_id']}", read_timeout=5)
+                        conversion = response.json().get('job') or {}
+                        if conversion.get('print_job_id'):
+                            ref['job_id'] = conversion['print_job_id']
+                        else:
+                            states.append('failed' if response.status_code == 404 or conversion.get('state') in (
+                                'failed', 'cancelled', 'timeout') else 'pending')
+                            continue
+                    response = server._request('GET', f"/api/jobs/{ref['job_id']}", read_timeout=5)
+                    if response.status_code == 404:
+                        states.append('failed')
+                    else:
+                        states.append((response.json().get('job') or {}).get('state') or 'pending')
+                except Exception as e:
+                    _logger.warning(f"Failed to query print job {job.id}: {e}")
+                    states.append('pending')
+
+            values = {'remote_jobs': json.dumps(refs)}
+            if any(state in ('failed', 'cancelled') for state in states):
+                values.update(state='failed', message=_('Printing failed on the print server.'))
+            elif all(state == 'done' for state in states):
+                values.update(state='printed', message=_('Printed'))
+            job.write(values)
+
+    def action_retry(self):
+        """
+        重新排队失败的任务
+        """
+        # 手动重试重新发送全部文档，已成功提交的文档由幂等键去重
+        self.filtered(lambda j: j.state == 'failed').write({
+            'state': 'queued',
+            'remote_jobs': False,
+            'submitted_documents': False,
+            'attempts': 0,
+            'message': False,
+            'next_attempt': fields.Datetime.now(),
+        })
+        self._trigger_runner()
+
+    @api.model
+    def _trigger_runner(self):
+        """
+        立即唤醒后台发送任务，不必等待下一个定时周期
+        """
+        cron = self.env.ref('odoo_printer_service.ir_cron_process_print_jobs', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
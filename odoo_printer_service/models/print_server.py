@@ -1,11 +1,23 @@
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
-import requests
 import json
 import logging
+import secrets
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+from . import http_client
+from .print_job import PULL_LEASE_MINUTES
 
 _logger = logging.getLogger(__name__)
 
+# 心跳检测并发数及单次巡检的最长时间（秒），超时未完成检测的服务器保持原状态，下次巡检时重新检测
+HEARTBEAT_WORKERS = 16
+HEARTBEAT_SWEEP_TIMEOUT = 10
+# 心跳延迟记录保留天数
+HEARTBEAT_HISTORY_DAYS = 7
+# 轮询模式下两次心跳检测的最小间隔（分钟），定时任务每分钟运行一次
+POLL_INTERVAL_MINUTES = 5
+
 class PrinterServer(models.Model):
     """
     打印服务器模型
@@ -32,37 +44,218 @@ class PrinterServer(models.Model):
     ], string='Status', default='unknown', readonly=True)
     
     last_heartbeat = fields.Datetime(string='Last Heartbeat', readonly=True)
+    # 最近一次轮询检测的时间
+    last_check = fields.Datetime(string='Last Check', readonly=True)
+
+    # 状态获取方式：poll 由 Odoo 定时访问 /heartbeat；push 由打印服务主动上报，
+    # 适用于打印电脑位于 NAT 后、Odoo 无法直接访问的场景
+    presence_mode = fields.Selection([
+        ('poll', 'Poll'),
+        ('push', 'Push')
+    ], string='Presence Mode', default='poll', required=True)
+    # 打印服务上报时使用的令牌，配置为 PrinterService 的 ODOO_PUSH_TOKEN
+    push_token = fields.Char(string='Push Token', copy=False, groups='base.group_system')
+    # 超过该时间（秒）未收到上报即视为离线
+    push_timeout = fields.Integer(string='Push Timeout (s)', default=90)
+    # 打印服务上报的主机名及其本地队列中等待的任务数
+    service_host = fields.Char(string='Service Host', readonly=True)
+    service_queue_length = fields.Integer(string='Service Queue Length', readonly=True)
+
+    # 任务投递方式：direct 由 Odoo 向服务器 URL 发送；pull 由打印服务使用上报令牌定期领取
+    job_delivery = fields.Selection([
+        ('direct', 'Direct'),
+        ('pull', 'Pull')
+    ], string='Job Delivery', default='direct', required=True)
     
     # 关联的打印机列表
     printer_ids = fields.One2many('printer.server.printer', 'server_id', string='Printers')
+    
+    # 上次同步打印机清单时服务器返回的 ETag，清单未变化时服务器返回 304
+    printers_etag = fields.Char(string='Printers ETag', readonly=True, copy=False)
+
+    # 连接设置：同一 Odoo 进程内到该服务器的请求共享连接池
+    connect_timeout = fields.Float(string='Connect Timeout (s)', default=3.0)
+    read_timeout = fields.Float(string='Read Timeout (s)', default=30.0,
+                                help="上传和打印请求等待响应的最长时间")
+    max_connections = fields.Integer(string='Max Connections', default=4,
+                                     help="每个 Odoo 进程到该服务器的最大并发连接数")
+    max_retries = fields.Integer(string='Max Retries', default=2,
+                                 help="连接失败或查询类请求失败时的重试次数，重试间隔按指数退避")
+
+    # 心跳延迟记录
+    heartbeat_ids = fields.One2many('printer.server.heartbeat', 'server_id', string='Heartbeats')
+
+    def _connection_params(self):
+        """
+        读取连接参数，返回普通 dict，供线程池中的请求使用
+        """
+        self.ensure_one()
+        return {
+            'url': self.url,
+            'connect_timeout': self.connect_timeout or 3.0,
+            'read_timeout': self.read_timeout or 30.0,
+            'max_connections': max(self.max_connections, 1),
+            'max_retries': max(self.max_retries, 0),
+        }
+
+    def _request(self, method, path, read_timeout=None, **kwargs):
+        """
+        通过共享连接池向打印服务器发送请求
+        :param method: HTTP 方法
+        :param path: 接口路径，例如 /api/printers
+        :param read_timeout: 读超时，默认使用服务器配置
+        """
+        return http_client.request(self._connection_params(), method, path, read_timeout, **kwargs)
 
     def action_check_status(self):
         """
         检查服务器状态（心跳检测）
+        所有服务器并发检测，整轮最多等待 HEARTBEAT_SWEEP_TIMEOUT 秒，结果合并写入。
+        未在时限内完成检测的服务器（包括因线程繁忙尚未开始检测的）不修改状态。
         """
-        for server in self:
-            try:
-                url = f"{server.url.rstrip('/')}/heartbeat"
-                try:
-                    response = requests.get(url, timeout=2)
-                    if response.status_code == 200 and response.json().get('status') == 'ok':
-                        server.status = 'online'
-                        server.last_heartbeat = fields.Datetime.now()
-                    else:
-                        server.status = 'offline'
-                except requests.exceptions.RequestException:
-                    server.status = 'offline'
-            except Exception:
-                server.status = 'offline'
+        if not self:
+            return
+        targets = {server.id: server._connection_params() for server in self}
+        results = {}
+        executor = ThreadPoolExecutor(max_workers=min(HEARTBEAT_WORKERS, len(targets)))
+        try:
+            futures = {executor.submit(http_client.check_heartbeat, params): server_id
+                       for server_id, params in targets.items()}
+            done, _not_done = wait(futures, timeout=HEARTBEAT_SWEEP_TIMEOUT)
+            for future in done:
+                results[futures[future]] = future.result()
+        finally:
+            # 不等待超时的请求，它们在后台线程中自行结束
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        now = fields.Datetime.now()
+        checked = self.browse(list(results))
+        if checked:
+            checked.write({'last_check': now})
+        online = self.browse([server_id for server_id, (ok, _ms) in results.items() if ok])
+        if online:
+            online.write({'status': 'online', 'last_heartbeat': now})
+        offline = (checked - online).filtered(lambda s: s.status != 'offline')
+        if offline:
+            offline.write({'status': 'offline'})
+
+        self.env['printer.server.heartbeat'].create([{
+            'server_id': server_id,
+            'check_time': now,
+            'online': ok,
+            'latency_ms': latency_ms,
+        } for server_id, (ok, latency_ms) in results.items()])
 
     @api.model
     def _cron_check_server_status(self):
         """
         定时任务：检查所有启用服务器的状态
         """
+        now = fields.Datetime.now()
         servers = self.search([('active', '=', True)])
-        if servers:
-            servers.action_check_status()
+        push = servers.filtered(lambda s: s.presence_mode == 'push')
+        # 主动上报的服务器不轮询，超时未上报的标记为离线
+        expired = push.filtered(lambda s: s.status != 'offline' and (
+            not s.last_heartbeat or s.last_heartbeat < now - timedelta(seconds=s.push_timeout)))
+        if expired:
+            expired.write({'status': 'offline'})
+
+        poll_limit = now - timedelta(minutes=POLL_INTERVAL_MINUTES)
+        poll = (servers - push).filtered(lambda s: not s.last_check or s.last_check <= poll_limit)
+        if poll:
+            poll.action_check_status()
+            # 轮询模式没有主动上报，顺带刷新打印机清单，避免打印机池按过期的状态和队列长度选择打印机
+            for server in poll.filtered(lambda s: s.status == 'online'):
+                try:
+                    server._refresh_printers()
+                except Exception as e:
+                    _logger.warning(f"刷新打印机清单失败 {server.name}: {e}")
+
+    def action_generate_push_token(self):
+        """
+        生成新的上报令牌，旧令牌立即失效
+        """
+        for server in self:
+            server.sudo().push_token = secrets.token_urlsafe(32)
+
+    def _receive_presence(self, payload):
+        """
+        处理打印服务的主动上报
+        :param payload: {'status': 'ok'|'stopping', 'hostname': ..., 'queue_length': ..., 'etag': ..., 'printers': 可选}
+        :return: 返回给打印服务的结果，etag 为 Odoo 当前持有的打印机清单版本
+        """
+        self.ensure_one()
+        values = {
+            'status': 'offline' if payload.get('status') == 'stopping' else 'online',
+            'service_host': payload.get('hostname') or self.service_host,
+            'service_queue_length': payload.get('queue_length') or 0,
+        }
+        changed = {k: v for k, v in values.items() if self[k] != v}
+        changed['last_heartbeat'] = fields.Datetime.now()
+        self.write(changed)
+
+        # 打印机清单只在变化时上报
+        if payload.get('printers') is not None:
+            self._sync_printers(payload['printers'])
+            self.printers_etag = payload.get('etag') or False
+        return {'success': True, 'etag': self.printers_etag}
+
+    def _claim_pull_jobs(self, limit):
+        """
+        领取该服务器待拉取的打印任务，并发领取时跳过已被锁定的任务
+        :param limit: 最多领取的任务数
+        :return: 任务列表，包含 base64 编码的文档内容
+        """
+        self.ensure_one()
+        self.env.cr.execute("""
+            SELECT j.id FROM printer_server_job j
+            JOIN printer_server_printer p ON p.id = j.printer_id
+            WHERE p.server_id = %s AND j.state = 'ready'
+            ORDER BY j.id
+            LIMIT %s
+            FOR UPDATE OF j SKIP LOCKED
+        """, (self.id, limit))
+        jobs = self.env['printer.server.job'].browse([row[0] for row in self.env.cr.fetchall()])
+        if not jobs:
+            return []
+        now = fields.Datetime.now()
+        jobs.write({
+            'state': 'sent',
+            'sent_at': now,
+            'lease_expires': now + timedelta(minutes=PULL_LEASE_MINUTES),
+            'message': _('Fetched by the print server'),
+        })
+        return [job._pull_payload() for job in jobs]
+
+    def _renew_pull_leases(self, job_ids):
+        """
+        为打印服务仍在处理的任务续租，长时间打印的任务不会因租约到期而重新排队
+        :param job_ids: 打印服务上报的进行中任务 ID 列表
+        """
+        self.ensure_one()
+        jobs = self.env['printer.server.job'].search([
+            ('id', 'in', [int(job_id) for job_id in job_ids]),
+            ('printer_id.server_id', '=', self.id),
+            ('state', '=', 'sent'),
+        ])
+        if jobs:
+            jobs.write({'lease_expires': fields.Datetime.now() + timedelta(minutes=PULL_LEASE_MINUTES)})
+
+    def _ack_pull_jobs(self, acks):
+        """
+        处理打印服务回传的完成回执
+        :param acks: [{'id': 任务 ID, 'success': bool, 'message': ...}]
+        """
+        self.ensure_one()
+        results = {ack['id']: ack for ack in acks}
+        jobs = self.env['printer.server.job'].search([
+            ('id', 'in', list(results)),
+            ('printer_id.server_id', '=', self.id),
+            ('state', '=', 'sent'),
+        ])
+        for job in jobs:
+            ack = results[job.id]
+            job._finish_pull(bool(ack.get('success')), ack.get('message'))
 
     def action_fetch_printers(self):
         """
@@ -74,41 +267,72 @@ class PrinterServer(models.Model):
             api_url = f"{self.url.rstrip('/')}/api/printers"
             _logger.info(f"正在从 {api_url} 获取打印机列表")
             
-            # 发送请求
-            response = requests.get(api_url, timeout=5)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get('success'):
-                # 获取当前已保存的打印机名称
-                current_printers = self.printer_ids.mapped('name')
-                fetched_printers = data.get('printers', [])
-                
-                # 添加新发现的打印机
-                for p_name in fetched_printers:
-                    if p_name not in current_printers:
-                        self.env['printer.server.printer'].create({
-                            'name': p_name,
-                            'server_id': self.id,
-                        })
-                
-                # 返回成功通知
-                return {
-                    'type': 'ir.actions.client',
-                    'tag': 'display_notification',
-                    'params': {
-                        'title': _('Success'),
-                        'message': _('Found %d printers.') % len(fetched_printers),
-                        'type': 'success',
-                        'sticky': False,
-                    }
-                }
+            count = self._refresh_printers()
+            if count is None:
+                message = _('Printer list is up to date.')
             else:
-                raise UserError(_('Server returned error: %s') % data.get('message'))
+                message = _('Found %d printers.') % count
+            # 返回成功通知
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': _('Success'),
+                    'message': message,
+                    'type': 'success',
+                    'sticky': False,
+                }
+            }
         except Exception as e:
             _logger.error(f"Failed to fetch printers: {e}")
             raise UserError(_('Failed to connect to printer server. Check URL and network.\nError: %s') % str(e))
 
+    def _refresh_printers(self):
+        """
+        拉取打印机清单并同步，带上 ETag，清单未变化时服务器返回 304
+        :return: 打印机数量，清单未变化时返回 None
+        """
+        self.ensure_one()
+        headers = {'If-None-Match': self.printers_etag} if self.printers_etag else {}
+        response = self._request('GET', '/api/printers', read_timeout=5, headers=headers)
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        data = response.json()
+        if not data.get('success'):
+            raise UserError(_('Server returned error: %s') % data.get('message'))
+        fetched_printers = data.get('printers', [])
+        self._sync_printers(data.get('details') or [{'name': name} for name in fetched_printers])
+        self.printers_etag = response.headers.get('ETag') or False
+        return len(fetched_printers)
+
+    def _sync_printers(self, details):
+        """
+        根据服务器返回的打印机清单新增打印机并更新状态，清单中已不存在的打印机标记为离线
+        :param details: [{'name': ..., 'status': ..., 'queue_length': ...}]
+        """
+        self.ensure_one()
+        existing = {p.name: p for p in self.printer_ids}
+        valid_status = dict(self.env['printer.server.printer']._fields['status'].selection)
+        for detail in details:
+            values = {
+                'status': detail.get('status') if detail.get('status') in valid_status else 'unknown',
+                'queue_length': detail.get('queue_length') or 0,
+            }
+            printer = existing.get(detail['name'])
+            if printer:
+                # 只写入有变化的字段
+                changed = {k: v for k, v in values.items() if printer[k] != v}
+                if changed:
+                    printer.write(changed)
+            else:
+                self.env['printer.server.printer'].create(dict(values, name=detail['name'], server_id=self.id))
+
+        names = {detail['name'] for detail in details}
+        missing = self.printer_ids.filtered(lambda p: p.name not in names and p.status != 'offline')
+        if missing:
+            missing.write({'status': 'offline', 'queue_length': 0})
+
 class PrinterServerPrinter(models.Model):
     """
     打印机模型
@@ -125,45 +349,44 @@ class PrinterServerPrinter(models.Model):
     
     # 服务器 URL (关联字段，方便读取)
     server_url = fields.Char(related='server_id.url', readonly=True)
+    
+    # 打印机状态及系统打印队列中的任务数，由打印机清单同步（手动获取、轮询定时任务或主动上报）
+    status = fields.Selection([
+        ('online', 'Online'),
+        ('paused', 'Paused'),
+        ('error', 'Error'),
+        ('offline', 'Offline'),
+        ('unknown', 'Unknown')
+    ], string='Status', default='unknown', readonly=True)
+    queue_length = fields.Integer(string='Queue Length', readonly=True)
 
-    def action_print_file(self, file_content, filename, copies=1):
+    # 在打印机池中的顺序，故障转移策略按此顺序选择
+    sequence = fields.Integer(string='Sequence', default=10)
+
+    def action_print_file(self, file_content, filename, copies=1, idempotency_key=None):
         """
         上传并打印文件
         :param file_content: 文件二进制内容
         :param filename: 文件名
         :param copies: 打印份数
+        :param idempotency_key: 可选，幂等键，重复提交时打印服务器返回已有任务
         """
         self.ensure_one()
         server_url = self.server_id.url.rstrip('/')
         
-        # 1. 上传文件
-        files = {'file': (filename, file_content)}
         try:
-            upload_url = f"{server_url}/upload"
-            _logger.info(f"正在上传文件 {filename} 到 {upload_url}")
-            
-            # 设置较长的超时时间，因为上传可能需要时间
-            upload_resp = requests.post(upload_url, files=files, timeout=30)
-            upload_resp.raise_for_status()
-            upload_data = upload_resp.json()
-            
-            if not upload_data.get('success'):
-                raise UserError(_('Upload failed: %s') % upload_data.get('message'))
-                
-            # 获取服务器返回的保存文件名
-            uploaded_filename = upload_data.get('filename')
+            # 一次请求完成上传和打印，PDF 在打印服务器端直接从内存打印
+            print_url = f"{server_url}/api/print"
+            _logger.info(f"正在发送文件 {filename} 到 {print_url}")
             
-            # 2. 发送打印指令
-            print_payload = {
-                'filename': uploaded_filename,
-                'printer': self.name,
-                'copies': copies
-            }
-            
-            print_url = f"{server_url}/print_single"
-            _logger.info(f"正在发送打印请求到 {print_url}: {print_payload}")
-            
-            print_resp = requests.post(print_url, json=print_payload, timeout=10)
+            files = {'file': (filename, file_content)}
+            form = {'printer': self.name, 'copies': copies}
+            if idempotency_key:
+                form['idempotency_key'] = idempotency_key
+            print_resp = self.server_id._request('POST', '/api/print', files=files, data=form)
+            if print_resp.status_code == 404:
+                # 旧版打印服务没有 /api/print，退回到上传 + 打印两次请求
+                return self._print_file_legacy(file_content, filename, copies)
             print_resp.raise_for_status()
             print_data = print_resp.json()
             
@@ -176,6 +399,119 @@ class PrinterServerPrinter(models.Model):
             _logger.error(f"Printing error: {e}")
             raise UserError(_('Printing error: %s') % str(e))
 
+    @api.model
+    def action_print_batch(self, documents):
+        """
+        批量打印：每个打印服务器只发送一次请求，服务器端按打印机并行执行
+        :param documents: 文档列表，每项为 dict:
+            {'printer_id': 打印机 ID, 'content': 文件二进制内容, 'filename': 文件名, 'copies': 份数,
+             'idempotency_key': 可选，重试时使用相同的键，打印服务器不会重复打印}
+            也可以用 'pool_id' 代替 'printer_id'，按打印机池的路由策略选择打印机（选中的打印机写回 printer_id）
+        :return: 与 documents 顺序一致的结果列表，每项包含 success、message 及 job_id/conversion_job_id
+        """
+        results = [None] * len(documents)
+        # 先为指定打印机池的文档分配打印机，同一批次内已分配的文档计入负载
+        assigned = {}
+        for index, doc in enumerate(documents):
+            if doc.get('printer_id') or not doc.get('pool_id'):
+                continue
+            try:
+                printer = self.env['printer.server.pool'].browse(doc['pool_id'])._select_printer(assigned)
+            except UserError as e:
+                results[index] = {'success': False, 'message': str(e)}
+                continue
+            doc['printer_id'] = printer.id
+            assigned[printer.id] = assigned.get(printer.id, 0) + 1
+
+        printers = self.browse([doc['printer_id'] for doc in documents if doc.get('printer_id')]).exists()
+        # 按服务器分组，每组一次 multipart 请求
+        groups = {}
+        for index, doc in enumerate(documents):
+            if results[index]:
+                continue
+            printer = printers.filtered(lambda p: p.id == doc.get('printer_id'))
+            if not printer:
+                results[index] = {'success': False, 'message': _('Selected printer not found.')}
+                continue
+            groups.setdefault(printer.server_id, []).append((index, printer, doc))
+
+        for server, entries in groups.items():
+            server_url = server.url.rstrip('/')
+            files = []
+            manifest = []
+            for index, printer, doc in entries:
+                field = f"file{index}"
+                files.append((field, (doc['filename'], doc['content'])))
+                manifest.append({
+                    'id': index,
+                    'file': field,
+                    'filename': doc['filename'],
+                    'printer': printer.name,
+                    'copies': doc.get('copies', 1),
+                    'idempotency_key': doc.get('idempotency_key'),
+                })
+            try:
+                batch_url = f"{server_url}/api/print_batch"
+                _logger.info(f"正在发送 {len(manifest)} 个文档到 {batch_url}")
+                # 批量请求包含多个文档，读超时放宽
+                resp = server._request('POST', '/api/print_batch', read_timeout=max(server.read_timeout, 120),
+                                       files=files, data={'manifest': json.dumps(manifest)})
+                if resp.status_code == 404:
+                    # 旧版打印服务没有批量接口，逐个提交
+                    for index, printer, doc in entries:
+                        try:
+                            printer.action_print_file(doc['content'], doc['filename'], copies=doc.get('copies', 1),
+                                                      idempotency_key=doc.get('idempotency_key'))
+                            results[index] = {'success': True, 'message': _('Sent')}
+                        except Exception as e:
+                            results[index] = {'success': False, 'message': str(e)}
+                    continue
+                resp.raise_for_status()
+                for result in resp.json().get('results', []):
+                    results[int(result['id'])] = result
+            except Exception as e:
+                _logger.error(f"Batch printing error: {e}")
+                for index, printer, doc in entries:
+                    results[index] = {'success': False, 'message': str(e)}
+
+        return results
+
+    def _print_file_legacy(self, file_content, filename, copies=1):
+        """
+        兼容旧版打印服务：先上传文件，再发送打印指令
+        """
+        # 1. 上传文件
+        files = {'file': (filename, file_content)}
+        _logger.info(f"正在上传文件 {filename} 到 {self.server_url}/upload")
+        
+        upload_resp = self.server_id._request('POST', '/upload', files=files)
+        upload_resp.raise_for_status()
+        upload_data = upload_resp.json()
+        
+        if not upload_data.get('success'):
+            raise UserError(_('Upload failed: %s') % upload_data.get('message'))
+            
+        # 获取服务器返回的保存文件名
+        uploaded_filename = upload_data.get('filename')
+        
+        # 2. 发送打印指令
+        print_payload = {
+            'filename': uploaded_filename,
+            'printer': self.name,
+            'copies': copies
+        }
+        
+        _logger.info(f"正在发送打印请求到 {self.server_url}/print_single: {print_payload}")
+        
+        print_resp = self.server_id._request('POST', '/print_single', read_timeout=10, json=print_payload)
+        print_resp.raise_for_status()
+        print_data = print_resp.json()
+        
+        if not print_data.get('success'):
+            raise UserError(_('Print failed: %s') % print_data.get('message'))
+        
+        return True
+
     def action_test_print(self):
         """
         测试打印功能
@@ -201,3 +537,27 @@ class PrinterServerPrinter(models.Model):
             }
         except Exception as e:
             raise UserError(str(e))
+
+
+class PrinterServerHeartbeat(models.Model):
+    """
+    心跳记录模型
+    保存每次心跳检测的结果和延迟，用于观察服务器的网络质量。
+    """
+    _name = 'printer.server.heartbeat'
+    _description = 'Printer Server Heartbeat'
+    _order = 'check_time desc, id desc'
+
+    server_id = fields.Many2one('printer.server', required=True, ondelete='cascade', index=True)
+    check_time = fields.Datetime(string='Check Time', required=True, default=fields.Datetime.now)
+    online = fields.Boolean(string='Online')
+    # 请求耗时（毫秒），请求失败时为出错前的耗时；巡检时限内未完成检测的服务器不产生记录
+    latency_ms = fields.Float(string='Latency (ms)', digits=(16, 1))
+
+    @api.autovacuum
+    def _gc_heartbeats(self):
+        """
+        清理过期的心跳记录
+        """
+        limit = fields.Datetime.now() - timedelta(days=HEARTBEAT_HISTORY_DAYS)
+        self.search([('check_time', '<', limit)]).unlink()
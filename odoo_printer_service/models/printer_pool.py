@@ -0,0 +1,71 @@
+from odoo import models, fields, api, _
+from odoo.exceptions import UserError
+
+class PrinterServerPool(models.Model):
+    """
+    打印机池模型
+    一组可互相替代的打印机（可分布在不同服务器上），打印时按路由策略自动选择其中一台。
+    """
+    _name = 'printer.server.pool'
+    _description = 'Printer Pool'
+
+    name = fields.Char(string='Name', required=True)
+    active = fields.Boolean(default=True)
+
+    # 池中的打印机
+    printer_ids = fields.Many2many('printer.server.printer', string='Printers')
+
+    # 路由策略：
+    # least_queue 选择排队任务最少的打印机；round_robin 依次轮流；failover 按顺序选择第一台可用的打印机
+    policy = fields.Selection([
+        ('least_queue', 'Least Queue Depth'),
+        ('round_robin', 'Round Robin'),
+        ('failover', 'Failover')
+    ], string='Routing Policy', default='least_queue', required=True)
+
+    # 轮询策略上次选中的打印机
+    last_printer_id = fields.Many2one('printer.server.printer', string='Last Printer', readonly=True)
+
+    def _available_printers(self):
+        """
+        返回当前可用的打印机：服务器在线且打印机未暂停、未出错，按顺序排列
+        """
+        self.ensure_one()
+        printers = self.printer_ids.filtered(
+            lambda p: p.server_id.active and p.server_id.status == 'online' and p.status in ('online', 'unknown'))
+        return printers.sorted(lambda p: (p.sequence, p.id))
+
+    def _printer_load(self, printers):
+        """
+        估算每台打印机的负载：系统打印队列中的任务数加上 Odoo 中已分配但尚未完成的任务数
+        """
+        groups = self.env['printer.server.job'].read_group(
+            [('printer_id', 'in', printers.ids), ('state', 'in', ('ready', 'sent'))],
+            ['printer_id'], ['printer_id'])
+        pending = {g['printer_id'][0]: g['printer_id_count'] for g in groups}
+        return {p.id: p.queue_length + pending.get(p.id, 0) for p in printers}
+
+    def _select_printer(self, assigned=None):
+        """
+        按路由策略选择一台打印机
+        :param assigned: 可选，{打印机 ID: 数量}，同一批次中已分配给各打印机的文档数，计入负载
+        :return: printer.server.printer 记录
+        """
+        self.ensure_one()
+        printers = self._available_printers()
+        if not printers:
+            raise UserError(_('No printer is available in pool %s.') % self.name)
+
+        if self.policy == 'failover':
+            return printers[0]
+
+        if self.policy == 'round_robin':
+            after = printers.filtered(lambda p: (p.sequence, p.id) > (
+                self.last_printer_id.sequence, self.last_printer_id.id)) if self.last_printer_id else printers
+            printer = (after or printers)[0]
+            self.last_printer_id = printer
+            return printer
+
+        assigned = assigned or {}
+        load = self._printer_load(printers)
+        return min(printers, key=lambda p: (load[p.id] + assigned.get(p.id, 0), p.sequence, p.id))
@@ -0,0 +1,65 @@
+from odoo.tests import TransactionCase, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestRawReport(TransactionCase):
+    """
+    打印机语言报表：QWeb 模板渲染为文本，按报表设置的编码和格式生成发送到打印服务器的内容
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.partner = cls.env['res.partner'].create({'name': 'Acme Label'})
+        cls.server = cls.env['printer.server'].create({'name': 'Test Server', 'url': 'http://localhost:5000'})
+        cls.printer = cls.env['printer.server.printer'].create({'name': 'Zebra', 'server_id': cls.server.id})
+
+    def _create_report(self, name, arch, **values):
+        """
+        创建 qweb-text 报表及其模板
+        :param name: 模板名称，注册为 odoo_printer_service.<name>
+        :param arch: 模板内容（t-name 之内的部分）
+        """
+        xmlid = f'odoo_printer_service.{name}'
+        view = self.env['ir.ui.view'].create({
+            'name': name,
+            'type': 'qweb',
+            'key': xmlid,
+            'arch': f'<t t-name="{xmlid}">{arch}</t>',
+        })
+        self.env['ir.model.data'].create({
+            'module': 'odoo_printer_service',
+            'name': name,
+            'model': 'ir.ui.view',
+            'res_id': view.id,
+        })
+        return self.env['ir.actions.report'].create(dict({
+            'name': name,
+            'model': 'res.partner',
+            'report_type': 'qweb-text',
+            'report_name': xmlid,
+        }, **values))
+
+    def test_render_zpl(self):
+        report = self._create_report(
+            'test_zpl_label', '^XA<t t-foreach="docs" t-as="o">^FD<t t-out="o.name"/>^FS</t>^XZ',
+            server_print_format='zpl')
+        content = report._render_server_content(self.partner.ids)
+        self.assertEqual(content.strip(), b'^XA^FDAcme Label^FS^XZ')
+
+    def test_render_escpos_control_bytes_and_encoding(self):
+        self.partner.name = '测试小票'
+        report = self._create_report(
+            'test_escpos_receipt', r'\x1b@<t t-foreach="docs" t-as="o"><t t-out="o.name"/></t>\x0a',
+            server_print_format='escpos', server_print_encoding='gbk')
+        content = report._render_server_content(self.partner.ids)
+        self.assertEqual(content.strip(b' \t\r'), b'\x1b@' + '测试小票'.encode('gbk') + b'\n')
+
+    def test_server_documents_use_raw_extension(self):
+        report = self._create_report(
+            'test_zpl_documents', '^XA<t t-foreach="docs" t-as="o">^FD<t t-out="o.name"/>^FS</t>^XZ',
+            server_print_format='zpl')
+        documents = report._render_server_documents(self.partner.ids, self.printer.id, split_records=True)
+        self.assertEqual(len(documents), 1)
+        self.assertTrue(documents[0]['filename'].endswith('.zpl'))
+        self.assertIn(b'^FDAcme Label^FS', documents[0]['content'])
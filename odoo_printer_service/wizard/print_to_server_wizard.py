@@ -1,4 +1,5 @@
 from odoo import models, fields, api, _
+from odoo.exceptions import UserError
 import json
 
 class PrintToServerWizard(models.TransientModel):
@@ -10,9 +11,13 @@ class PrintToServerWizard(models.TransientModel):
     _description = 'Print to Server Wizard'
 
     # 选择打印机
-    printer_id = fields.Many2one('printer.server.printer', string='Printer', required=True)
+    printer_id = fields.Many2one('printer.server.printer', string='Printer')
+    # 或选择打印机池，由路由策略自动分配打印机
+    pool_id = fields.Many2one('printer.server.pool', string='Printer Pool')
     # 打印份数
     copies = fields.Integer(string='Copies', default=1, required=True)
+    # 每条记录单独打印（例如每张拣货单一份标签），通过批量接口一次发送
+    split_records = fields.Boolean(string='One Document per Record', default=False)
     
     # 记录来源模型名称
     res_model = fields.Char(required=True)
@@ -46,7 +51,33 @@ class PrintToServerWizard(models.TransientModel):
         确认打印按钮点击事件
         """
         self.ensure_one()
-        # 解析 ID 列表
+        if not self.printer_id and not self.pool_id:
+            raise UserError(_("Select a printer or a printer pool."))
         ids = json.loads(self.res_ids)
-        # 调用报表的远程打印方法
-        return self.report_id.action_print_to_server(ids, self.printer_id.id, copies=self.copies)
+        values = {
+            'name': self.report_id.name,
+            'report_id': self.report_id.id,
+            'res_model': self.res_model,
+            'printer_id': self.printer_id.id,
+            'pool_id': not self.printer_id and self.pool_id.id,
+            'copies': self.copies,
+        }
+        # 创建打印任务后立即返回，报表渲染和发送由后台定时任务完成
+        if self.split_records and not self.printer_id and len(ids) > 1:
+            # 打印机池：每条记录一个任务，分散到池中的各台打印机
+            self.env['printer.server.job'].create([dict(values, res_ids=json.dumps([res_id])) for res_id in ids])
+        else:
+            self.env['printer.server.job'].create(dict(values, res_ids=self.res_ids,
+                                                       split_records=self.split_records and len(ids) > 1))
+        self.env['printer.server.job']._trigger_runner()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Success'),
+                'message': _('Print job queued for %s') % (self.printer_id or self.pool_id).name,
+                'type': 'success',
+                'sticky': False,
+                'next': {'type': 'ir.actions.act_window_close'},
+            }
+        }
@@ -7,5 +7,5 @@ timeout /t 5 /nobreak >nul
 
 echo Starting Printer Service (Headless Mode)...
 cd PrinterService
-"..\.venv\Scripts\python.exe" run_headless.py
+"..\.venv\Scripts\python.exe" print_server.py --headless
 pause